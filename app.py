@@ -2,16 +2,17 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 from dotenv import load_dotenv
 
 # Carregar variáveis de ambiente
 load_dotenv()
-from utils.parser import processar_arquivos
-from utils.metricas import calcular_metricas, calcular_qualidade_arquivo
-from utils.export import exportar_xlsx
-from utils.analises import analisar_frete, analisar_motivos, analisar_ads, analisar_skus, simular_reducao
+from utils.cache_streamlit import carregar_dataset, filtrar, calcular
+from utils.qualidade import linhas_qualidade
+from utils.export_tarefas import FORMATOS_EXPORT, obter_export, iniciar_export
+from utils.analises import selecionar_top
+from utils.simulacao import N_SIMULACOES, grade_cenarios
 from utils.formatacao import formatar_brl, formatar_percentual, formatar_pct_direto, formatar_numero, formatar_risco
 from utils.analise_anuncios import processar_analise_completa
 from tab_analise_anuncios import render_tab_analise_anuncios
@@ -226,6 +227,35 @@ st.markdown("""
         border-color: rgba(255, 255, 255, 0.1);
     }
 
+    /* Seletor de abas principal (st.radio) com o mesmo visual das abas */
+    .st-key-aba_ativa [role="radiogroup"] {
+        gap: 12px;
+        flex-wrap: wrap;
+        width: 100%;
+        padding: 10px 0;
+    }
+
+    .st-key-aba_ativa [role="radiogroup"] label {
+        height: 50px;
+        background-color: rgba(255, 255, 255, 0.02);
+        border-radius: 10px;
+        color: #888888;
+        font-weight: 600;
+        padding: 10px 25px;
+        border: 1px solid rgba(255, 255, 255, 0.05);
+        transition: all 0.3s ease;
+        flex: 1;
+        min-width: 150px;
+        justify-content: center;
+    }
+
+    .st-key-aba_ativa [role="radiogroup"] label:has(input:checked) {
+        background-color: rgba(82, 121, 111, 0.3);
+        color: #ffffff;
+        border-color: rgba(82, 121, 111, 0.6);
+        box-shadow: 0 4px 15px rgba(82, 121, 111, 0.2);
+    }
+
     /* Inputs e Selects */
     .stTextInput > div > div > input, .stSelectbox > div > div > div {
         background-color: rgba(255, 255, 255, 0.02) !important;
@@ -246,69 +276,75 @@ def render_metric_card(label, value, subvalue, icon):
         </div>
     """, unsafe_allow_html=True)
 
-# ─────────────────────────────────────────────────────────
-# Função de filtragem global dos dados
-# ─────────────────────────────────────────────────────────
-def aplicar_filtros(data, janela, canal, somente_ads, top10_skus, agrupar_por='SKU'):
-    """
-    Aplica os filtros globais do cabeçalho sobre os dados brutos.
-    Retorna um dicionário com os mesmos campos de 'data', mas filtrados.
-    """
-    vendas = data['vendas'].copy()
-    matriz = data['matriz'].copy() if data['matriz'] is not None else pd.DataFrame()
-    full = data['full'].copy() if data['full'] is not None else pd.DataFrame()
-    max_date = data['max_date']
-
-    # 1) Filtro de JANELA (período)
-    data_limite = max_date - timedelta(days=janela)
-    if 'Data da venda' in vendas.columns:
-        vendas = vendas[vendas['Data da venda'] >= data_limite]
-    if 'Data da venda' in matriz.columns and len(matriz) > 0:
-        matriz = matriz[matriz['Data da venda'] >= data_limite]
-    if 'Data da venda' in full.columns and len(full) > 0:
-        full = full[full['Data da venda'] >= data_limite]
-
-    # 2) Filtro de CANAL
-    if canal == 'Matriz':
-        full = pd.DataFrame()
-    elif canal == 'Full':
-        matriz = pd.DataFrame()
-    # 'Todos' mantém ambos
-
-    # 3) Filtro SOMENTE ADS
-    if somente_ads:
-        if 'Venda por publicidade' in vendas.columns:
-            vendas = vendas[vendas['Venda por publicidade'] == 'Sim']
-
-    # 4) Filtro TOP 10 (filtra vendas apenas dos 10 itens com mais devoluções)
-    if top10_skus:
-        todas_dev = pd.concat([matriz, full], ignore_index=True)
-        col_id = agrupar_por if agrupar_por in vendas.columns else 'SKU'
-        
-        if len(todas_dev) > 0 and 'N.º de venda' in todas_dev.columns and col_id in vendas.columns:
-            # Mapear devoluções para itens via vendas
-            dev_nums = set(todas_dev['N.º de venda'].astype(str).unique())
-            vendas_com_dev = vendas[vendas['N.º de venda'].astype(str).isin(dev_nums)]
-            
-            if col_id in vendas_com_dev.columns:
-                top_items = vendas_com_dev[col_id].value_counts().head(10).index.tolist()
-                vendas = vendas[vendas[col_id].isin(top_items)]
-                # Filtrar devoluções para manter apenas as relacionadas às vendas filtradas
-                vendas_nums = set(vendas['N.º de venda'].astype(str).unique())
-                if len(matriz) > 0 and 'N.º de venda' in matriz.columns:
-                    matriz = matriz[matriz['N.º de venda'].astype(str).isin(vendas_nums)]
-                if len(full) > 0 and 'N.º de venda' in full.columns:
-                    full = full[full['N.º de venda'].astype(str).isin(vendas_nums)]
-
-    return {
-        'vendas': vendas,
-        'matriz': matriz if len(matriz) > 0 else None,
-        'full': full if len(full) > 0 else None,
-        'max_date': max_date,
-        'total_vendas': len(vendas),
-        'total_matriz': len(matriz) if len(matriz) > 0 else 0,
-        'total_full': len(full) if len(full) > 0 else 0,
-    }
+def render_simulador_cenario(grade, max_slider, impacto_total, devolucoes_atuais, aviso_saturacao):
+    """Slider e cards do Simulador: lê a grade pré-calculada, sem recalcular nada"""
+    reducao_pct = st.slider("Reducao desejada (%)", 0, max_slider, min(1, max_slider), key="sim_reducao_pct")
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    cenario = grade.loc[reducao_pct]
+    
+    st.markdown("<br>", unsafe_allow_html=True)
+    
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        render_metric_card("DEVOLUCOES EVITADAS", formatar_numero(int(cenario['evitadas_p50'])),
+                           f"P10–P90: {formatar_numero(int(cenario['evitadas_p10']))} a {formatar_numero(int(cenario['evitadas_p90']))}"
+                           f" · Restantes: {formatar_numero(int(cenario['devolucoes_simuladas']))} de {formatar_numero(devolucoes_atuais)}", "📦")
+    with c2:
+        render_metric_card("PERDA SIMULADA", formatar_brl(cenario['perda_simulada']), f"Antes: {formatar_brl(impacto_total)}", "💰")
+    with c3:
+        render_metric_card("ECONOMIA ESTIMADA (P50)", formatar_brl(cenario['economia_p50']),
+                           f"P10: {formatar_brl(cenario['economia_p10'])} · P90: {formatar_brl(cenario['economia_p90'])}", "📈")
+    
+    if aviso_saturacao and cenario['fator'] >= 1:
+        st.warning("A redução pedida é maior que todas as devoluções do alvo: o alvo inteiro foi zerado.")
+
+
+# Intervalo (s) em que o fragmento de progresso consulta a tarefa de export
+INTERVALO_PROGRESSO_EXPORT = 0.5
+
+
+def render_progresso_export(tarefa):
+    """Progresso do export: reexecutado a cada intervalo; ao terminar, um único rerun mostra o download ou o erro"""
+    if tarefa['estado'] != 'executando':
+        st.rerun()
+    st.progress(tarefa['progresso'], text=f"Gerando relatório: {tarefa['etapa']} ({tarefa['progresso']:.0%})")
+
+
+def render_exportacao(data):
+    """Export em segundo plano: o arquivo gerado fica em cache por dataset, filtros e formato"""
+    formato = st.selectbox("Formato", list(FORMATOS_EXPORT), format_func=lambda f: FORMATOS_EXPORT[f]['rotulo'],
+                           key="export_formato", help="Parquet e CSV: tabelas do relatório + manifesto.json com as métricas, para BI")
+    config = FORMATOS_EXPORT[formato]
+    
+    tarefa = obter_export(data, formato)
+    if tarefa is None or tarefa['estado'] == 'erro':
+        if tarefa is not None:
+            st.error(f"Erro ao exportar: {tarefa['erro']}")
+        if not st.button(f"📥 Exportar Relatório {formato.upper()}", use_container_width=True, type="primary"):
+            return
+        try:
+            # Análises já calculadas pelas abas vêm do cache; o que faltar é calculado na thread do export
+            tarefa = iniciar_export(data, formato, calcular=calcular)
+        except Exception as e:
+            st.error(f"Erro ao exportar: {str(e)}")
+            return
+    
+    if tarefa['estado'] == 'executando':
+        # Consulta periódica em um fragmento próprio: a thread do script fica livre durante o export
+        st.fragment(render_progresso_export, run_every=INTERVALO_PROGRESSO_EXPORT)(tarefa)
+        return
+    
+    st.download_button(
+        label="⬇️ Clique aqui para baixar",
+        data=tarefa['conteudo'],
+        file_name=f"Relatorio_Vendas_Devolucoes_{datetime.now().strftime('%Y%m%d')}"
+                  f"{'' if formato == 'xlsx' else '_' + formato}.{config['extensao']}",
+        mime=config['mime'],
+        use_container_width=True,
+        # Baixar não dispara um novo rerun
+        on_click="ignore"
+    )
 
 # ─────────────────────────────────────────────────────────
 # Inicializar session state
@@ -324,8 +360,11 @@ with st.sidebar:
     st.markdown("---")
     
     st.subheader("📁 Upload de Dados")
-    file_vendas = st.file_uploader("Relatório de Vendas", type=['xlsx'], key='vendas', help="Arraste o arquivo .xlsx de vendas do ML")
-    file_devolucoes = st.file_uploader("Relatório de Devoluções", type=['xlsx'], key='devolucoes', help="Arraste o arquivo .xlsx de devoluções do ML")
+    # Vários arquivos por tipo (ex.: um por mês): vendas repetidas ficam com o arquivo mais recente
+    file_vendas = st.file_uploader("Relatórios de Vendas", type=['xlsx'], key='vendas', accept_multiple_files=True,
+                                   help="Arraste um ou mais arquivos .xlsx de vendas do ML (ex.: um por mês)")
+    file_devolucoes = st.file_uploader("Relatórios de Devoluções", type=['xlsx'], key='devolucoes', accept_multiple_files=True,
+                                       help="Arraste um ou mais arquivos .xlsx de devoluções do ML (ex.: um por mês)")
     
     col_btn1, col_btn2 = st.columns(2)
     with col_btn1:
@@ -337,7 +376,7 @@ with st.sidebar:
         if file_vendas and file_devolucoes:
             with st.spinner("Processando..."):
                 try:
-                    data = processar_arquivos(file_vendas, file_devolucoes)
+                    data = carregar_dataset(file_vendas, file_devolucoes)
                     st.session_state.processed_data = data
                     st.rerun()
                 except Exception as e:
@@ -353,7 +392,7 @@ with st.sidebar:
                 if os.path.exists(f"{example_dir}/vendas_exemplo.xlsx") and os.path.exists(f"{example_dir}/devolucoes_exemplo.xlsx"):
                     with open(f"{example_dir}/vendas_exemplo.xlsx", 'rb') as f1:
                         with open(f"{example_dir}/devolucoes_exemplo.xlsx", 'rb') as f2:
-                            data = processar_arquivos(f1, f2)
+                            data = carregar_dataset(f1, f2)
                             st.session_state.processed_data = data
                             st.rerun()
                 else:
@@ -372,6 +411,17 @@ with st.sidebar:
             help="Altera como os produtos são agrupados nas tabelas e gráficos"
         )
         
+        ingestao = st.session_state.processed_data.get('ingestao')
+        if ingestao and (ingestao['arquivos_vendas'] > 1 or ingestao['arquivos_devolucoes'] > 1):
+            descartadas = sum(ingestao['linhas_descartadas'].values())
+            st.caption(f"📂 {ingestao['arquivos_vendas']} arquivo(s) de vendas e {ingestao['arquivos_devolucoes']} de devoluções · "
+                       f"{formatar_numero(descartadas)} linha(s) repetida(s) substituída(s) pela versão mais recente")
+        
+        esquema = st.session_state.processed_data.get('esquema')
+        if esquema:
+            st.caption(f"💾 Dados em memória: {formatar_numero(esquema['depois'] / 1024 ** 2, 1)} MB "
+                       f"(sem compactação: {formatar_numero(esquema['antes'] / 1024 ** 2, 1)} MB)")
+        
         st.markdown("---")
         if st.button("🗑️ Limpar Dados", use_container_width=True):
             st.session_state.processed_data = None
@@ -391,8 +441,8 @@ if st.session_state.processed_data is None:
     Para começar a análise, utilize a **barra lateral à esquerda** para carregar seus relatórios do Mercado Livre.
     
     **Arquivos necessários:**
-    1.  **Relatório de Vendas** (.xlsx)
-    2.  **Relatório de Devoluções** (.xlsx)
+    1.  **Relatório de Vendas** (.xlsx) — um ou mais arquivos (ex.: um por mês)
+    2.  **Relatório de Devoluções** (.xlsx) — um ou mais arquivos
     
     *Dica: Você também pode clicar em 'Exemplo' na barra lateral para visualizar como o dashboard funciona.*
     """)
@@ -440,7 +490,7 @@ else:
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Aplicar filtros globais
-    data = aplicar_filtros(data_raw, janela_global, canal_global, somente_ads_global, top10_skus_global, agrupar_por=agrupar_por)
+    data = filtrar(data_raw, janela_global, canal_global, somente_ads_global, top10_skus_global, agrupar_por=agrupar_por)
     
     # Garantir DataFrames válidos para funções
     df_matriz = data['matriz'] if data['matriz'] is not None else pd.DataFrame()
@@ -451,18 +501,25 @@ else:
     # ─────────────────────────────────────────────────────
     # ABAS
     # ─────────────────────────────────────────────────────
-    tab_guia, tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs([
-        "📖 Guia de Uso", "Resumo", "Janelas", "Matriz/Full", "Frete", 
-        "Motivos", "Ads", "Anúncios", "Simulador", "IA Análise"
-    ])
+    # Seletor em vez de st.tabs: apenas a aba ativa é calculada a cada rerun
+    # (os resultados ficam em cache após a primeira visita)
+    aba_ativa = st.radio(
+        "Aba",
+        ["📖 Guia de Uso", "Resumo", "Janelas", "Matriz/Full", "Frete",
+         "Motivos", "Ads", "Anúncios", "Simulador", "IA Análise"],
+        index=1,
+        horizontal=True,
+        key="aba_ativa",
+        label_visibility="collapsed"
+    )
     
     # ─── TAB GUIA: GUIA DE USO ───
-    with tab_guia:
+    if aba_ativa == "📖 Guia de Uso":
         render_tab_guia_uso()
     
     # ─── TAB 1: RESUMO ───
-    with tab1:
-        metricas = calcular_metricas(data['vendas'], data['matriz'], data['full'], data['max_date'], janela_global)
+    if aba_ativa == "Resumo":
+        metricas = calcular(data, 'metricas')
         
         c1, c2, c3, c4, c5, c6 = st.columns(6)
         with c1:
@@ -503,7 +560,7 @@ else:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
             st.markdown(f'<div class="chart-title">Top 5 {visualizacao}s por Devoluções</div>', unsafe_allow_html=True)
             
-            df_skus_top, _ = analisar_skus(data['vendas'], data['matriz'], data['full'], data['max_date'], janela_global, 5, agrupar_por=agrupar_por)
+            df_skus_top, _ = calcular(data, 'skus', top_n=5, agrupar_por=agrupar_por)
             
             if not df_skus_top.empty:
                 # Garantir que a coluna de agrupamento existe no DataFrame retornado
@@ -527,49 +584,74 @@ else:
                 st.info(f"Sem dados de {visualizacao}s para exibir")
             st.markdown('</div>', unsafe_allow_html=True)
 
+        # Perfil de qualidade calculado na leitura dos arquivos (não depende dos filtros)
+        if data.get('qualidade'):
+            df_qualidade = pd.DataFrame(linhas_qualidade(data['qualidade']), columns=['Indicador', 'Ocorrências', 'Percentual'])
+            alertas = int((df_qualidade['Ocorrências'] > 0).sum())
+            titulo = f"🩺 Qualidade dos dados: {alertas} indicador(es) com ocorrências" if alertas else "🩺 Qualidade dos dados: nenhum problema encontrado"
+            with st.expander(titulo, expanded=False):
+                df_qualidade['Ocorrências'] = df_qualidade['Ocorrências'].apply(formatar_numero)
+                df_qualidade['Percentual'] = df_qualidade['Percentual'].apply(formatar_percentual)
+                st.dataframe(df_qualidade, use_container_width=True, hide_index=True)
+
     # ─── TAB 2: JANELAS ───
-    with tab2:
+    if aba_ativa == "Janelas":
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
         st.markdown('<div class="chart-title">Evolução por Janela de Tempo</div>', unsafe_allow_html=True)
         
         janelas_list = [30, 60, 90, 120, 150, 180]
         # Filtrar janelas até a janela global selecionada
         janelas_list = [j for j in janelas_list if j <= janela_global]
-        janelas_data_raw = []
-        
-        for janela in janelas_list:
-            # Usar data_raw para recalcular por janela, mas aplicar canal/ads/top10
-            d_temp = aplicar_filtros(data_raw, janela, canal_global, somente_ads_global, top10_skus_global, agrupar_por=agrupar_por)
-            m = calcular_metricas(d_temp['vendas'], d_temp['matriz'], d_temp['full'], d_temp['max_date'], janela)
-            janelas_data_raw.append({
-                'Período': f'{janela}d',
-                'Período_num': janela,
-                'Vendas': m['vendas'],
-                'Devoluções': m['devolucoes_vendas'],
-                'Taxa': m['taxa_devolucao'] * 100,
-                'Faturamento': m['faturamento_total'],
-                'Faturamento_Dev': m['faturamento_devolucoes'],
-                'Perda_Total': m['perda_total'],
-                'Perda_Parcial': m['perda_parcial'],
-                'Saudaveis': m['saudaveis'],
-                'Criticas': m['criticas'],
+        
+        curva_diaria = st.toggle("Resolução diária", value=False, key="janelas_diario",
+                                 disabled=top10_skus_global,
+                                 help="Mostra a curva dia a dia em vez dos pontos fixos de 30 em 30 dias")
+        
+        def montar_df_janelas(df_m):
+            return pd.DataFrame({
+                'Período': [f'{j}d' for j in df_m['janela']],
+                'Período_num': df_m['janela'],
+                'Vendas': df_m['vendas'],
+                'Devoluções': df_m['devolucoes_vendas'],
+                'Taxa': df_m['taxa_devolucao'] * 100,
+                'Faturamento': df_m['faturamento_total'],
+                'Faturamento_Dev': df_m['faturamento_devolucoes'],
+                'Perda_Total': df_m['perda_total'],
+                'Perda_Parcial': df_m['perda_parcial'],
+                'Saudaveis': df_m['saudaveis'],
+                'Criticas': df_m['criticas'],
             })
         
-        df_janelas_raw = pd.DataFrame(janelas_data_raw)
+        if top10_skus_global:
+            # O Top 10 depende da janela (itens com mais devoluções no período): recalcular cada uma
+            metricas_janelas = []
+            for janela in janelas_list:
+                d_temp = filtrar(data_raw, janela, canal_global, somente_ads_global, top10_skus_global, agrupar_por=agrupar_por)
+                m = calcular(d_temp, 'metricas')
+                metricas_janelas.append({'janela': janela, **m})
+            df_janelas_raw = montar_df_janelas(pd.DataFrame(metricas_janelas))
+        else:
+            # Os dados filtrados pela janela global contêm todas as janelas menores: uma única passada
+            df_janelas_raw = montar_df_janelas(calcular(data, 'metricas_janelas', janelas=tuple(janelas_list)))
+        
+        if curva_diaria and not top10_skus_global:
+            df_grafico = montar_df_janelas(calcular(data, 'metricas_janelas', janelas=tuple(range(1, janela_global + 1))))
+        else:
+            df_grafico = df_janelas_raw
         
         fig = go.Figure()
         fig.add_trace(go.Scatter(
-            x=df_janelas_raw['Período'], y=df_janelas_raw['Vendas'],
+            x=df_grafico['Período'], y=df_grafico['Vendas'],
             mode='lines+markers', name='Vendas',
             line=dict(color='#3b82f6', width=2), marker=dict(size=6), yaxis='y1'
         ))
         fig.add_trace(go.Scatter(
-            x=df_janelas_raw['Período'], y=df_janelas_raw['Devoluções'],
+            x=df_grafico['Período'], y=df_grafico['Devoluções'],
             mode='lines+markers', name='Devoluções',
             line=dict(color='#f59e0b', width=2), marker=dict(size=6), yaxis='y1'
         ))
         fig.add_trace(go.Scatter(
-            x=df_janelas_raw['Período'], y=df_janelas_raw['Taxa'],
+            x=df_grafico['Período'], y=df_grafico['Taxa'],
             mode='lines+markers', name='Taxa (%)',
             line=dict(color='#ef4444', width=2), marker=dict(size=6), yaxis='y2'
         ))
@@ -611,9 +693,9 @@ else:
         st.markdown('</div>', unsafe_allow_html=True)
 
     # ─── TAB 3: MATRIZ/FULL ───
-    with tab3:
-        metricas_matriz = calcular_metricas(data['vendas'], data['matriz'], None, data['max_date'], janela_global)
-        metricas_full = calcular_metricas(data['vendas'], None, data['full'], data['max_date'], janela_global)
+    if aba_ativa == "Matriz/Full":
+        metricas_matriz = calcular(data, 'metricas', canal='Matriz')
+        metricas_full = calcular(data, 'metricas', canal='Full')
         
         col_matriz, col_full = st.columns(2)
         
@@ -645,7 +727,7 @@ else:
                 """, unsafe_allow_html=True)
             with c2:
                 # Calcular Top 10 concentração para Matriz
-                df_skus_m, total_dev_m = analisar_skus(data['vendas'], data['matriz'], None, data['max_date'], janela_global, agrupar_por=agrupar_por)
+                df_skus_m, total_dev_m = calcular(data, 'skus', canal='Matriz', agrupar_por=agrupar_por)
                 top10_m = (df_skus_m.sort_values('Dev.', ascending=False).head(10)['Dev.'].sum() / total_dev_m * 100) if total_dev_m > 0 and len(df_skus_m) > 0 else 0
                 st.markdown(f"""
                     <div style="padding: 15px; background-color: #334155; border-radius: 8px; text-align: center;">
@@ -682,7 +764,7 @@ else:
                     </div>
                 """, unsafe_allow_html=True)
             with c2:
-                df_skus_f, total_dev_f = analisar_skus(data['vendas'], None, data['full'], data['max_date'], janela_global, agrupar_por=agrupar_por)
+                df_skus_f, total_dev_f = calcular(data, 'skus', canal='Full', agrupar_por=agrupar_por)
                 top10_f = (df_skus_f.sort_values('Dev.', ascending=False).head(10)['Dev.'].sum() / total_dev_f * 100) if total_dev_f > 0 and len(df_skus_f) > 0 else 0
                 st.markdown(f"""
                     <div style="padding: 15px; background-color: #334155; border-radius: 8px; text-align: center;">
@@ -720,9 +802,16 @@ else:
         st.markdown('</div>', unsafe_allow_html=True)
 
     # ─── TAB 4: FRETE ───
-    with tab4:
+    if aba_ativa == "Frete":
         st.subheader("🚚 Análise de Frete e Forma de Entrega")
-        df_frete = analisar_frete(data['vendas'], data['matriz'], data['full'], data['max_date'], janela_global)
+        dimensoes_extra = st.multiselect(
+            "Agrupar também por",
+            ["Estado", "Transportadora", "Faixa de Custo de Envio"],
+            default=[],
+            key="frete_dimensoes",
+            help="Quebra a análise por estado de destino, transportadora ou faixa de custo de envio"
+        )
+        df_frete = calcular(data, 'frete', dimensoes=('Forma de Entrega', *dimensoes_extra))
         if len(df_frete) > 0:
             df_frete_display = df_frete.copy()
             df_frete_display['Vendas'] = df_frete_display['Vendas'].apply(lambda x: formatar_numero(x))
@@ -733,11 +822,11 @@ else:
             st.info("Sem dados disponíveis")
 
     # ─── TAB 5: MOTIVOS ───
-    with tab5:
+    if aba_ativa == "Motivos":
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
         st.markdown('<div class="chart-title">Distribuição de Motivos</div>', unsafe_allow_html=True)
         
-        df_motivos = analisar_motivos(data['vendas'], data['matriz'], data['full'], data['max_date'], janela_global)
+        df_motivos = calcular(data, 'motivos')
         
         if len(df_motivos) > 0:
             df_motivos_sorted = df_motivos.sort_values('Quantidade', ascending=True)
@@ -777,8 +866,8 @@ else:
         st.markdown('</div>', unsafe_allow_html=True)
 
     # ─── TAB 6: ADS ───
-    with tab6:
-        df_ads = analisar_ads(data['vendas'], data['matriz'], data['full'], data['max_date'], janela_global)
+    if aba_ativa == "Ads":
+        df_ads = calcular(data, 'ads')
         
         ads_vendas = ads_dev = 0
         ads_taxa = ads_impacto = ads_fat = 0.0
@@ -855,14 +944,14 @@ else:
         st.markdown('</div>', unsafe_allow_html=True)
 
     # ─── TAB 7: ANÚNCIOS ───
-    with tab7:
-        df_skus_all, total_dev_skus = analisar_skus(data['vendas'], data['matriz'], data['full'], data['max_date'], janela_global, agrupar_por=agrupar_por)
+    if aba_ativa == "Anúncios":
+        # Ranks pré-calculados: cada sub-aba seleciona sua ordem sem reordenar o DataFrame
+        df_skus_all, total_dev_skus = calcular(data, 'skus', agrupar_por=agrupar_por, ranks=True)
         
         total_skus_com_dev = len(df_skus_all)
         if total_dev_skus > 0 and len(df_skus_all) > 0:
-            df_sorted_vol = df_skus_all.sort_values('Dev.', ascending=False)
-            top10_conc = (df_sorted_vol.head(10)['Dev.'].sum() / total_dev_skus * 100)
-            top20_conc = (df_sorted_vol.head(20)['Dev.'].sum() / total_dev_skus * 100)
+            top10_conc = (selecionar_top(df_skus_all, 'volume', 10)['Dev.'].sum() / total_dev_skus * 100)
+            top20_conc = (selecionar_top(df_skus_all, 'volume', 20)['Dev.'].sum() / total_dev_skus * 100)
         else:
             top10_conc = top20_conc = 0
         
@@ -910,19 +999,19 @@ else:
                 return df_display[[col_id, 'Vendas', 'Dev.', 'Taxa', 'Impacto', 'Reemb.', 'Custo Dev.', 'Risco', 'Classe']]
             
             with sub_tab1:
-                df_vol = df_skus_all.sort_values('Dev.', ascending=False).head(20)
+                df_vol = selecionar_top(df_skus_all, 'volume', 20)
                 st.dataframe(formatar_df_skus(df_vol), use_container_width=True, hide_index=True)
             with sub_tab2:
-                df_taxa = df_skus_all[(df_skus_all['Taxa'] >= 20) & (df_skus_all['Vendas'] >= 5)].sort_values('Taxa', ascending=False)
+                df_taxa = selecionar_top(df_skus_all, 'taxa', mascara=(df_skus_all['Taxa'] >= 20) & (df_skus_all['Vendas'] >= 5))
                 if len(df_taxa) > 0:
                     st.dataframe(formatar_df_skus(df_taxa), use_container_width=True, hide_index=True)
                 else:
                     st.info(f"Nenhum {visualizacao} com taxa ≥ 20% e pelo menos 5 vendas")
             with sub_tab3:
-                df_perda = df_skus_all.sort_values('Impacto', ascending=True).head(20)
+                df_perda = selecionar_top(df_skus_all, 'perda', 20)
                 st.dataframe(formatar_df_skus(df_perda), use_container_width=True, hide_index=True)
             with sub_tab4:
-                df_risco = df_skus_all.sort_values('Risco', ascending=False).head(20)
+                df_risco = selecionar_top(df_skus_all, 'risco', 20)
                 st.dataframe(formatar_df_skus(df_risco), use_container_width=True, hide_index=True)
             with sub_tab5:
                 st.dataframe(formatar_df_skus(df_skus_all), use_container_width=True, hide_index=True)
@@ -930,53 +1019,50 @@ else:
             st.info("Sem dados disponíveis")
 
     # ─── TAB 8: SIMULADOR ───
-    with tab8:
-        metricas_sim = calcular_metricas(data['vendas'], data['matriz'], data['full'], data['max_date'], janela_global)
+    if aba_ativa == "Simulador":
+        metricas_sim = calcular(data, 'metricas')
         taxa_atual = metricas_sim['taxa_devolucao'] * 100
-        total_dev = metricas_sim['devolucoes_vendas']
         impacto_total = abs(metricas_sim['impacto_devolucao'])
-        perda_media = (impacto_total / total_dev) if total_dev > 0 else 0
         
         st.markdown('<div class="simulator-box">', unsafe_allow_html=True)
         st.markdown('<h4 style="margin-top: 0; margin-bottom: 15px;">Simulador de Reducao de Devolucoes</h4>', unsafe_allow_html=True)
         
         max_slider = int(taxa_atual) if taxa_atual > 0 else 10
-        reducao_pct = st.slider("Reducao desejada (%)", 0, max_slider, min(1, max_slider), key="sim_reducao_pct")
-        st.markdown('</div>', unsafe_allow_html=True)
         
-        nova_taxa = max(taxa_atual - reducao_pct, 0)
-        vendas_totais = metricas_sim['vendas']
-        dev_evitadas = int((reducao_pct / 100) * vendas_totais) if vendas_totais > 0 else 0
-        dinheiro_recuperado = dev_evitadas * perda_media
+        opcoes_alvo = {
+            f"Todos os {visualizacao}s": 'todos',
+            f"Top 10 {visualizacao}s por perda": 'top_itens',
+            "Um motivo de devolução": 'motivo',
+        }
+        alvo_label = st.selectbox("Aplicar a redução em", list(opcoes_alvo.keys()), key="sim_alvo")
+        alvo_sim = opcoes_alvo[alvo_label]
+        motivo_sim = None
+        if alvo_sim == 'motivo':
+            df_motivos_sim = calcular(data, 'motivos')
+            if len(df_motivos_sim) > 0:
+                motivo_sim = st.selectbox("Motivo", df_motivos_sim['Motivo'].tolist(), key="sim_motivo")
         
-        st.markdown("<br>", unsafe_allow_html=True)
+        # Grade de cenários (0 a max_slider) calculada uma vez por estado dos filtros, em um único lote
+        df_sim = calcular(data, 'simulacao', reducoes=tuple(range(0, max_slider + 1)), alvo=alvo_sim,
+                          agrupar_por=agrupar_por, motivo=motivo_sim)
         
-        c1, c2, c3 = st.columns(3)
-        with c1:
-            render_metric_card("DEVOLUCOES SIMULADAS", formatar_numero(dev_evitadas), f"Antes: {formatar_numero(int(total_dev))}", "📦")
-        with c2:
-            render_metric_card("PERDA SIMULADA", formatar_brl(dinheiro_recuperado), f"Antes: {formatar_brl(impacto_total)}", "💰")
-        with c3:
-            render_metric_card("ECONOMIA ESTIMADA", formatar_brl(dinheiro_recuperado), "Reducao de perda", "📈")
+        grade_sim = grade_cenarios(df_sim, metricas_sim['devolucoes_vendas'], impacto_total)
+        
+        # Fragmento: mover o slider só reexecuta o slider e os cards, lendo a grade acima
+        st.fragment(render_simulador_cenario)(grade_sim, max_slider, impacto_total,
+                                              metricas_sim['devolucoes_vendas'], alvo_sim != 'todos')
+        st.caption(f"Distribuição de {N_SIMULACOES} simulações binomiais por {visualizacao if alvo_sim != 'motivo' else 'motivo'}: "
+                   "cada devolução dos alvos é evitada com a mesma probabilidade, proporcional à redução.")
     
     # ─── TAB 9: IA ANÁLISE DE ANÚNCIOS ───
-    with tab9:
-        render_tab_analise_anuncios()
+    if aba_ativa == "IA Análise":
+        # Fragmento: interações nesta aba não recalculam o restante do dashboard
+        st.fragment(render_tab_analise_anuncios)()
     
     # ─── EXPORT ───
     st.markdown("---")
-    if st.button("📥 Exportar Relatório XLSX", use_container_width=True, type="primary"):
-        try:
-            xlsx_file = exportar_xlsx(data)
-            st.download_button(
-                label="⬇️ Clique aqui para baixar",
-                data=xlsx_file,
-                file_name=f"Relatorio_Vendas_Devolucoes_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
-            )
-        except Exception as e:
-            st.error(f"Erro ao exportar: {str(e)}")
+    # Fragmento: o clique no export não recalcula o restante do dashboard
+    st.fragment(render_exportacao)(data)
 
 # ─── RODAPÉ ───
 st.markdown("""
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+EXEMPLO_VENDAS = os.path.join(RAIZ, 'public', 'examples', 'vendas_exemplo.xlsx')
+EXEMPLO_DEVOLUCOES = os.path.join(RAIZ, 'public', 'examples', 'devolucoes_exemplo.xlsx')
+
+
+@pytest.fixture(scope='session')
+def arquivos_exemplo():
+    """Caminhos (vendas, devoluções) dos arquivos de exemplo"""
+    return EXEMPLO_VENDAS, EXEMPLO_DEVOLUCOES
+
+
+@pytest.fixture(scope='session')
+def dados_exemplo():
+    """Arquivos de exemplo processados uma única vez para toda a sessão de testes"""
+    from utils.parser import processar_arquivos
+    return processar_arquivos(EXEMPLO_VENDAS, EXEMPLO_DEVOLUCOES, max_processos=1)
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analises import DIMENSOES_FRETE, _coluna_dimensao_frete, analisar_ads, analisar_frete, analisar_skus
+from utils.filtros import aplicar_filtros
+from utils.juncao import montar_juncoes
+
+
+# Implementações anteriores a agregar_por (um groupby ou laço por visão), usadas como referência
+
+def _devolucoes_por_grupo(juncao, grupos):
+    devolvidas = juncao.assign(grupo=grupos)
+    devolvidas = devolvidas[devolvidas['devolucoes'] > 0].drop_duplicates(['grupo', 'chave'])
+    return devolvidas.groupby('grupo', sort=False).agg(
+        devolucoes=('chave', 'size'),
+        reembolso=('reembolso', 'sum'),
+        custo_dev=('custo_dev', 'sum'),
+    )
+
+
+def _ads_anterior(vendas, juncao):
+    if 'Venda por publicidade' not in vendas.columns:
+        return pd.DataFrame()
+    tipos = vendas['Venda por publicidade'].eq('Sim').map({True: 'Com Publicidade', False: 'Orgânico'})
+    total_vendas = tipos.groupby(tipos, sort=False).size()
+    receita = juncao['receita_prod'].groupby(tipos, sort=False).sum()
+    dev = _devolucoes_por_grupo(juncao, tipos)
+
+    linhas = []
+    for tipo in ('Com Publicidade', 'Orgânico'):
+        vendas_tipo = int(total_vendas.get(tipo, 0))
+        if vendas_tipo == 0:
+            continue
+        dev_count = int(dev.at[tipo, 'devolucoes']) if tipo in dev.index else 0
+        impacto_total = float(dev.at[tipo, 'reembolso']) if tipo in dev.index else 0.0
+        linhas.append({
+            'Tipo': tipo,
+            'Vendas': vendas_tipo,
+            'Devoluções': dev_count,
+            'Taxa (%)': round(dev_count / vendas_tipo * 100, 1),
+            'Receita (R$)': round(float(receita[tipo]), 2),
+            'Impacto (R$)': round(-impacto_total, 2),
+        })
+    return pd.DataFrame(linhas) if linhas else pd.DataFrame()
+
+
+def _frete_anterior(vendas, juncao, dimensoes):
+    dimensoes = [d for d in dimensoes if DIMENSOES_FRETE[d] in vendas.columns]
+    if not dimensoes or len(vendas) == 0:
+        return pd.DataFrame()
+    tabela = pd.DataFrame({d: _coluna_dimensao_frete(vendas, d) for d in dimensoes}, index=vendas.index)
+    devolvida = (juncao['devolucoes'] > 0) & ~tabela.assign(chave=juncao['chave']).duplicated()
+    tabela['devolvida'] = devolvida.astype('int64')
+    tabela['reembolso'] = juncao['reembolso'].where(devolvida, 0.0)
+    grupos = tabela.groupby(dimensoes, sort=False, observed=True, dropna=False).agg(
+        vendas=('devolvida', 'size'),
+        devolucoes=('devolvida', 'sum'),
+        reembolso=('reembolso', 'sum'),
+    ).reset_index()
+    return pd.DataFrame({
+        **{d: grupos[d].astype(str) for d in dimensoes},
+        'Vendas': grupos['vendas'].astype('int64'),
+        'Devoluções': grupos['devolucoes'].astype('int64'),
+        'Taxa (%)': (grupos['devolucoes'] / grupos['vendas'] * 100).round(1),
+        'Impacto (R$)': (-grupos['reembolso']).round(2),
+    })
+
+
+def _skus_anterior(vendas, juncao, col_agrup):
+    itens = vendas[col_agrup].astype(str).where(vendas[col_agrup].notna(), 'N/A')
+    total_vendas = itens.groupby(itens, sort=False).size()
+    dev = _devolucoes_por_grupo(juncao, itens)
+    total_devolucoes = int(dev['devolucoes'].sum())
+
+    linhas = []
+    for item_id in total_vendas.index:
+        if item_id not in dev.index:
+            continue
+        vendas_item = int(total_vendas[item_id])
+        devolucoes = int(dev.at[item_id, 'devolucoes'])
+        impacto = float(dev.at[item_id, 'reembolso'])
+        custo_dev = float(dev.at[item_id, 'custo_dev'])
+        taxa = devolucoes / vendas_item * 100
+        score_risco = taxa * impacto / 100 if impacto > 0 else 0
+        classe = 'Crítica' if taxa >= 15 else 'Atenção' if taxa >= 8 else 'Neutra'
+        linhas.append({
+            col_agrup: item_id,
+            'Vendas': vendas_item,
+            'Dev.': devolucoes,
+            'Taxa': round(taxa, 1),
+            'Impacto': round(-impacto, 2),
+            'Reemb.': round(-abs(impacto), 2),
+            'Custo Dev.': round(-abs(custo_dev), 2),
+            'Risco': round(score_risco, 3),
+            'Classe': classe,
+        })
+    df = pd.DataFrame(linhas)
+    if len(df) > 0:
+        # Empates na ordem de aparição, como analisar_skus desde a ordenação estável
+        df = df.sort_values('Dev.', ascending=False, kind='stable')
+    return df, total_devolucoes
+
+
+def _comparar(atual, esperado):
+    assert list(atual.columns) == list(esperado.columns)
+    assert len(atual) == len(esperado)
+    for coluna in esperado.columns:
+        a, e = atual[coluna].to_numpy(), esperado[coluna].to_numpy()
+        if esperado[coluna].dtype.kind == 'f':
+            np.testing.assert_allclose(a.astype(float), e.astype(float), rtol=0, atol=1e-9, err_msg=coluna)
+        else:
+            assert a.tolist() == e.tolist(), coluna
+
+
+@pytest.fixture
+def sinteticos():
+    # Venda '2' aparece em três linhas (dois SKUs) e tem duas devoluções; '6' tem dimensões vazias
+    vendas = pd.DataFrame({
+        'N.º de venda': ['1', '2', '2', '3', '4', '2', '5', '6'],
+        'Data da venda': pd.Timestamp('2026-02-01'),
+        'Receita por produtos (BRL)': [10.0, 20.0, 25.0, 30.0, 40.0, 5.0, 9.7725, 50.0],
+        'Venda por publicidade': ['Sim', 'Sim', None, '', 'Sim', 'Sim', 'Não', None],
+        'SKU': ['A', 'B', 'A', 'C', 'A', 'B', 'C', None],
+        'Forma de entrega': ['Full', '', 'Full', 'Coleta', ' ', 'Full', 'Full', None],
+        'Estado.1': ['SP', 'RJ', 'SP', None, 'SP', 'RJ', 'MG', 'SP'],
+        'Tarifas de envio (BRL)': [-5.0, -12.5, -10.0, -50.0, None, -30.0, -20.0, 0.0],
+    })
+    matriz = pd.DataFrame({
+        'N.º de venda': ['2', '3', '5', '6'],
+        'Cancelamentos e reembolsos (BRL)': [-20.0, -30.0, -9.7725, -1.005],
+        'Tarifas de envio (BRL)': [-7.0, 0.0, -3.0, -2.0],
+        'Estado': ['Cancelada', 'Reembolsamos o dinheiro', None, 'Reembolsamos o dinheiro'],
+    })
+    full = pd.DataFrame({
+        'N.º de venda': ['2'],
+        'Cancelamentos e reembolsos (BRL)': [-4.5],
+        'Tarifas de envio (BRL)': [-1.0],
+        'Estado': ['Cancelada'],
+    })
+    return vendas, montar_juncoes(vendas, matriz, full)['Todos']
+
+
+def test_agregar_por_igual_as_visoes_anteriores_sinteticas(sinteticos):
+    vendas, juncao = sinteticos
+
+    _comparar(analisar_ads(vendas, None, None, None, 0, juncao=juncao), _ads_anterior(vendas, juncao))
+    for dimensoes in [('Forma de Entrega',), ('Estado',), ('Forma de Entrega', 'Estado', 'Faixa de Custo de Envio')]:
+        _comparar(analisar_frete(vendas, None, None, None, 0, juncao=juncao, dimensoes=dimensoes),
+                  _frete_anterior(vendas, juncao, dimensoes))
+    atual, total = analisar_skus(vendas, None, None, None, 0, juncao=juncao)
+    esperado, total_esperado = _skus_anterior(vendas, juncao, 'SKU')
+    assert total == total_esperado
+    _comparar(atual, esperado)
+
+
+@pytest.mark.parametrize('canal', ['Todos', 'Matriz', 'Full'])
+@pytest.mark.parametrize('janela', [7, 180])
+def test_agregar_por_igual_as_visoes_anteriores_exemplo(dados_exemplo, canal, janela):
+    dados = aplicar_filtros(dados_exemplo, janela, canal, False, False)
+    vendas, juncao = dados['vendas'], dados['juncao']
+
+    _comparar(analisar_ads(vendas, None, None, None, 0, juncao=juncao), _ads_anterior(vendas, juncao))
+    for dimensoes in [('Forma de Entrega',), tuple(DIMENSOES_FRETE)]:
+        _comparar(analisar_frete(vendas, None, None, None, 0, juncao=juncao, dimensoes=dimensoes),
+                  _frete_anterior(vendas, juncao, dimensoes))
+    for col_agrup in ('SKU', 'Título do anúncio'):
+        if col_agrup not in vendas.columns:
+            continue
+        atual, total = analisar_skus(vendas, None, None, None, 0, agrupar_por=col_agrup, juncao=juncao)
+        esperado, total_esperado = _skus_anterior(vendas, juncao, col_agrup)
+        assert total == total_esperado
+        _comparar(atual, esperado)
@@ -0,0 +1,67 @@
+import pytest
+
+import utils.cache_streamlit as cache
+import utils.filtros as filtros
+
+
+@pytest.fixture
+def caches_vazios():
+    with cache._lock:
+        cache._datasets.clear()
+        cache._resultados.clear()
+    with filtros._lock:
+        filtros._filtros_em_cache.clear()
+    yield
+    with cache._lock:
+        cache._datasets.clear()
+        cache._resultados.clear()
+    with filtros._lock:
+        filtros._filtros_em_cache.clear()
+
+
+def _dataset(dados_exemplo, fingerprint):
+    return {**dados_exemplo, 'fingerprint': fingerprint}
+
+
+def test_dataset_expirado_leva_filtros_e_resultados(dados_exemplo, caches_vazios):
+    data = _dataset(dados_exemplo, 'fp')
+    with cache._lock:
+        cache._guardar(cache._datasets, 'fp', data, cache.tamanho_dataset(data), cache.CACHE_MAX_DATASETS)
+    filtrado = cache.filtrar(data, 30, 'Todos', False, False)
+    cache.calcular(filtrado, 'metricas')
+    assert cache._resultados and filtros._filtros_em_cache
+
+    with cache._lock:
+        agora = cache._datasets['fp']['criado'] + cache.CACHE_TTL_SEGUNDOS + 1
+        assert cache._ler(cache._datasets, 'fp', agora, descartar=cache._descartar_dataset) is None
+    assert not cache._datasets and not cache._resultados and not filtros._filtros_em_cache
+
+
+def test_filtros_expiram(dados_exemplo, caches_vazios, monkeypatch):
+    data = _dataset(dados_exemplo, 'fp')
+    primeiro = filtros.aplicar_filtros(data, 30, 'Todos', False, False)
+    assert filtros.aplicar_filtros(data, 30, 'Todos', False, False) is primeiro
+
+    monkeypatch.setattr(filtros, 'FILTROS_TTL_SEGUNDOS', -1)
+    segundo = filtros.aplicar_filtros(data, 30, 'Todos', False, False)
+    assert segundo is not primeiro
+
+    filtros.descartar_filtros_expirados()
+    assert not filtros._filtros_em_cache
+
+
+def test_orcamento_de_memoria(dados_exemplo, caches_vazios, monkeypatch):
+    antigo, atual = _dataset(dados_exemplo, 'antigo'), _dataset(dados_exemplo, 'atual')
+    tamanho = cache.tamanho_dataset(antigo)
+    with cache._lock:
+        cache._guardar(cache._datasets, 'antigo', antigo, tamanho, cache.CACHE_MAX_DATASETS)
+        cache._guardar(cache._datasets, 'atual', atual, tamanho, cache.CACHE_MAX_DATASETS)
+    for janela in (30, 90):
+        cache.calcular(cache.filtrar(antigo, janela, 'Todos', False, False), 'skus')
+
+    # Cabe só o dataset atual: saem os resultados, os filtros e o dataset antigo
+    monkeypatch.setattr(cache, 'CACHE_MEMORIA_MAX_BYTES', tamanho + 1)
+    cache._respeitar_orcamento('atual')
+    assert list(cache._datasets) == ['atual']
+    assert not cache._resultados and not filtros._filtros_em_cache
+    assert cache.memoria_em_cache() <= cache.CACHE_MEMORIA_MAX_BYTES
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+import utils.cache as cache
+from utils.esquema import compactar_esquema
+
+
+def test_coluna_com_numeros_e_brancos_vira_int64():
+    df = compactar_esquema(pd.DataFrame({
+        'Unidades.1': [' ', 1, np.nan, 2, ''],
+        'Valores': [' ', 1.5, 2, None, ' '],
+        'Misturada': ['a', 1, None, 2.5, ' '],
+    }))
+    assert df['Unidades.1'].dtype == 'Int64'
+    assert df['Unidades.1'].tolist()[1::2] == [1, 2]
+    assert df['Unidades.1'].isna().tolist() == [True, False, True, False, True]
+    # Fora das colunas de análise, float32 como os demais valores em R$
+    assert df['Valores'].dtype == 'float32'
+    assert df['Misturada'].map(type).eq(str).where(df['Misturada'].notna(), True).all()
+
+
+def test_tipos_iguais_no_dataset_novo_e_no_cache(arquivos_exemplo, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path))
+    novo = cache.processar_arquivos_com_cache(*arquivos_exemplo)
+    em_cache = cache.processar_arquivos_com_cache(*arquivos_exemplo)
+    assert any(tmp_path.iterdir())
+
+    for tabela in ('vendas', 'matriz', 'full'):
+        if novo.get(tabela) is None:
+            continue
+        assert novo[tabela].dtypes.astype(str).to_dict() == em_cache[tabela].dtypes.astype(str).to_dict(), tabela
+        pd.testing.assert_frame_equal(novo[tabela], em_cache[tabela], check_categorical=False)
+    assert novo['vendas']['Unidades.1'].dtype == 'Int64'
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+import utils.export as export
+from utils.filtros import aplicar_filtros
+
+
+def test_pacote_parquet_sem_pyarrow(dados_exemplo, monkeypatch):
+    dados = aplicar_filtros(dados_exemplo, 30, 'Todos', False, False)
+    monkeypatch.setattr(export, 'PARQUET_DISPONIVEL', False)
+    with pytest.raises(ValueError, match='pyarrow'):
+        export.exportar_pacote(dados, formato='parquet')
+    with pytest.raises(ValueError, match='desconhecido'):
+        export.exportar_pacote(dados, formato='xls')
+
+
+def _abas(arquivo):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(arquivo, read_only=True)
+    abas = {ws.title: list(ws.iter_rows(values_only=True)) for ws in workbook.worksheets}
+    workbook.close()
+    return abas
+
+
+def _partes(abas, nome):
+    """Abas 'Nome', 'Nome (2)', ... na ordem em que foram criadas"""
+    return [titulo for titulo in abas if titulo == nome or titulo.startswith(f'{nome} (')]
+
+
+# 101: a base de devoluções também passa de uma aba, e a segunda junta o fim da Matriz e o Full
+@pytest.mark.parametrize('limite', [101, 1001, 1_048_576])
+def test_bases_divididas_no_limite_do_excel(dados_exemplo, monkeypatch, limite):
+    dados = aplicar_filtros(dados_exemplo, 60, 'Todos', False, False)
+    monkeypatch.setattr(export, 'LIMITE_LINHAS_EXCEL', limite)
+    abas = _abas(export.exportar_xlsx(dados))
+
+    por_aba = limite - 1
+    bases = {
+        'Base de Vendas': [dados['vendas']],
+        'Base de Devoluções': [df for df in (dados['matriz'], dados['full']) if len(df) > 0],
+    }
+    for nome, frames in bases.items():
+        total = sum(len(df) for df in frames)
+        partes = _partes(abas, nome)
+        assert partes == [nome] + [f'{nome} ({i})' for i in range(2, len(partes) + 1)]
+        assert len(partes) == max(1, -(-total // por_aba))
+
+        linhas = []
+        for titulo in partes:
+            cabecalho, *corpo = abas[titulo]
+            assert list(cabecalho) == [str(col) for col in export._colunas(frames)]
+            assert 0 < len(corpo) <= por_aba
+            linhas.extend(corpo)
+        # Todas as linhas, na ordem original (Matriz e depois Full), sem perder nem repetir nenhuma
+        coluna = list(cabecalho).index('N.º de venda')
+        esperado = pd.concat([df['N.º de venda'] for df in frames]).astype(str).tolist()
+        assert [str(linha[coluna]) for linha in linhas] == esperado
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from utils.juncao import (
+    chave_venda, devolucoes_da_venda, indexar_devolucoes, posicoes_devolucoes, preparar_devolucoes,
+)
+
+
+def _dev_map(matriz, full):
+    """Mapa N.º de venda -> linhas de devolução, como era montado antes do índice CSR"""
+    todas_dev = pd.concat([matriz, full], ignore_index=True)
+    dev_map = {}
+    for _, row in todas_dev.iterrows():
+        dev_map.setdefault(str(row['N.º de venda']), []).append(row)
+    return dev_map
+
+
+def _reembolso(row):
+    reembolso = row['Cancelamentos e reembolsos (BRL)']
+    return reembolso if reembolso != 0 else row['Receita por produtos (BRL)']
+
+
+def _devolucoes(numeros, reembolsos, receitas, estados):
+    return pd.DataFrame({
+        'N.º de venda': numeros,
+        'Cancelamentos e reembolsos (BRL)': reembolsos,
+        'Receita por produtos (BRL)': receitas,
+        'Estado': estados,
+    })
+
+
+def _exemplo():
+    vendas = pd.DataFrame({'N.º de venda': ['10', '11', '12', '13', '11']})
+    matriz = _devolucoes(['11', '12', '11', '99'], [-5.0, 0.0, -7.5, -1.0], [20.0, 30.0, 40.0, 50.0],
+                         ['Reembolsamos o dinheiro', 'Cancelada', None, 'Em revisão'])
+    full = _devolucoes(['12', '13', '11'], [-2.0, -3.0, 0.0], [1.0, 2.0, 9.0],
+                       ['Mediação', None, 'Devolvemos o produto ao comprador'])
+    return vendas, matriz, full
+
+
+def test_devolucoes_da_venda_igual_ao_dev_map():
+    vendas, matriz, full = _exemplo()
+    indice = indexar_devolucoes(vendas, preparar_devolucoes(matriz, full))
+    dev_map = _dev_map(matriz, full)
+
+    for chave, linhas in dev_map.items():
+        devolucoes = devolucoes_da_venda(indice, chave)
+        assert len(devolucoes['reembolso']) == len(linhas)
+        # Mesma ordem do mapa: Matriz antes de Full e, dentro de cada aba, a ordem das linhas
+        np.testing.assert_array_equal(devolucoes['reembolso'], [_reembolso(row) for row in linhas])
+
+    vazia = devolucoes_da_venda(indice, '10')
+    assert all(len(valores) == 0 for valores in vazia.values())
+    assert len(devolucoes_da_venda(indice, 'inexistente')['reembolso']) == 0
+
+
+def test_posicoes_devolucoes_junta_as_fatias_das_vendas():
+    vendas, matriz, full = _exemplo()
+    indice = indexar_devolucoes(vendas, preparar_devolucoes(matriz, full))
+    dev_map = _dev_map(matriz, full)
+
+    ids = indice['ids_vendas']
+    posicoes = posicoes_devolucoes(indice, ids)
+    esperado = [
+        _reembolso(row)
+        for chave in chave_venda(vendas['N.º de venda'])
+        for row in dev_map.get(chave, [])
+    ]
+    np.testing.assert_array_equal(indice['colunas']['reembolso'][posicoes], esperado)
+
+    # Vendas sem N.º de venda (id -1) não têm devoluções
+    assert len(posicoes_devolucoes(indice, [-1])) == 0
+
+
+def test_indice_no_exemplo_igual_ao_dev_map(dados_exemplo):
+    indice = dados_exemplo['indice_devolucoes']
+    dev_map = _dev_map(dados_exemplo['matriz'], dados_exemplo['full'])
+
+    for chave, linhas in dev_map.items():
+        devolucoes = devolucoes_da_venda(indice, chave)
+        np.testing.assert_allclose(devolucoes['reembolso'], [_reembolso(row) for row in linhas])
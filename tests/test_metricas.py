@@ -0,0 +1,55 @@
+import pytest
+
+from utils.filtros import aplicar_filtros
+from utils.metricas import calcular_metricas, calcular_metricas_janelas
+
+JANELAS = [1, 7, 30, 60, 90, 120, 150, 180]
+
+
+@pytest.mark.parametrize('canal', ['Todos', 'Matriz', 'Full'])
+@pytest.mark.parametrize('somente_ads', [False, True])
+def test_janelas_iguais_a_calcular_metricas_por_janela(dados_exemplo, canal, somente_ads):
+    dados = aplicar_filtros(dados_exemplo, max(JANELAS), canal, somente_ads, False)
+    por_janela = calcular_metricas_janelas(dados['vendas'], dados['juncao'], dados['max_date'], JANELAS)
+    assert por_janela['janela'].tolist() == JANELAS
+
+    for _, linha in por_janela.iterrows():
+        janela = int(linha['janela'])
+        # Caminho anterior: filtrar a janela e calcular as métricas do zero
+        filtrado = aplicar_filtros(dados_exemplo, janela, canal, somente_ads, False)
+        esperado = calcular_metricas(filtrado['vendas'], filtrado['matriz'], filtrado['full'],
+                                     filtrado['max_date'], janela, juncao=filtrado['juncao'])
+        for chave, valor in esperado.items():
+            if isinstance(valor, int):
+                assert linha[chave] == valor, (janela, chave)
+            else:
+                assert linha[chave] == pytest.approx(valor, rel=1e-9, abs=1e-6), (janela, chave)
+
+
+def test_limites_das_janelas():
+    import pandas as pd
+    from utils.juncao import montar_juncoes
+
+    max_date = pd.Timestamp('2026-02-27 10:45')
+    datas = [max_date, max_date - pd.Timedelta(days=30), max_date - pd.Timedelta(days=30, seconds=1),
+             max_date - pd.Timedelta(days=1, minutes=1), pd.NaT, max_date - pd.Timedelta(days=400)]
+    vendas = pd.DataFrame({
+        'N.º de venda': ['1', '2', '3', '4', '5', '2'],
+        'Data da venda': pd.to_datetime(datas),
+        'Receita por produtos (BRL)': [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+        'Unidades': [1, 2, 1, 1, 1, 3],
+    })
+    matriz = pd.DataFrame({
+        'N.º de venda': ['2', '3', '5'], 'Cancelamentos e reembolsos (BRL)': [-5.0, -6.0, -7.0],
+        'Estado': ['Cancelada', 'Reembolsamos o dinheiro', None],
+    })
+    juncao = montar_juncoes(vendas, matriz, None)['Todos']
+
+    por_janela = calcular_metricas_janelas(vendas, juncao, max_date, [1, 30, 31, 365])
+    for _, linha in por_janela.iterrows():
+        janela = int(linha['janela'])
+        # Regra de aplicar_filtros: Data da venda >= max_date - janela dias
+        dentro = (vendas['Data da venda'] >= max_date - pd.Timedelta(days=janela)).to_numpy()
+        esperado = calcular_metricas(vendas[dentro], matriz, None, max_date, janela, juncao=juncao[dentro])
+        for chave, valor in esperado.items():
+            assert linha[chave] == pytest.approx(valor), (janela, chave)
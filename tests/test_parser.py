@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils.parser as parser
+from utils.parser import combinar_arquivos, converter_datas_pt_br, normalizar_planilha, parse_date_pt_br
+
+
+DATAS = [
+    '24 de fevereiro de 2026 22:51 hs.', '1 de janeiro de 2025 00:00 hs.', '5 de Março de 2026 7:05 hs.',
+    '05 DE DEZEMBRO DE 2024 23:59', 'Venda em 9 de julho de 2026 12:30 hs. (reprogramada)',
+    '31 de fevereiro de 2026 10:00 hs.', '29 de fevereiro de 2024 10:00 hs.', '29 de fevereiro de 2025 10:00 hs.',
+    '10 de janeiro de 2026 24:00 hs.', '10 de janeiro de 2026 23:60 hs.', '10 de janeiro de 2026 25:10 hs.',
+    '10 de janeiros de 2026 10:00 hs.', '10 de jan de 2026 10:00 hs.', '10 de janeiro 2026 10:00 hs.',
+    '10/01/2026 10:00', '10 de janeiro de 26 10:00 hs.', '100 de janeiro de 2026 10:00 hs.',
+    '', '   ', 'nan', None, np.nan, 45000, 12.5, pd.Timestamp('2026-01-10 10:00'),
+]
+
+
+def test_converter_datas_igual_a_parse_date_pt_br():
+    serie = pd.Series(DATAS, dtype=object)
+    esperado = pd.to_datetime(serie.apply(parse_date_pt_br)).astype('datetime64[ns]')
+    obtido = converter_datas_pt_br(serie)
+    pd.testing.assert_series_equal(obtido, esperado, check_names=False)
+
+
+def test_converter_datas_no_exemplo_igual_a_parse_date_pt_br(arquivos_exemplo):
+    serie = pd.read_excel(arquivos_exemplo[0], sheet_name='Vendas BR', header=5)['Data da venda']
+    esperado = pd.to_datetime(serie.apply(parse_date_pt_br)).astype('datetime64[ns]')
+    pd.testing.assert_series_equal(converter_datas_pt_br(serie), esperado, check_names=False)
+
+
+def _planilha(numeros, datas, receitas):
+    """Tabela como lida do Excel: datas em texto PT-BR e valores ainda sem conversão"""
+    return pd.DataFrame({
+        'N.º de venda': numeros,
+        'Data da venda': datas,
+        'Receita por produtos (BRL)': receitas,
+    })
+
+
+def _normalizada(numeros, datas, receitas):
+    falhas = {}
+    df = normalizar_planilha(_planilha(numeros, datas, receitas), falhas)
+    return df, falhas
+
+
+JANEIRO = '10 de janeiro de 2026 10:00 hs.'
+FEVEREIRO = '5 de fevereiro de 2026 09:30 hs.'
+
+
+def test_arquivo_mais_recente_vence_em_qualquer_ordem():
+    janeiro, _ = _normalizada(['1', '2', '3'], [JANEIRO] * 3, [10.0, 20.0, 30.0])
+    fevereiro, _ = _normalizada(['3', '4', '4'], [FEVEREIRO] * 3, [33.0, 40.0, 41.0])
+
+    for tabelas in ([janeiro, fevereiro], [fevereiro, janeiro]):
+        combinada, descartadas, _ = combinar_arquivos(tabelas)
+        assert descartadas == 1
+        # A venda 3 fica só com a versão de fevereiro; as duas linhas da venda 4 (mesmo arquivo) ficam
+        assert combinada.loc[combinada['N.º de venda'] == '3', 'Receita por produtos (BRL)'].tolist() == [33.0]
+        assert sorted(combinada['N.º de venda']) == ['1', '2', '3', '4', '4']
+
+
+def test_empate_de_data_vence_o_ultimo_enviado_e_vazios_ficam():
+    primeiro, _ = _normalizada(['1', np.nan], [JANEIRO] * 2, [1.0, 2.0])
+    segundo, _ = _normalizada(['1', np.nan], [JANEIRO] * 2, [9.0, 3.0])
+
+    combinada, descartadas, _ = combinar_arquivos([primeiro, segundo])
+    assert descartadas == 1
+    assert combinada.loc[combinada['N.º de venda'] == '1', 'Receita por produtos (BRL)'].tolist() == [9.0]
+    # N.º de venda vazio não identifica a venda: as duas linhas são mantidas
+    assert combinada['N.º de venda'].isna().sum() == 2
+
+
+def test_falhas_contadas_apenas_nas_linhas_mantidas():
+    # Janeiro: venda 2 sem receita e venda 3 com receita inválida; ambas reaparecem em fevereiro
+    janeiro, falhas_janeiro = _normalizada(['1', '2', '3'], [JANEIRO, JANEIRO, 'ontem'], [np.nan, np.nan, 'abc'])
+    fevereiro, falhas_fevereiro = _normalizada(['2', '3'], [FEVEREIRO, np.nan], [20.0, 'x'])
+
+    assert falhas_janeiro['Receita por produtos (BRL)']['vazios'].tolist() == [True, True, False]
+    assert falhas_janeiro['Receita por produtos (BRL)']['invalidos'].tolist() == [False, False, True]
+
+    _, _, falhas = combinar_arquivos([janeiro, fevereiro], [falhas_janeiro, falhas_fevereiro])
+    assert falhas['Receita por produtos (BRL)'] == {'vazios': 1, 'invalidos': 1}
+    assert falhas['Data da venda'] == {'vazios': 1, 'invalidos': 0}
+
+    # Arquivo único: todas as linhas contam
+    _, _, falhas = combinar_arquivos([janeiro], [falhas_janeiro])
+    assert falhas['Receita por produtos (BRL)'] == {'vazios': 2, 'invalidos': 1}
+    assert falhas['Data da venda'] == {'vazios': 0, 'invalidos': 1}
+
+
+def test_mesmo_arquivo_duas_vezes_conta_falhas_uma_vez():
+    tabela, falhas = _normalizada(['1', '2', '3'], [JANEIRO] * 3, [np.nan, 'abc', 5.0])
+    _, descartadas, combinadas = combinar_arquivos([tabela, tabela.copy()], [falhas, falhas])
+    assert descartadas == 3
+    assert combinadas['Receita por produtos (BRL)'] == {'vazios': 1, 'invalidos': 1}
+
+
+class _SemProcessos:
+    def __init__(self, *args, **kwargs):
+        raise AssertionError('a leitura não deveria iniciar processos')
+
+
+def test_upload_comum_le_em_sequencia(monkeypatch):
+    monkeypatch.setattr(parser, 'ProcessPoolExecutor', _SemProcessos)
+    monkeypatch.setattr(parser, '_ler_arquivo', lambda tipo, file: ({tipo: file}, {}))
+    lidos = parser.ler_arquivos([('vendas', __file__), ('devolucoes', __file__)], max_processos=4)
+    assert [tabelas for tabelas, _ in lidos] == [{'vendas': __file__}, {'devolucoes': __file__}]
+
+
+def test_varios_arquivos_do_mesmo_tipo_usam_processos(monkeypatch):
+    usados = []
+
+    class _Processos(_SemProcessos):
+        def __init__(self, *args, **kwargs):
+            usados.append(kwargs.get('max_workers'))
+            raise RuntimeError('processos')
+
+    monkeypatch.setattr(parser, 'ProcessPoolExecutor', _Processos)
+    with pytest.raises(RuntimeError):
+        parser.ler_arquivos([('vendas', __file__), ('vendas', __file__), ('devolucoes', __file__)], max_processos=2)
+    assert usados == [2]
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from utils.regras import REGRAS_MOTIVO, aplicar_regras, classificar_estados, compilar_regras, inferir_motivos
+
+
+def _classificar_estado_antigo(estado):
+    """Cadeia if/elif substituída pela tabela REGRAS_ESTADO"""
+    if pd.isna(estado):
+        return 'Neutra'
+    estado_lower = str(estado).lower()
+    if ('colocamos o produto à venda novamente' in estado_lower or
+            'devolvemos o produto ao comprador' in estado_lower or
+            'reembolsamos o dinheiro' in estado_lower):
+        return 'Saudável'
+    if ('cancelada' in estado_lower or 'mediação' in estado_lower or
+            'reclamação' in estado_lower or 'revisão' in estado_lower):
+        return 'Crítica'
+    return 'Neutra'
+
+
+def _inferir_motivo_antigo(estado_dev, status_dev, estado_venda, status_venda, tarifa_envio_negativa):
+    """Cadeia if/elif de categorizar_vazio (analisar_motivos) substituída pela tabela REGRAS_MOTIVO"""
+    estado_dev, status_dev, estado_venda, status_venda = (
+        str(valor).lower() for valor in (estado_dev, status_dev, estado_venda, status_venda)
+    )
+    if 'estoque' in status_venda or 'estoque' in estado_venda:
+        return 'Cancelado: Falta de Estoque'
+    if 'arrependeu' in status_venda or 'arrependimento' in status_venda or 'se arrependeu' in status_dev:
+        return 'Cancelado: Arrependimento do Comprador'
+    if 'você cancelou' in estado_venda:
+        return 'Cancelado pelo Vendedor'
+    if 'cancelada pelo comprador' in estado_venda:
+        return 'Cancelado pelo Comprador'
+    if 'não funciona' in status_dev or 'defeito' in status_dev:
+        return 'Produto com Defeito / Não funciona'
+    if 'incompleto' in status_dev or 'faltando' in status_dev:
+        return 'Produto Incompleto / Faltando Peças'
+    if 'embalagem estava em ordem mas o produto não funciona' in status_dev:
+        return 'Produto com Defeito (Embalagem OK)'
+    if 'atraso' in status_venda or 'atraso' in status_dev:
+        return 'Atraso na Entrega / Logística'
+    if 'te demos o dinheiro' in estado_dev or 'te demos o dinheiro' in status_dev or 'te demos o dinheiro' in status_venda:
+        return 'Reembolso ao Vendedor (Proteção)'
+    if tarifa_envio_negativa:
+        if 'reembolso' in estado_dev or 'reembolsamos' in status_dev:
+            return 'Devolução Física com Reembolso'
+        return 'Devolução Física em Processo'
+    if 'reembolso' in estado_dev or 'reembolsamos' in status_dev or 'reembolso' in estado_venda:
+        return 'Reembolso Direto ao Comprador'
+    if 'mediação' in estado_dev or 'mediação' in status_dev or 'mediação' in status_venda:
+        return 'Finalizado via Mediação'
+    if 'não entregue' in estado_dev or 'não foi feita' in estado_dev:
+        return 'Devolução não realizada'
+    if 'enviamos de volta' in estado_dev or 'devolvemos o produto ao comprador' in estado_dev:
+        return 'Produto devolvido ao comprador'
+    if 'devolvido' in estado_dev or 'devolução finalizada' in estado_dev:
+        return 'Devolução Concluída'
+    return 'Outros Motivos de Devolução'
+
+
+# Textos com os termos das regras isolados, combinados, em maiúsculas e sobrepostos
+TEXTOS = [
+    None, np.nan, '', 'nan', 'Em andamento',
+    'Reembolsamos o dinheiro ao comprador', 'Colocamos o produto à venda novamente',
+    'Devolvemos o produto ao comprador', 'Cancelada', 'Venda cancelada pelo comprador',
+    'Em mediação', 'Reclamação aberta', 'Em revisão', 'Você cancelou a venda',
+    'Sem estoque', 'O comprador se arrependeu', 'Arrependimento', 'Produto com DEFEITO',
+    'Não funciona', 'A embalagem estava em ordem mas o produto não funciona',
+    'Veio incompleto, faltando peças', 'Atraso na entrega', 'Te demos o dinheiro',
+    'Reembolso em processo', 'Reembolsamos', 'Não entregue', 'A devolução não foi feita',
+    'Enviamos de volta', 'Produto devolvido', 'Devolução finalizada',
+    'Devolvido e reembolso concluído após mediação', 'cancelada em revisão com reclamação',
+]
+
+
+def test_classificar_estados_igual_a_cadeia_antiga():
+    estados = pd.Series(TEXTOS, dtype=object)
+    esperado = [_classificar_estado_antigo(estado) for estado in TEXTOS]
+    assert classificar_estados(estados).tolist() == esperado
+
+
+def test_inferir_motivos_igual_a_cadeia_antiga():
+    rng = np.random.default_rng(0)
+    n = 5000
+    campos = {nome: pd.Series(rng.choice(np.array(TEXTOS, dtype=object), n), dtype=object)
+              for nome in ('estado_dev', 'status_dev', 'estado_venda', 'status_venda')}
+    tarifa = rng.random(n) < 0.3
+
+    obtido = inferir_motivos(tarifa_envio_negativa=tarifa, **campos)
+    esperado = [
+        _inferir_motivo_antigo(*(campos[nome].iloc[i] for nome in campos), tarifa[i])
+        for i in range(n)
+    ]
+    assert list(obtido) == esperado
+
+
+def _primeira_regra(regras, texto, padrao):
+    """Avaliação direta da tabela: primeira regra com algum termo contido no texto"""
+    texto = '' if pd.isna(texto) else str(texto).lower()
+    for regra in regras:
+        if any(termo in texto for termo in regra['termos']['texto']):
+            return regra['rotulo']
+    return padrao
+
+
+def test_termos_prefixos_na_mesma_posicao():
+    # A regex devolve só o termo mais longo em cada posição: os termos que são prefixos
+    # dele (e as regras que eles satisfazem) vêm do fechamento por prefixo
+    regras = [
+        {'rotulo': 'longo', 'termos': {'texto': ['reembolsamos']}},
+        {'rotulo': 'meio', 'termos': {'texto': ['reembolsa']}},
+        {'rotulo': 'curto', 'termos': {'texto': ['reembols', 'devol']}},
+    ]
+    textos = pd.Series(['reembolsamos', 'REEMBOLSA', 'reembolso', 'reembol', 'devolução', None], dtype=object)
+    for ordem in (regras, regras[::-1], [regras[2], regras[0], regras[1]]):
+        obtido = aplicar_regras(compilar_regras(ordem, 'nenhum'), {'texto': textos})
+        assert list(obtido) == [_primeira_regra(ordem, texto, 'nenhum') for texto in textos]
+
+
+def test_termos_sobrepostos_em_posicoes_diferentes():
+    # 'não funciona' aparece dentro do termo da embalagem: as duas regras são satisfeitas
+    # e a de maior prioridade (defeito) vence, como na cadeia antiga
+    status = pd.Series(['a embalagem estava em ordem mas o produto não funciona'], dtype=object)
+    vazio = pd.Series([None], dtype=object)
+    obtido = inferir_motivos(vazio, status, vazio, vazio, np.array([False]))
+    assert list(obtido) == ['Produto com Defeito / Não funciona']
+
+    sem_defeito = [regra for regra in REGRAS_MOTIVO if regra['rotulo'] != 'Produto com Defeito / Não funciona']
+    compiladas = compilar_regras(sem_defeito, 'Outros')
+    assert list(aplicar_regras(compiladas, {'status_dev': status}, tamanho=1)) == ['Produto com Defeito (Embalagem OK)']
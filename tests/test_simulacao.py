@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.filtros import aplicar_filtros
+from utils.metricas import calcular_metricas
+from utils.simulacao import grade_cenarios, segmentos_por_item, segmentos_por_motivo, simular_cenarios
+
+SEGMENTOS = pd.DataFrame({
+    'segmento': ['a', 'b', 'c', 'd'],
+    'vendas': [100, 80, 50, 30],
+    'devolucoes': [20, 10, 6, 0],
+    'perda': [2000.0, 500.0, 600.0, 0.0],
+})
+VENDAS_TOTAIS = 260
+
+
+def test_reducao_zero_nao_evita_nada():
+    cenarios = simular_cenarios(SEGMENTOS, [0, 1, 5], VENDAS_TOTAIS, semente=3)
+    zero = cenarios.loc[0.0]
+    for coluna in ('evitadas_p10', 'evitadas_p50', 'evitadas_p90', 'economia_p10', 'economia_p50', 'economia_p90'):
+        assert zero[coluna] == 0
+
+
+def test_fator_limitado_e_alvo_saturado_zerado():
+    alvo = np.array([True, False, True, False])
+    cenarios = simular_cenarios(SEGMENTOS, [50, 100], VENDAS_TOTAIS, alvo=alvo)
+
+    assert (cenarios['fator'] == 1.0).all()
+    # Todas as devoluções do alvo são evitadas, em todas as simulações
+    for coluna in ('evitadas_p10', 'evitadas_p50', 'evitadas_p90'):
+        assert (cenarios[coluna] == 26).all()
+    np.testing.assert_allclose(cenarios['economia_p50'], 2600.0)
+
+    grade = grade_cenarios(cenarios, devolucoes_atuais=36, impacto_atual=3100.0)
+    assert (grade['devolucoes_simuladas'] == 10).all()
+    np.testing.assert_allclose(grade['perda_simulada'], 500.0)
+
+
+def test_mediana_das_evitadas_proxima_do_fator():
+    cenarios = simular_cenarios(SEGMENTOS, [2, 5, 10], VENDAS_TOTAIS, n_simulacoes=2000, semente=7)
+    esperado = cenarios['fator'] * SEGMENTOS['devolucoes'].sum()
+    np.testing.assert_allclose(cenarios['evitadas_p50'], esperado, atol=1.0)
+
+
+@pytest.mark.parametrize('canal', ['Todos', 'Matriz', 'Full'])
+def test_segmentos_reconciliam_com_as_metricas(dados_exemplo, canal):
+    dados = aplicar_filtros(dados_exemplo, 180, canal, False, False)
+    juncao = dados['juncao'] if canal == 'Todos' else dados[f'juncao_{canal.lower()}']
+    matriz = dados['matriz'] if canal != 'Full' else None
+    full = dados['full'] if canal != 'Matriz' else None
+    metricas = calcular_metricas(dados['vendas'], matriz, full, dados['max_date'], 180, juncao=juncao)
+
+    por_item = segmentos_por_item(dados['vendas'], juncao, 'SKU')
+    por_motivo = segmentos_por_motivo(dados['vendas'], matriz, full, juncao)
+    for segmentos in (por_item, por_motivo):
+        assert segmentos['devolucoes'].sum() == metricas['devolucoes_vendas']
+        assert segmentos['perda'].sum() == pytest.approx(abs(metricas['impacto_devolucao']))
@@ -1,482 +1,303 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from utils.juncao import obter_juncao, coluna_numerica, chave_venda, reembolso_devolucoes
+from utils.regras import inferir_motivos
 
-def analisar_frete(vendas, matriz, full, max_date, dias_atras):
+def agregar_por(juncao, dimensoes):
+    """
+    Agrega a junção venda ↔ devolução por uma ou mais dimensões, sem laços por grupo.
+    dimensoes: dict nome -> Series (ou DataFrame) alinhado às vendas, uma coluna por dimensão.
+    Cada venda devolvida conta uma única vez por grupo, mesmo que apareça em várias linhas.
+    Retorna DataFrame com as dimensões (na ordem de aparição) e 'vendas', 'devolucoes',
+    'taxa' (%), 'receita', 'reembolso', 'impacto' e 'custo_dev'.
+    """
+    tabela = pd.DataFrame(dimensoes, index=juncao.index)
+    nomes = list(tabela.columns)
+    
+    devolvida = (juncao['devolucoes'] > 0) & ~tabela.assign(_chave=juncao['chave']).duplicated()
+    tabela = tabela.assign(
+        _receita=juncao['receita_prod'],
+        _reembolso=juncao['reembolso'],
+        _impacto=juncao['impacto'],
+        _custo_dev=juncao['custo_dev'],
+    )
+    opcoes = dict(sort=False, observed=True, dropna=False)
+    
+    grupos = tabela.groupby(nomes, **opcoes).agg(
+        vendas=('_receita', 'size'),
+        receita=('_receita', 'sum'),
+    )
+    # Valores das devoluções somados apenas sobre a primeira linha de cada venda devolvida
+    dev = tabela[devolvida].groupby(nomes, **opcoes).agg(
+        devolucoes=('_reembolso', 'size'),
+        reembolso=('_reembolso', 'sum'),
+        impacto=('_impacto', 'sum'),
+        custo_dev=('_custo_dev', 'sum'),
+    )
+    grupos = grupos.join(dev).fillna({'devolucoes': 0, 'reembolso': 0.0, 'impacto': 0.0, 'custo_dev': 0.0}).reset_index()
+    
+    grupos['vendas'] = grupos['vendas'].astype('int64')
+    grupos['devolucoes'] = grupos['devolucoes'].astype('int64')
+    grupos['taxa'] = grupos['devolucoes'] / grupos['vendas'] * 100
+    return grupos
+
+def _arredondar(valores, casas):
+    """round() do Python por grupo (np.round difere em valores na metade, ex.: 9.7725)"""
+    return pd.Series([round(float(v), casas) for v in valores], index=valores.index, dtype='float64')
+
+# Dimensões logísticas disponíveis na análise de frete: nome exibido -> coluna do relatório de vendas
+DIMENSOES_FRETE = {
+    'Forma de Entrega': 'Forma de entrega',
+    'Estado': 'Estado.1',
+    'Transportadora': 'Motorista',
+    'Faixa de Custo de Envio': 'Tarifas de envio (BRL)',
+}
+
+# Faixas de custo de envio (valor absoluto de 'Tarifas de envio', em R$)
+FAIXAS_CUSTO_ENVIO = [0, 10, 20, 30, 50, np.inf]
+ROTULOS_CUSTO_ENVIO = ['Até R$ 10', 'R$ 10 a 20', 'R$ 20 a 30', 'R$ 30 a 50', 'Acima de R$ 50']
+
+def _coluna_dimensao_frete(vendas, dimensao):
+    """Valores da dimensão logística para cada venda (vazios recebem um rótulo padrão)"""
+    coluna = vendas[DIMENSOES_FRETE[dimensao]]
+    
+    if dimensao == 'Faixa de Custo de Envio':
+        custo = pd.to_numeric(coluna, errors='coerce').fillna(0).abs()
+        return pd.cut(custo, FAIXAS_CUSTO_ENVIO, labels=ROTULOS_CUSTO_ENVIO, right=False)
+    
+    # Forma de entrega vazia é 'Mercado Envios' (identificado nos relatórios reais)
+    padrao = 'Mercado Envios' if dimensao == 'Forma de Entrega' else 'Não informado'
+    if isinstance(coluna.dtype, pd.CategoricalDtype) and padrao not in coluna.cat.categories:
+        coluna = coluna.cat.add_categories([padrao])
+    return coluna.fillna(padrao).replace(['', ' '], padrao)
+
+def analisar_frete(vendas, matriz, full, max_date, dias_atras, juncao=None, dimensoes=('Forma de Entrega',)):
     """
     Análise de frete e forma de entrega.
     Os dados já chegam filtrados pelo cabeçalho global.
+    dimensoes: chaves de DIMENSOES_FRETE usadas no agrupamento (ex.: forma de entrega e estado)
     """
     
-    if matriz is None:
-        matriz = pd.DataFrame()
-    if full is None:
-        full = pd.DataFrame()
-    
-    vendas_periodo = vendas.copy()
+    juncao = obter_juncao(vendas, matriz, full, juncao)
     
-    # Criar mapa de devoluções
-    todas_dev = pd.concat([matriz, full], ignore_index=True)
-    dev_map = {}
+    dimensoes = [d for d in dimensoes if DIMENSOES_FRETE[d] in vendas.columns]
+    if not dimensoes or len(vendas) == 0:
+        return pd.DataFrame()
     
-    if len(todas_dev) > 0 and 'N.º de venda' in todas_dev.columns:
-        for _, row in todas_dev.iterrows():
-            num_venda = str(row['N.º de venda'])
-            if num_venda not in dev_map:
-                dev_map[num_venda] = []
-            dev_map[num_venda].append(row)
+    grupos = agregar_por(juncao, {d: _coluna_dimensao_frete(vendas, d) for d in dimensoes})
     
-    # Análise por forma de entrega
-    frete_data = []
-    
-    if 'Forma de entrega' in vendas_periodo.columns:
-        # Preencher valores vazios com 'Mercado Envios' (identificado nos relatórios reais)
-        vendas_periodo['Forma de entrega'] = vendas_periodo['Forma de entrega'].fillna('Mercado Envios').replace(['', ' '], 'Mercado Envios')
-        formas = vendas_periodo['Forma de entrega'].unique()
-        
-        for forma in formas:
-            vendas_forma = vendas_periodo[vendas_periodo['Forma de entrega'] == forma]
-            total_vendas = len(vendas_forma)
-            
-            dev_count = 0
-            dev_valor = 0.0
-            
-            vendas_devolvidas = set()
-            for _, venda in vendas_forma.iterrows():
-                num_venda = str(venda.get('N.º de venda', ''))
-                if num_venda in dev_map and num_venda not in vendas_devolvidas:
-                    vendas_devolvidas.add(num_venda)
-                    dev_count += 1
-                    for dev in dev_map[num_venda]:
-                        # Usar Cancelamentos e reembolsos para impacto real
-                        reembolso = dev.get('Cancelamentos e reembolsos (BRL)', None)
-                        if reembolso is None or pd.isna(reembolso):
-                            reembolso = 0.0
-                        reembolso = float(reembolso)
-                        if reembolso == 0:
-                            fallback = dev.get('Receita por produtos (BRL)', 0)
-                            if pd.isna(fallback): fallback = 0.0
-                            reembolso = float(fallback)
-                        dev_valor += reembolso
-            
-            taxa = (dev_count / total_vendas * 100) if total_vendas > 0 else 0
-            
-            frete_data.append({
-                'Forma de Entrega': forma,
-                'Vendas': total_vendas,
-                'Devoluções': dev_count,
-                'Taxa (%)': round(taxa, 1),
-                'Impacto (R$)': round(-dev_valor, 2),
-            })
-    
-    return pd.DataFrame(frete_data) if frete_data else pd.DataFrame()
+    return pd.DataFrame({
+        **{d: grupos[d].astype(str) for d in dimensoes},
+        'Vendas': grupos['vendas'],
+        'Devoluções': grupos['devolucoes'],
+        'Taxa (%)': _arredondar(grupos['taxa'], 1),
+        # Usar Cancelamentos e reembolsos para impacto real
+        'Impacto (R$)': _arredondar(-grupos['reembolso'], 2),
+    })
 
-def analisar_motivos(vendas=None, matriz=None, full=None, max_date=None, dias_atras=0):
+def motivos_devolucoes(vendas=None, matriz=None, full=None):
     """
-    Análise de motivos de devolução cruzando com dados de vendas.
+    Uma linha por devolução (Matriz + Full, nesta ordem) com o motivo informado ou inferido,
+    o impacto (|reembolso|) e a chave da venda. Retorna None se as devoluções não têm
+    'Motivo do resultado'.
     """
     
-    if matriz is None:
-        matriz = pd.DataFrame()
-    if full is None:
-        full = pd.DataFrame()
     if vendas is None:
         vendas = pd.DataFrame()
     
-    todas_dev = pd.concat([matriz, full], ignore_index=True)
-    
-    # Criar mapa de vendas para cruzamento rápido
-    vendas_map = {}
-    if not vendas.empty and 'N.º de venda' in vendas.columns:
-        # Garantir que N.º de venda seja string para comparação
-        vendas_temp = vendas.copy()
-        vendas_temp['N.º de venda'] = vendas_temp['N.º de venda'].astype(str)
-        for _, row in vendas_temp.iterrows():
-            vendas_map[row['N.º de venda']] = row
-            
-    motivos_data = []
-    
-    if len(todas_dev) > 0 and 'Motivo do resultado' in todas_dev.columns:
-        def categorizar_vazio(row):
-            motivo = str(row['Motivo do resultado']).strip()
-            if motivo != '' and motivo != 'nan':
-                return motivo
-            
-            num_venda = str(row.get('N.º de venda', ''))
-            venda_info = vendas_map.get(num_venda, {})
-            
-            # Pegar informações de estado e status tanto da devolução quanto da venda
-            estado_dev = str(row.get('Estado', '')).lower()
-            status_dev = str(row.get('Descrição do status', '')).lower()
-            estado_venda = str(venda_info.get('Estado', '')).lower()
-            status_venda = str(venda_info.get('Descrição do status', '')).lower()
-            
-            # Prioridade 1: Motivos de cancelamento explícitos no relatório de vendas
-            if 'estoque' in status_venda or 'estoque' in estado_venda:
-                return 'Cancelado: Falta de Estoque'
-            if 'arrependeu' in status_venda or 'arrependimento' in status_venda or 'se arrependeu' in status_dev:
-                return 'Cancelado: Arrependimento do Comprador'
-            if 'você cancelou' in estado_venda:
-                return 'Cancelado pelo Vendedor'
-            if 'cancelada pelo comprador' in estado_venda:
-                return 'Cancelado pelo Comprador'
-            
-            # Prioridade 2: Detalhamento de problemas técnicos/logísticos
-            if 'não funciona' in status_dev or 'defeito' in status_dev:
-                return 'Produto com Defeito / Não funciona'
-            if 'incompleto' in status_dev or 'faltando' in status_dev:
-                return 'Produto Incompleto / Faltando Peças'
-            if 'embalagem estava em ordem mas o produto não funciona' in status_dev:
-                return 'Produto com Defeito (Embalagem OK)'
-            if 'atraso' in status_venda or 'atraso' in status_dev:
-                return 'Atraso na Entrega / Logística'
-            
-            # Prioridade 3: Lógica baseada no estado da devolução/venda
-            if 'te demos o dinheiro' in estado_dev or 'te demos o dinheiro' in status_dev or 'te demos o dinheiro' in status_venda:
-                return 'Reembolso ao Vendedor (Proteção)'
-            
-            # Se houve tarifa de envio negativa, é uma devolução física
-            tarifa_envio = row.get('Tarifas de envio (BRL)', 0)
-            if pd.notna(tarifa_envio) and tarifa_envio < 0:
-                if 'reembolso' in estado_dev or 'reembolsamos' in status_dev:
-                    return 'Devolução Física com Reembolso'
-                return 'Devolução Física em Processo'
-
-            if 'reembolso' in estado_dev or 'reembolsamos' in status_dev or 'reembolso' in estado_venda:
-                return 'Reembolso Direto ao Comprador'
-            if 'mediação' in estado_dev or 'mediação' in status_dev or 'mediação' in status_venda:
-                return 'Finalizado via Mediação'
-            if 'não entregue' in estado_dev or 'não foi feita' in estado_dev:
-                return 'Devolução não realizada'
-            if 'enviamos de volta' in estado_dev or 'devolvemos o produto ao comprador' in estado_dev:
-                return 'Produto devolvido ao comprador'
-            if 'devolvido' in estado_dev or 'devolução finalizada' in estado_dev:
-                return 'Devolução Concluída'
-            
-            return 'Outros Motivos de Devolução'
-
-        # Aplicar categorização inteligente para motivos vazios
-        todas_dev['Motivo do resultado'] = todas_dev.apply(categorizar_vazio, axis=1)
-        
-        motivos = todas_dev['Motivo do resultado'].value_counts()
-        total_com_motivo = motivos.sum()
-        
-        for motivo, count in motivos.items():
-            motivos_data.append({
-                'Motivo': str(motivo)[:50],
-                'Quantidade': int(count),
-                'Percentual (%)': round((count / total_com_motivo * 100), 1) if total_com_motivo > 0 else 0,
-            })
-    
-    return pd.DataFrame(motivos_data) if motivos_data else pd.DataFrame()
-
-def analisar_ads(vendas, matriz, full, max_date, dias_atras):
-    """
-    Análise de vendas por publicidade (Ads).
-    Os dados já chegam filtrados pelo cabeçalho global.
-    """
-    
-    if matriz is None:
-        matriz = pd.DataFrame()
-    if full is None:
-        full = pd.DataFrame()
-    
-    vendas_periodo = vendas.copy()
+    # Apenas as colunas usadas na análise (evita concatenar todas as colunas das devoluções)
+    colunas = ['Motivo do resultado', 'N.º de venda', 'Estado', 'Descrição do status', 'Tarifas de envio (BRL)',
+               'Cancelamentos e reembolsos (BRL)', 'Receita por produtos (BRL)']
+    partes = [df[[c for c in colunas if c in df.columns]] for df in (matriz, full) if df is not None and len(df) > 0]
+    todas_dev = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
     
-    # Criar mapa de devoluções
-    todas_dev = pd.concat([matriz, full], ignore_index=True)
-    dev_map = {}
+    if len(todas_dev) == 0 or 'Motivo do resultado' not in todas_dev.columns:
+        return None
     
-    if len(todas_dev) > 0 and 'N.º de venda' in todas_dev.columns:
-        for _, row in todas_dev.iterrows():
-            num_venda = str(row['N.º de venda'])
-            if num_venda not in dev_map:
-                dev_map[num_venda] = []
-            dev_map[num_venda].append(row)
+    # Motivos informados são mantidos; os vazios são inferidos pelo motor de regras
+    motivos_col = todas_dev['Motivo do resultado'].astype(str).str.strip()
+    vazio = motivos_col.isna() | motivos_col.isin(['', 'nan'])
     
-    # Análise por publicidade
-    ads_data = []
-    
-    if 'Venda por publicidade' in vendas_periodo.columns:
-        # Processar Ads (Sim)
-        vendas_pub = vendas_periodo[vendas_periodo['Venda por publicidade'] == 'Sim']
-        total_vendas = len(vendas_pub)
-        
-        if total_vendas > 0:
-            dev_count = 0
-            receita_total = 0.0
-            impacto_total = 0.0
-            
-            vendas_devolvidas = set()
-            for _, venda in vendas_pub.iterrows():
-                receita = venda.get('Receita por produtos (BRL)', 0)
-                if pd.isna(receita): receita = 0.0
-                receita_total += float(receita)
-                
-                num_venda = str(venda.get('N.º de venda', ''))
-                if num_venda in dev_map and num_venda not in vendas_devolvidas:
-                    vendas_devolvidas.add(num_venda)
-                    dev_count += 1
-                    for dev in dev_map[num_venda]:
-                        # Usar Cancelamentos e reembolsos para impacto real
-                        reembolso = dev.get('Cancelamentos e reembolsos (BRL)', None)
-                        if reembolso is None or pd.isna(reembolso):
-                            reembolso = 0.0
-                        reembolso = float(reembolso)
-                        if reembolso == 0:
-                            fallback = dev.get('Receita por produtos (BRL)', 0)
-                            if pd.isna(fallback): fallback = 0.0
-                            reembolso = float(fallback)
-                        impacto_total += reembolso
-            
-            taxa = (dev_count / total_vendas * 100) if total_vendas > 0 else 0
-            
-            ads_data.append({
-                'Tipo': 'Com Publicidade',
-                'Vendas': total_vendas,
-                'Devoluções': dev_count,
-                'Taxa (%)': round(taxa, 1),
-                'Receita (R$)': round(receita_total, 2),
-                'Impacto (R$)': round(-impacto_total, 2),
-            })
+    if vazio.any():
+        dev_vazias = todas_dev[vazio]
+        sem_coluna = pd.Series(np.nan, index=dev_vazias.index)
         
-        # Processar Orgânico (vazio ou não 'Sim')
-        vendas_pub = vendas_periodo[vendas_periodo['Venda por publicidade'] != 'Sim']
-        total_vendas = len(vendas_pub)
+        # Estado e status da venda correspondente: merge pela chave normalizada
+        # (vendas repetidas: vale a última linha, como no mapa por N.º de venda)
+        venda = pd.DataFrame({'estado_venda': sem_coluna, 'status_venda': sem_coluna})
+        if not vendas.empty and 'N.º de venda' in vendas.columns and 'N.º de venda' in dev_vazias.columns:
+            info_vendas = pd.DataFrame({
+                'chave': chave_venda(vendas['N.º de venda']).to_numpy(),
+                'estado_venda': vendas['Estado'].to_numpy() if 'Estado' in vendas.columns else '',
+                'status_venda': vendas['Descrição do status'].to_numpy() if 'Descrição do status' in vendas.columns else '',
+            }).drop_duplicates('chave', keep='last')
+            venda = pd.DataFrame({'chave': chave_venda(dev_vazias['N.º de venda']).to_numpy()}).merge(
+                info_vendas, on='chave', how='left'
+            )
         
-        if total_vendas > 0:
-            
-            dev_count = 0
-            receita_total = 0.0
-            impacto_total = 0.0
-            
-            vendas_devolvidas = set()
-            for _, venda in vendas_pub.iterrows():
-                receita = venda.get('Receita por produtos (BRL)', 0)
-                if pd.isna(receita): receita = 0.0
-                receita_total += float(receita)
-                
-                num_venda = str(venda.get('N.º de venda', ''))
-                if num_venda in dev_map and num_venda not in vendas_devolvidas:
-                    vendas_devolvidas.add(num_venda)
-                    dev_count += 1
-                    for dev in dev_map[num_venda]:
-                        # Usar Cancelamentos e reembolsos para impacto real
-                        reembolso = dev.get('Cancelamentos e reembolsos (BRL)', None)
-                        if reembolso is None or pd.isna(reembolso):
-                            reembolso = 0.0
-                        reembolso = float(reembolso)
-                        if reembolso == 0:
-                            fallback = dev.get('Receita por produtos (BRL)', 0)
-                            if pd.isna(fallback): fallback = 0.0
-                            reembolso = float(fallback)
-                        impacto_total += reembolso
-            
-            taxa = (dev_count / total_vendas * 100) if total_vendas > 0 else 0
-            
-            ads_data.append({
-                'Tipo': 'Orgânico',
-                'Vendas': total_vendas,
-                'Devoluções': dev_count,
-                'Taxa (%)': round(taxa, 1),
-                'Receita (R$)': round(receita_total, 2),
-                'Impacto (R$)': round(-impacto_total, 2),
-            })
-    
-    return pd.DataFrame(ads_data) if ads_data else pd.DataFrame()
+        motivos_col[vazio] = inferir_motivos(
+            estado_dev=dev_vazias.get('Estado', sem_coluna),
+            status_dev=dev_vazias.get('Descrição do status', sem_coluna),
+            estado_venda=venda['estado_venda'].to_numpy(),
+            status_venda=venda['status_venda'].to_numpy(),
+            # Se houve tarifa de envio negativa, é uma devolução física
+            tarifa_envio_negativa=(coluna_numerica(dev_vazias, 'Tarifas de envio (BRL)') < 0).to_numpy(),
+        )
+    
+    if 'N.º de venda' in todas_dev.columns:
+        chaves = chave_venda(todas_dev['N.º de venda'])
+    else:
+        chaves = pd.Series('', index=todas_dev.index)
+    
+    return pd.DataFrame({
+        'motivo': motivos_col,
+        'impacto': reembolso_devolucoes(todas_dev).abs(),
+        'chave': chaves,
+    })
 
-def analisar_skus(vendas, matriz, full, max_date, dias_atras, top_n=None, agrupar_por='SKU'):
+def analisar_motivos(vendas=None, matriz=None, full=None, max_date=None, dias_atras=0):
     """
-    Análise de SKUs ou Produtos com maior risco.
-    agrupar_por: 'SKU' ou 'Título do anúncio'
+    Análise de motivos de devolução cruzando com dados de vendas.
     """
     
-    if matriz is None:
-        matriz = pd.DataFrame()
-    if full is None:
-        full = pd.DataFrame()
-    
-    vendas_periodo = vendas.copy()
+    devolucoes = motivos_devolucoes(vendas, matriz, full)
+    if devolucoes is None:
+        return pd.DataFrame()
     
-    # Criar mapa de devoluções
-    todas_dev = pd.concat([matriz, full], ignore_index=True)
-    dev_map = {}
+    motivos = devolucoes['motivo'].value_counts()
+    total_com_motivo = motivos.sum()
     
-    if len(todas_dev) > 0 and 'N.º de venda' in todas_dev.columns:
-        for _, row in todas_dev.iterrows():
-            num_venda = str(row['N.º de venda'])
-            if num_venda not in dev_map:
-                dev_map[num_venda] = []
-            dev_map[num_venda].append(row)
-    
-    # Análise por SKU ou Título
-    skus_data = {}
+    return pd.DataFrame({
+        'Motivo': motivos.index.astype(str).str[:50],
+        'Quantidade': motivos.to_numpy().astype(int),
+        'Percentual (%)': _arredondar(pd.Series(motivos.to_numpy() / total_com_motivo * 100), 1),
+    })
+
+def analisar_ads(vendas, matriz, full, max_date, dias_atras, juncao=None):
+    """
+    Análise de vendas por publicidade (Ads).
+    Os dados já chegam filtrados pelo cabeçalho global.
+    """
     
-    # Determinar coluna de agrupamento
+    juncao = obter_juncao(vendas, matriz, full, juncao)
+    
+    if 'Venda por publicidade' not in vendas.columns or len(vendas) == 0:
+        return pd.DataFrame()
+    
+    # Ads ('Sim') x Orgânico (vazio ou não 'Sim')
+    tipos = vendas['Venda por publicidade'].eq('Sim').map({True: 'Com Publicidade', False: 'Orgânico'})
+    grupos = agregar_por(juncao, {'Tipo': tipos}).set_index('Tipo')
+    grupos = grupos.reindex([t for t in ('Com Publicidade', 'Orgânico') if t in grupos.index]).reset_index()
+    
+    return pd.DataFrame({
+        'Tipo': grupos['Tipo'],
+        'Vendas': grupos['vendas'],
+        'Devoluções': grupos['devolucoes'],
+        'Taxa (%)': _arredondar(grupos['taxa'], 1),
+        'Receita (R$)': _arredondar(grupos['receita'], 2),
+        # Usar Cancelamentos e reembolsos para impacto real
+        'Impacto (R$)': _arredondar(-grupos['reembolso'], 2),
+    })
+
+def coluna_itens(vendas, agrupar_por='SKU'):
+    """
+    Coluna de agrupamento por item ('SKU' ou 'Título do anúncio', com fallbacks)
+    e o valor de cada venda como texto ('N/A' para vazios).
+    """
     col_agrup = agrupar_por
-    if col_agrup not in vendas_periodo.columns:
+    if col_agrup not in vendas.columns:
         # Tentar fallback para 'Título' se 'Título do anúncio' não existir
-        if col_agrup == 'Título do anúncio' and 'Título' in vendas_periodo.columns:
+        if col_agrup == 'Título do anúncio' and 'Título' in vendas.columns:
             col_agrup = 'Título'
         else:
             col_agrup = 'SKU' # Fallback final
-        
-    for _, venda in vendas_periodo.iterrows():
-        item_id = str(venda.get(col_agrup, 'N/A'))
-        if pd.isna(venda.get(col_agrup)):
-            item_id = 'N/A'
-        
-        if item_id not in skus_data:
-            skus_data[item_id] = {
-                'vendas': 0,
-                'devolucoes': 0,
-                'receita': 0.0,
-                'impacto': 0.0,
-                'reembolso': 0.0,
-                'custo_dev': 0.0,
-                'vendas_devolvidas': set(),
-            }
-        
-        skus_data[item_id]['vendas'] += 1
-        
-        receita = venda.get('Receita por produtos (BRL)', 0)
-        if pd.isna(receita): receita = 0.0
-        skus_data[item_id]['receita'] += float(receita)
-        
-        num_venda = str(venda.get('N.º de venda', ''))
-        if num_venda in dev_map and num_venda not in skus_data[item_id]['vendas_devolvidas']:
-            skus_data[item_id]['vendas_devolvidas'].add(num_venda)
-            skus_data[item_id]['devolucoes'] += 1
-            
-            for dev in dev_map[num_venda]:
-                # Impacto: Cancelamentos e reembolsos
-                reemb = dev.get('Cancelamentos e reembolsos (BRL)', None)
-                if reemb is None or pd.isna(reemb):
-                    reemb = 0.0
-                reemb = float(reemb)
-                if reemb == 0:
-                    fallback = dev.get('Receita por produtos (BRL)', 0)
-                    if pd.isna(fallback): fallback = 0.0
-                    reemb = float(fallback)
-                skus_data[item_id]['impacto'] += reemb
-                skus_data[item_id]['reembolso'] += reemb
-                
-                # Custo de devolução (custos de envio)
-                custo = dev.get('Custos de envio (BRL)', None)
-                if custo is None or pd.isna(custo):
-                    custo = 0.0
-                skus_data[item_id]['custo_dev'] += float(custo)
     
-    # Calcular total de devoluções para concentração
-    total_devolucoes = sum(d['devolucoes'] for d in skus_data.values())
+    if col_agrup in vendas.columns:
+        itens = vendas[col_agrup].astype(str).where(vendas[col_agrup].notna(), 'N/A')
+    else:
+        itens = pd.Series('N/A', index=vendas.index)
+    return col_agrup, itens
+
+# Ordenações das sub-abas de Anúncios: critério -> (coluna, crescente)
+RANKINGS_SKUS = {
+    'volume': ('Dev.', False),
+    'taxa': ('Taxa', False),
+    'perda': ('Impacto', True),
+    'risco': ('Risco', False),
+}
+
+def _rank(valores, crescente):
+    """Posição de cada linha na ordenação (1 = primeiro); empates mantêm a ordem das linhas"""
+    valores = np.asarray(valores, dtype='float64')
+    ordem = np.argsort(valores if crescente else -valores, kind='stable')
+    rank = np.empty(len(valores), dtype='int64')
+    rank[ordem] = np.arange(1, len(valores) + 1)
+    return rank
+
+def analisar_skus(vendas, matriz, full, max_date, dias_atras, top_n=None, agrupar_por='SKU', juncao=None, ranks=False):
+    """
+    Análise de SKUs ou Produtos com maior risco.
+    agrupar_por: 'SKU' ou 'Título do anúncio'
+    ranks: adiciona as colunas rank_<critério> de RANKINGS_SKUS (usadas por selecionar_top)
+    """
     
-    # Converter para DataFrame
-    skus_list = []
-    for item_id, d in skus_data.items():
-        if d['devolucoes'] == 0:
-            continue
-        
-        taxa = (d['devolucoes'] / d['vendas'] * 100) if d['vendas'] > 0 else 0
-        score_risco = taxa * d['impacto'] / 100 if d['impacto'] > 0 else 0
-        
-        # Classificação
-        if taxa >= 15:
-            classe = 'Crítica'
-        elif taxa >= 8:
-            classe = 'Atenção'
-        else:
-            classe = 'Neutra'
-        
-        skus_list.append({
-            col_agrup: item_id,
-            'Vendas': d['vendas'],
-            'Dev.': d['devolucoes'],
-            'Taxa': round(taxa, 1),
-            'Impacto': round(-d['impacto'], 2),
-            'Reemb.': round(-abs(d['reembolso']), 2),
-            'Custo Dev.': round(-abs(d['custo_dev']), 2),
-            'Risco': round(score_risco, 3),
-            'Classe': classe,
-        })
-    
-    df_skus = pd.DataFrame(skus_list)
-    
-    if len(df_skus) > 0:
-        df_skus = df_skus.sort_values('Dev.', ascending=False)
-        if top_n is not None:
-            df_skus = df_skus.head(top_n)
+    juncao = obter_juncao(vendas, matriz, full, juncao)
+    
+    col_agrup, itens = coluna_itens(vendas, agrupar_por)
+    grupos = agregar_por(juncao, {col_agrup: itens})
+    
+    # Calcular total de devoluções para concentração
+    total_devolucoes = int(grupos['devolucoes'].sum())
+    
+    # Apenas itens com devolução, na ordem de aparição
+    grupos = grupos[grupos['devolucoes'] > 0].reset_index(drop=True)
+    if len(grupos) == 0:
+        return pd.DataFrame(), total_devolucoes
+    
+    # Impacto: Cancelamentos e reembolsos; custo de devolução: custos de envio
+    taxa = grupos['taxa']
+    impacto = grupos['reembolso']
+    score_risco = (taxa * impacto / 100).where(impacto > 0, 0.0)
+    
+    # Classificação
+    classe = np.select([taxa >= 15, taxa >= 8], ['Crítica', 'Atenção'], default='Neutra')
+    
+    df_skus = pd.DataFrame({
+        col_agrup: grupos[col_agrup],
+        'Vendas': grupos['vendas'],
+        'Dev.': grupos['devolucoes'],
+        'Taxa': _arredondar(taxa, 1),
+        'Impacto': _arredondar(-impacto, 2),
+        'Reemb.': _arredondar(-impacto.abs(), 2),
+        'Custo Dev.': _arredondar(-grupos['custo_dev'].abs(), 2),
+        'Risco': _arredondar(score_risco, 3),
+        'Classe': classe,
+    })
+    
+    if top_n is not None:
+        # Seleção parcial: não é preciso ordenar todos os itens para pegar os N primeiros
+        df_skus = df_skus.nlargest(top_n, 'Dev.', keep='first')
+    else:
+        df_skus = df_skus.sort_values('Dev.', ascending=False, kind='stable')
+    
+    if ranks:
+        for criterio, (coluna, crescente) in RANKINGS_SKUS.items():
+            df_skus[f'rank_{criterio}'] = _rank(df_skus[coluna], crescente)
     
     return df_skus, total_devolucoes
 
-def simular_reducao(vendas, matriz, full, max_date, dias_atras, reducao_percentual):
-    """Simula o impacto de redução na taxa de devolução"""
-    
-    if matriz is None:
-        matriz = pd.DataFrame()
-    if full is None:
-        full = pd.DataFrame()
-    
-    vendas_periodo = vendas.copy()
-    
-    # Criar mapa de devoluções
-    todas_dev = pd.concat([matriz, full], ignore_index=True)
-    dev_map = {}
-    
-    if len(todas_dev) > 0 and 'N.º de venda' in todas_dev.columns:
-        for _, row in todas_dev.iterrows():
-            num_venda = str(row['N.º de venda'])
-            if num_venda not in dev_map:
-                dev_map[num_venda] = []
-            dev_map[num_venda].append(row)
-    
-    vendas_totais = len(vendas_periodo)
-    faturamento_total = 0.0
-    if 'Receita por produtos (BRL)' in vendas_periodo.columns:
-        faturamento_total = float(vendas_periodo['Receita por produtos (BRL)'].fillna(0).sum())
-    
-    # Cenário atual
-    devolucoes_atuais = 0
-    impacto_atual = 0.0
-    
-    vendas_devolvidas = set()
-    for _, venda in vendas_periodo.iterrows():
-        num_venda = str(venda.get('N.º de venda', ''))
-        if num_venda in dev_map and num_venda not in vendas_devolvidas:
-            vendas_devolvidas.add(num_venda)
-            devolucoes_atuais += 1
-            for dev in dev_map[num_venda]:
-                reembolso = dev.get('Cancelamentos e reembolsos (BRL)', None)
-                if reembolso is None or pd.isna(reembolso):
-                    reembolso = 0.0
-                reembolso = float(reembolso)
-                if reembolso == 0:
-                    fallback = dev.get('Receita por produtos (BRL)', 0)
-                    if pd.isna(fallback): fallback = 0.0
-                    reembolso = float(fallback)
-                impacto_atual += reembolso
-    
-    taxa_atual = (devolucoes_atuais / vendas_totais * 100) if vendas_totais > 0 else 0
-    
-    # Cenário simulado
-    devolucoes_simuladas = int(devolucoes_atuais * (1 - reducao_percentual / 100))
-    impacto_simulado = impacto_atual * (1 - reducao_percentual / 100)
-    taxa_simulada = (devolucoes_simuladas / vendas_totais * 100) if vendas_totais > 0 else 0
-    
-    economia = impacto_atual - impacto_simulado
-    
-    return {
-        'vendas_totais': vendas_totais,
-        'faturamento_total': faturamento_total,
-        'cenario_atual': {
-            'devolucoes': devolucoes_atuais,
-            'taxa': taxa_atual,
-            'impacto': round(-impacto_atual, 2),
-        },
-        'cenario_simulado': {
-            'devolucoes': devolucoes_simuladas,
-            'taxa': round(taxa_simulada, 1),
-            'impacto': round(-impacto_simulado, 2),
-        },
-        'economia': round(economia, 2),
-        'reducao_percentual': reducao_percentual,
-    }
+def selecionar_top(df_skus, criterio, n=None, mascara=None):
+    """
+    Retorna os itens na ordem do critério de RANKINGS_SKUS usando a coluna rank_<critério>
+    pré-calculada (sem reordenar o DataFrame). mascara: filtro booleano opcional.
+    """
+    rank = df_skus[f'rank_{criterio}'].to_numpy()
+    # Permutação inversa do rank: posições das linhas já na ordem do critério
+    ordem = np.empty(len(rank), dtype='int64')
+    ordem[rank - 1] = np.arange(len(rank))
+    if mascara is not None:
+        ordem = ordem[np.asarray(mascara, dtype=bool)[ordem]]
+    if n is not None:
+        ordem = ordem[:n]
+    return df_skus.iloc[ordem]
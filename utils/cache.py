@@ -0,0 +1,178 @@
+"""
+Cache em disco dos uploads já processados.
+
+Cada par de arquivos (Vendas + Devoluções) é identificado pelo SHA-256 dos
+bytes enviados mais a versão do parser. Os DataFrames processados são gravados
+em Parquet e recarregados diretamente na próxima vez que os mesmos arquivos
+forem enviados, sem reprocessar o XML das planilhas.
+
+Entradas antigas são removidas (LRU por data de último acesso) quando o
+tamanho total do cache passa de CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from utils.parser import processar_arquivos, ler_bytes, como_lista, VERSAO_PARSER
+from utils.juncao import montar_juncoes, indexar_devolucoes, preparar_devolucoes
+from utils.filtros import preparar_indices
+from utils.esquema import preparar_para_parquet
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_DISPONIVEL = True
+except ImportError:
+    PARQUET_DISPONIVEL = False
+
+CACHE_DIR = os.environ.get('DASHBOARD_CACHE_DIR', os.path.join('.cache', 'uploads'))
+CACHE_MAX_BYTES = int(os.environ.get('DASHBOARD_CACHE_MAX_MB', '500')) * 1024 * 1024
+
+TABELAS = ('vendas', 'matriz', 'full')
+
+
+def chave_upload(file_vendas, file_devolucoes):
+    """
+    Gera a chave do cache: SHA-256 dos bytes de todos os arquivos + versão do parser.
+    file_vendas / file_devolucoes: um arquivo ou uma lista de arquivos
+    """
+    h = hashlib.sha256()
+    h.update(f'parser-v{VERSAO_PARSER}'.encode())
+    for files in (file_vendas, file_devolucoes):
+        files = como_lista(files)
+        # Prefixar a quantidade de arquivos e o tamanho de cada um evita colisões entre uploads concatenados
+        h.update(len(files).to_bytes(8, 'little'))
+        for file in files:
+            conteudo = ler_bytes(file)
+            h.update(len(conteudo).to_bytes(8, 'little'))
+            h.update(conteudo)
+    return h.hexdigest()
+
+
+def _tamanho_entrada(caminho):
+    return sum(os.path.getsize(os.path.join(caminho, f)) for f in os.listdir(caminho))
+
+
+def carregar_cache(chave):
+    """Retorna os dados processados do cache ou None se a chave não existir"""
+    if not PARQUET_DISPONIVEL:
+        return None
+
+    caminho = os.path.join(CACHE_DIR, chave)
+    meta_path = os.path.join(caminho, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+
+        data = {}
+        for tabela in TABELAS:
+            if tabela in meta['tabelas']:
+                data[tabela] = pd.read_parquet(os.path.join(caminho, f'{tabela}.parquet'))
+            else:
+                data[tabela] = None
+
+        # O índice de devoluções e a junção são derivados das tabelas e remontados em vez de armazenados
+        data['indice_devolucoes'] = indexar_devolucoes(data['vendas'], preparar_devolucoes(data['matriz'], data['full']))
+        data['juncoes'] = montar_juncoes(data['vendas'], indice=data['indice_devolucoes'])
+        data['indices'] = preparar_indices(data['vendas'], data['matriz'], data['full'])
+        data['max_date'] = pd.Timestamp(meta['max_date'])
+        data['esquema'] = meta.get('esquema')
+        data['qualidade'] = meta.get('qualidade')
+        data['ingestao'] = meta.get('ingestao')
+        data['total_vendas'] = len(data['vendas'])
+        data['total_matriz'] = len(data['matriz']) if data['matriz'] is not None else 0
+        data['total_full'] = len(data['full']) if data['full'] is not None else 0
+
+        # Marcar acesso para a política LRU
+        os.utime(caminho)
+        return data
+    except Exception:
+        # Entrada corrompida ou incompleta: descartar e reprocessar
+        shutil.rmtree(caminho, ignore_errors=True)
+        return None
+
+
+def salvar_cache(chave, data):
+    """Grava os dados processados no cache (melhor esforço: falhas não interrompem o app)"""
+    if not PARQUET_DISPONIVEL:
+        return
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        destino = os.path.join(CACHE_DIR, chave)
+        if os.path.exists(destino):
+            return
+
+        # Gravar em diretório temporário e renomear, para nunca expor uma entrada parcial
+        tmp = tempfile.mkdtemp(dir=CACHE_DIR, prefix='.tmp-')
+        try:
+            tabelas = []
+            for tabela in TABELAS:
+                df = data.get(tabela)
+                if df is not None:
+                    preparar_para_parquet(df).to_parquet(os.path.join(tmp, f'{tabela}.parquet'))
+                    tabelas.append(tabela)
+
+            meta = {
+                'versao_parser': VERSAO_PARSER,
+                'tabelas': tabelas,
+                'max_date': pd.Timestamp(data['max_date']).isoformat(),
+                'esquema': data.get('esquema'),
+                'qualidade': data.get('qualidade'),
+                'ingestao': data.get('ingestao'),
+            }
+            with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+            os.rename(tmp, destino)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        limpar_cache()
+    except OSError:
+        pass
+
+
+def limpar_cache(max_bytes=None):
+    """Remove as entradas menos recentemente usadas até o cache caber em max_bytes"""
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    entradas = []
+    for nome in os.listdir(CACHE_DIR):
+        caminho = os.path.join(CACHE_DIR, nome)
+        if nome.startswith('.') or not os.path.isdir(caminho):
+            continue
+        entradas.append((os.path.getmtime(caminho), _tamanho_entrada(caminho), caminho))
+
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, caminho in sorted(entradas):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(caminho, ignore_errors=True)
+        total -= tamanho
+
+
+def processar_arquivos_com_cache(file_vendas, file_devolucoes, chave=None):
+    """Igual a processar_arquivos, mas reaproveita o resultado de uploads já processados"""
+    if chave is None:
+        chave = chave_upload(file_vendas, file_devolucoes)
+
+    data = carregar_cache(chave)
+    if data is None:
+        data = processar_arquivos(file_vendas, file_devolucoes)
+        salvar_cache(chave, data)
+
+    # Identifica o dataset nos caches em memória (ex.: filtros já aplicados)
+    data['fingerprint'] = chave
+    return data
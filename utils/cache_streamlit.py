@@ -0,0 +1,205 @@
+"""
+Cache em memória do app para o pipeline do dashboard (compartilhado entre sessões).
+
+- Datasets processados: chaveados pelo fingerprint do upload (SHA-256 dos arquivos).
+- Dados filtrados: o LRU de utils.filtros.aplicar_filtros, chaveado por (fingerprint, filtros).
+- Resultados das análises: chaveados por (fingerprint, filtros, análise, canal, parâmetros)
+  e guardados serializados (pickle), então cada leitura devolve uma cópia, como no
+  st.cache_data. Os DataFrames nunca entram na chave.
+
+Datasets, filtros e resultados expiram após CACHE_TTL_SEGUNDOS (os filtros, pelo mesmo
+DASHBOARD_CACHE_TTL_MIN) e cada cache tem um limite de entradas. Os três caches dividem
+um orçamento de memória (CACHE_MEMORIA_MAX_BYTES), somado a partir dos bytes guardados
+em cada entrada viva: ao passar do limite, saem primeiro os resultados, depois os
+filtros e por fim os datasets menos usados. A soma e os descartes acontecem sob o mesmo
+lock, então sessões simultâneas não descartam a partir de um total desatualizado.
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from utils.cache import chave_upload, processar_arquivos_com_cache
+from utils.esquema import memoria
+from utils.filtros import (
+    aplicar_filtros, descartar_filtros, descartar_filtros_expirados, memoria_filtros, descartar_filtro_mais_antigo,
+)
+from utils.metricas import calcular_metricas, calcular_metricas_janelas
+from utils.analises import analisar_frete, analisar_motivos, analisar_ads, analisar_skus
+from utils.simulacao import simular_reducao_monte_carlo
+
+CACHE_TTL_SEGUNDOS = int(os.environ.get('DASHBOARD_CACHE_TTL_MIN', '60')) * 60
+CACHE_MAX_DATASETS = int(os.environ.get('DASHBOARD_CACHE_MAX_DATASETS', '4'))
+CACHE_MAX_RESULTADOS = int(os.environ.get('DASHBOARD_CACHE_MAX_RESULTADOS', '256'))
+CACHE_MEMORIA_MAX_BYTES = int(os.environ.get('DASHBOARD_CACHE_MEMORIA_MB', '1024')) * 1024 * 1024
+
+# Entradas {'valor', 'tamanho', 'criado'}, da menos para a mais recentemente usada
+_datasets = OrderedDict()    # fingerprint -> dataset processado
+_resultados = OrderedDict()  # (filtros, análise, canal, parâmetros) -> resultado em pickle
+_lock = threading.Lock()
+
+
+def tamanho_dataset(data):
+    """Estima a memória ocupada pelos DataFrames de um dataset processado"""
+    frames = [data.get(tabela) for tabela in ('vendas', 'matriz', 'full')]
+    frames += list(data.get('juncoes', {}).values())
+    return sum(memoria(df) for df in frames)
+
+
+def _ler(cache, chave, agora, descartar=None):
+    """
+    Entrada viva do cache (marcada como usada) ou None; entradas expiradas são removidas
+    (descartar: função chamada com a chave no lugar de apenas remover a entrada)
+    """
+    entrada = cache.get(chave)
+    if entrada is None:
+        return None
+    if agora - entrada['criado'] > CACHE_TTL_SEGUNDOS:
+        if descartar is not None:
+            descartar(chave)
+        else:
+            del cache[chave]
+        return None
+    cache.move_to_end(chave)
+    return entrada
+
+
+def _guardar(cache, chave, valor, tamanho, max_entradas):
+    """Guarda a entrada e retorna as chaves removidas pelo limite de entradas"""
+    cache[chave] = {'valor': valor, 'tamanho': tamanho, 'criado': time.monotonic()}
+    cache.move_to_end(chave)
+    removidas = []
+    while len(cache) > max_entradas:
+        removidas.append(cache.popitem(last=False)[0])
+    return removidas
+
+
+def _memoria_em_cache():
+    # Chamado com _lock adquirido
+    total = sum(e['tamanho'] for e in _datasets.values()) + sum(e['tamanho'] for e in _resultados.values())
+    return total + memoria_filtros()
+
+
+def memoria_em_cache():
+    """Bytes ocupados pelos datasets, filtros e resultados vivos em cache"""
+    with _lock:
+        return _memoria_em_cache()
+
+
+def _descartar_dataset(fingerprint):
+    _datasets.pop(fingerprint, None)
+    for chave in [chave for chave in _resultados if chave[0][0] == fingerprint]:
+        del _resultados[chave]
+    descartar_filtros(fingerprint)
+
+
+def _purgar_expirados(agora):
+    """Remove datasets (com seus filtros e resultados), filtros e resultados que passaram do TTL"""
+    for fingerprint in [fp for fp, e in _datasets.items() if agora - e['criado'] > CACHE_TTL_SEGUNDOS]:
+        _descartar_dataset(fingerprint)
+    for chave in [chave for chave, e in _resultados.items() if agora - e['criado'] > CACHE_TTL_SEGUNDOS]:
+        del _resultados[chave]
+    descartar_filtros_expirados(agora)
+
+
+def _respeitar_orcamento(fingerprint_atual):
+    """Descarta resultados, filtros e datasets (nesta ordem, LRU) até caber no orçamento de memória"""
+    with _lock:
+        total = _memoria_em_cache()
+        while total > CACHE_MEMORIA_MAX_BYTES and _resultados:
+            total -= _resultados.popitem(last=False)[1]['tamanho']
+        while total > CACHE_MEMORIA_MAX_BYTES:
+            liberado = descartar_filtro_mais_antigo()
+            if liberado == 0:
+                break
+            total -= liberado
+        for fingerprint in list(_datasets):
+            if total <= CACHE_MEMORIA_MAX_BYTES:
+                break
+            if fingerprint == fingerprint_atual:
+                continue
+            total -= _datasets[fingerprint]['tamanho']
+            _descartar_dataset(fingerprint)
+
+
+def carregar_dataset(file_vendas, file_devolucoes):
+    """Processa os uploads (ou reaproveita o resultado em memória/disco) e retorna o dataset"""
+    fingerprint = chave_upload(file_vendas, file_devolucoes)
+    with _lock:
+        _purgar_expirados(time.monotonic())
+        entrada = _ler(_datasets, fingerprint, time.monotonic(), descartar=_descartar_dataset)
+    if entrada is not None:
+        return entrada['valor']
+
+    data = processar_arquivos_com_cache(file_vendas, file_devolucoes, chave=fingerprint)
+    with _lock:
+        # Datasets que saem pelo limite de entradas levam junto seus filtros e resultados
+        for removido in _guardar(_datasets, fingerprint, data, tamanho_dataset(data), CACHE_MAX_DATASETS):
+            _descartar_dataset(removido)
+    _respeitar_orcamento(fingerprint)
+    return data
+
+
+def filtrar(data, janela, canal, somente_ads, top10_skus, agrupar_por='SKU'):
+    """aplicar_filtros (com o cache por (fingerprint, filtros) de utils.filtros), dentro do orçamento de memória"""
+    resultado = aplicar_filtros(data, janela, canal, somente_ads, top10_skus, agrupar_por=agrupar_por)
+    if data.get('fingerprint') is not None:
+        _respeitar_orcamento(data['fingerprint'])
+    return resultado
+
+
+def _argumentos(data, canal):
+    """Recorta (vendas, matriz, full, max_date, juncao) para o canal pedido (None = filtro global)"""
+    if canal == 'Matriz':
+        return data['vendas'], data['matriz'], None, data['max_date'], data['juncao_matriz']
+    if canal == 'Full':
+        return data['vendas'], None, data['full'], data['max_date'], data['juncao_full']
+    return data['vendas'], data['matriz'], data['full'], data['max_date'], data['juncao']
+
+
+def _calcular(analise, canal, parametros, data):
+    vendas, matriz, full, max_date, juncao = _argumentos(data, canal)
+    janela = data['filtros'][1]
+    parametros = dict(parametros)
+
+    if analise == 'metricas':
+        return calcular_metricas(vendas, matriz, full, max_date, janela, juncao=juncao)
+    if analise == 'metricas_janelas':
+        return calcular_metricas_janelas(vendas, juncao, max_date, parametros['janelas'])
+    if analise == 'skus':
+        return analisar_skus(vendas, matriz, full, max_date, janela, juncao=juncao, **parametros)
+    if analise == 'frete':
+        return analisar_frete(vendas, matriz, full, max_date, janela, juncao=juncao, **parametros)
+    if analise == 'motivos':
+        return analisar_motivos(vendas, matriz, full, max_date, janela)
+    if analise == 'ads':
+        return analisar_ads(vendas, matriz, full, max_date, janela, juncao=juncao)
+    if analise == 'simulacao':
+        return simular_reducao_monte_carlo(vendas, matriz, full, max_date, janela, juncao=juncao, **parametros)
+    raise ValueError(f"Análise desconhecida: {analise}")
+
+
+def calcular(data, analise, canal=None, **parametros):
+    """
+    Executa uma análise sobre dados já filtrados, com cache por (fingerprint, filtros, análise, canal, parâmetros).
+    analise: 'metricas', 'metricas_janelas', 'skus', 'frete', 'motivos', 'ads' ou 'simulacao'
+    canal: None (filtro global), 'Matriz' ou 'Full'
+    """
+    parametros = tuple(sorted(parametros.items()))
+    if data.get('fingerprint') is None:
+        return _calcular(analise, canal, parametros, data)
+
+    chave = (data['filtros'], analise, canal, parametros)
+    with _lock:
+        entrada = _ler(_resultados, chave, time.monotonic())
+    if entrada is not None:
+        return pickle.loads(entrada['valor'])
+
+    resultado = _calcular(analise, canal, parametros, data)
+    serializado = pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL)
+    with _lock:
+        _guardar(_resultados, chave, serializado, len(serializado), CACHE_MAX_RESULTADOS)
+    _respeitar_orcamento(data['fingerprint'])
+    return resultado
@@ -0,0 +1,153 @@
+"""
+Normalização do esquema das planilhas após a leitura.
+
+O Excel chega com todo texto como string e todo número como float64. Esta
+etapa compacta cada tabela antes de ela ficar em memória (uma cópia por
+dataset em cache):
+- colunas de texto repetitivo (Forma de entrega, Estado, SKU...) viram category;
+- o restante do texto vira string com armazenamento Arrow;
+- N.º de venda vira int64 quando todos os valores são inteiros;
+- colunas com números e células em branco (ex.: Unidades.1) viram numéricas
+  (Int64 quando inteiras), e as demais colunas misturadas viram texto, com os
+  mesmos tipos que o cache em Parquet devolve;
+- valores em R$ que as análises não somam viram float32 (apenas se nenhum
+  centavo se perde); os usados nos cálculos continuam float64, para que os
+  totais não mudem.
+Nenhuma coluna é descartada: dados do comprador e de rastreamento, que as
+análises não usam, continuam nas bases brutas exportadas, como texto compacto.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Colunas lidas pelas análises: se numéricas, mantidas em float64
+COLUNAS_ANALISE = {
+    'N.º de venda', 'Data da venda', 'Estado', 'Descrição do status', 'Unidades',
+    'Receita por produtos (BRL)', 'Receita por envio (BRL)', 'Tarifas de envio (BRL)',
+    'Tarifa de venda e impostos (BRL)', 'Cancelamentos e reembolsos (BRL)', 'Custos de envio (BRL)',
+    'Venda por publicidade', 'SKU', 'Título do anúncio', 'Título', 'Estado.1', 'Forma de entrega',
+    'Motorista', 'Motivo do resultado',
+}
+
+# Texto vira category quando há no máximo esta fração de valores distintos
+FRACAO_MAX_CATEGORIAS = 0.5
+
+try:
+    # Texto com armazenamento Arrow e NaN como vazio (o tipo 'str' do pandas 3)
+    TIPO_TEXTO = pd.StringDtype('pyarrow', na_value=np.nan)
+except TypeError:
+    # pandas < 2.3: o texto continua como object
+    TIPO_TEXTO = None
+
+
+def _e_texto(serie):
+    if serie.dtype == object:
+        return serie.dropna().map(type).eq(str).all()
+    return isinstance(serie.dtype, pd.StringDtype)
+
+
+def _compactar_ids(serie):
+    """N.º de venda em int64 quando todos os valores (numéricos ou texto) são inteiros"""
+    if pd.api.types.is_integer_dtype(serie) or serie.isna().any():
+        return serie
+    numeros = pd.to_numeric(serie, errors='coerce')
+    if numeros.isna().any() or not np.array_equal(numeros, np.floor(numeros)):
+        return serie
+    # Texto com zeros à esquerda mudaria a chave do cruzamento
+    if not pd.api.types.is_numeric_dtype(serie) and not serie.astype(str).eq(numeros.astype('int64').astype(str)).all():
+        return serie
+    return numeros.astype('int64')
+
+
+def _compactar_misturada(serie):
+    """
+    Coluna object com tipos misturados: números com células em branco viram numéricos
+    (Int64 quando inteiros); o restante vira texto, como em preparar_para_parquet
+    """
+    em_branco = serie.map(lambda v: isinstance(v, str) and not v.strip())
+    numeros = pd.to_numeric(serie.mask(em_branco), errors='coerce')
+    if numeros.count() == serie.count() - em_branco.sum():
+        validos = numeros.dropna()
+        return numeros.astype('Int64' if np.array_equal(validos, np.floor(validos)) else 'float64')
+    return serie.where(serie.isna(), serie.astype(str))
+
+
+def _compactar_valores(serie):
+    """float32 quando o valor arredondado aos centavos é o mesmo"""
+    reduzida = serie.astype('float32')
+    if np.allclose(reduzida.astype('float64').round(2), serie, rtol=0, atol=1e-9, equal_nan=True):
+        return reduzida
+    return serie
+
+
+def compactar_esquema(df):
+    """
+    Aplica os tipos compactos a uma tabela (vendas, matriz ou full).
+    Retorna a nova tabela; a original não é alterada.
+    """
+    colunas = {}
+    for col in df.columns:
+        serie = df[col]
+        if col != 'N.º de venda' and serie.dtype == object and not _e_texto(serie):
+            serie = _compactar_misturada(serie)
+        if col == 'N.º de venda':
+            serie = _compactar_ids(serie)
+        elif pd.api.types.is_float_dtype(serie):
+            if col not in COLUNAS_ANALISE:
+                serie = _compactar_valores(serie)
+        elif _e_texto(serie):
+            preenchidos = serie.count()
+            if preenchidos > 0 and serie.nunique() <= FRACAO_MAX_CATEGORIAS * preenchidos:
+                serie = serie.astype('category')
+            elif TIPO_TEXTO is not None:
+                serie = serie.astype(TIPO_TEXTO)
+        colunas[col] = serie
+
+    return pd.DataFrame(colunas, index=df.index)
+
+
+def restaurar_valores(df):
+    """Volta as colunas float32 para float64 arredondado aos centavos (ex.: para exportar)"""
+    reduzidas = [col for col in df.columns if df[col].dtype == 'float32']
+    if not reduzidas:
+        return df
+    return df.assign(**{col: df[col].astype('float64').round(2) for col in reduzidas})
+
+
+def preparar_para_parquet(df):
+    """Converte colunas object com tipos misturados para texto (o Arrow exige um tipo por coluna)"""
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            tipos = df[col].dropna().map(type).unique()
+            if len(tipos) > 1:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def memoria(df):
+    """Bytes ocupados pela tabela (incluindo o conteúdo dos textos)"""
+    return int(df.memory_usage(deep=True).sum()) if df is not None else 0
+
+
+def normalizar_tabelas(vendas, matriz, full):
+    """
+    Compacta vendas, matriz e full.
+    Retorna (vendas, matriz, full, relatorio), com os bytes antes/depois de cada tabela.
+    """
+    relatorio = {}
+    tabelas = []
+    for nome, df in (('vendas', vendas), ('matriz', matriz), ('full', full)):
+        if df is None:
+            tabelas.append(None)
+            continue
+        antes = memoria(df)
+        df = compactar_esquema(df)
+        relatorio[nome] = {'antes': antes, 'depois': memoria(df)}
+        tabelas.append(df)
+
+    por_tabela = list(relatorio.values())
+    relatorio['antes'] = sum(t['antes'] for t in por_tabela)
+    relatorio['depois'] = sum(t['depois'] for t in por_tabela)
+    return (*tabelas, relatorio)
@@ -1,60 +1,226 @@
-import pandas as pd
-from io import BytesIO
+import gzip
+import io
+import json
+import math
+import zipfile
 from datetime import datetime
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from utils.metricas import calcular_metricas, calcular_qualidade_arquivo
+from io import BytesIO
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from utils.metricas import calcular_metricas
 from utils.analises import analisar_skus, analisar_motivos, analisar_frete
+from utils.esquema import restaurar_valores, preparar_para_parquet
+from utils.qualidade import obter_qualidade, linhas_qualidade
+from utils.cache import PARQUET_DISPONIVEL
+
+# Limite de linhas de uma aba do Excel (incluindo o cabeçalho)
+LIMITE_LINHAS_EXCEL = 1_048_576
+# Linhas convertidas por vez ao escrever as bases: a memória fica limitada a um bloco
+TAMANHO_BLOCO = 10_000
+
+# Nível do gzip dos CSVs: metade do tempo do nível 6, com arquivos cerca de 20% maiores
+NIVEL_GZIP = 3
+# Filtros gravados no manifesto (data['filtros'] começa pelo fingerprint)
+CAMPOS_FILTROS = ('janela', 'canal', 'somente_ads', 'top10_skus', 'agrupar_por')
+
+# Linhas usadas para medir a largura das colunas (amostra fixa, não a tabela inteira)
+AMOSTRA_LARGURAS = 1_000
+
+# Estilos nomeados do relatório: criados uma vez por workbook e aplicados por coluna
+ESTILOS = {
+    'cabecalho': {
+        'bold': True, 'font_color': '#FFFFFF', 'font_size': 12, 'bg_color': '#1F4E78',
+        'align': 'center', 'valign': 'vcenter',
+    },
+    'moeda': {'num_format': 'R$ #,##0.00'},
+    'percentual': {'num_format': '0.00%'},
+}
+
+
+def criar_formatos(workbook):
+    """Formatos do workbook para cada estilo nomeado (ESTILOS)"""
+    return {nome: workbook.add_format(estilo) for nome, estilo in ESTILOS.items()}
+
+
+def _colunas(frames):
+    """União das colunas das tabelas, na ordem de aparição (como no pd.concat)"""
+    colunas = []
+    for df in frames:
+        colunas += [col for col in df.columns if col not in colunas]
+    return colunas
+
+
+def larguras_colunas(frames, colunas, amostra=AMOSTRA_LARGURAS):
+    """
+    Largura de cada coluna com base no conteúdo (maior texto + 2, no máximo 60),
+    medida no DataFrame antes da escrita, sobre no máximo 'amostra' linhas de cada tabela.
+    """
+    amostras = [df.sample(amostra, random_state=0) if len(df) > amostra else df for df in frames]
+    larguras = []
+    for col in colunas:
+        maior = len(str(col))
+        for df in amostras:
+            textos = df[col].dropna().astype(str) if col in df.columns else ()
+            if len(textos) > 0:
+                maior = max(maior, int(textos.str.len().max()))
+        larguras.append(min(maior + 2, 60))
+    return larguras
+
+
+def estilizar_colunas(ws, larguras, estilos, formatos):
+    """Largura e formato numérico por coluna (O(colunas)): vale para toda célula escrita sem formato próprio"""
+    for j, largura in enumerate(larguras):
+        estilo = estilos.get(j + 1)
+        ws.set_column(j, j, largura, formatos[estilo] if estilo else None)
+
+
+def _blocos(frames, colunas):
+    """Blocos de até TAMANHO_BLOCO linhas das tabelas, em sequência, com as colunas em 'colunas'"""
+    for df in frames:
+        for inicio in range(0, len(df), TAMANHO_BLOCO):
+            yield restaurar_valores(df.iloc[inicio:inicio + TAMANHO_BLOCO]).reindex(columns=colunas)
+
+
+def _linhas(frames, colunas):
+    """Linhas das tabelas, em sequência, como listas de valores Python (vazios como None)"""
+    for bloco in _blocos(frames, colunas):
+        bloco = bloco.astype(object)
+        yield from bloco.where(bloco.notna(), None).to_numpy().tolist()
+
+
+def escrever_tabela(workbook, nome, frames, formatos, monetarias=(), percentuais=(), progresso=None):
+    """
+    Escreve uma ou mais tabelas (em sequência) linha a linha, sem manter a planilha em memória.
+    Acima do limite do Excel, as linhas continuam em novas abas: 'Nome (2)', 'Nome (3)'...
+    monetarias / percentuais: colunas (a partir de 1) formatadas como R$ / %
+    progresso: função chamada com o total de linhas já escritas a cada TAMANHO_BLOCO linhas
+    Retorna a lista de abas criadas.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    colunas = _colunas(frames)
+    larguras = larguras_colunas(frames, colunas)
+    estilos = {col: 'moeda' for col in monetarias}
+    estilos.update({col: 'percentual' for col in percentuais})
+
+    linhas = _linhas(frames, colunas)
+    por_aba = LIMITE_LINHAS_EXCEL - 1
+    total = sum(len(df) for df in frames)
+    abas = []
+    for parte in range(max(1, math.ceil(total / por_aba))):
+        ws = workbook.add_worksheet(nome if parte == 0 else f'{nome} ({parte + 1})')
+        estilizar_colunas(ws, larguras, estilos, formatos)
+        ws.write_row(0, 0, [str(col) for col in colunas], formatos['cabecalho'])
+        for i, valores in enumerate(islice(linhas, por_aba), start=1):
+            ws.write_row(i, 0, valores)
+            if progresso is not None and i % TAMANHO_BLOCO == 0:
+                progresso(parte * por_aba + i)
+        abas.append(ws)
+    return abas
+
+
+COLUNAS_QUALIDADE = ['INDICADOR DE QUALIDADE', 'OCORRÊNCIAS', 'PERCENTUAL DE FALHA']
+
+# Itens na aba de ranking do export (recorte do ranking completo da aba SKUs)
+TOP_SKUS_EXPORT = 50
+
+
+def analises_export(data):
+    """
+    Resultados usados pelo export: chave no pacote -> (análise, parâmetros), com os mesmos
+    parâmetros das abas do dashboard, para reaproveitar o que cache_streamlit.calcular já tem
+    (SKUs: ranking completo com ranks, como na aba SKUs; Frete: visão padrão da aba Frete)
+    """
+    agrupar_por = data['filtros'][5] if data.get('filtros') else 'SKU'
+    return {
+        'metricas': ('metricas', {}),
+        'skus': ('skus', {'agrupar_por': agrupar_por, 'ranks': True}),
+        'motivos': ('motivos', {}),
+        'frete': ('frete', {'dimensoes': ('Forma de Entrega',)}),
+    }
+
+
+def _calcular_direto(data, analise, **parametros):
+    """Calcula uma análise do export sobre os dados filtrados, sem cache"""
+    vendas, matriz, full = data['vendas'], data['matriz'], data['full']
+    max_date, juncao = data['max_date'], data.get('juncao')
+    # Os dados já chegam filtrados: a janela é repassada apenas por compatibilidade
+    janela = data['filtros'][1] if data.get('filtros') else 180
 
-def aplicar_estilo_cabecalho(sheet, columns_count):
-    """Aplica estilo profissional ao cabeçalho da planilha"""
-    header_fill = PatternFill(start_color='1F4E78', end_color='1F4E78', fill_type='solid')
-    header_font = Font(color='FFFFFF', bold=True, size=12)
-    alignment = Alignment(horizontal='center', vertical='center')
+    if analise == 'metricas':
+        return calcular_metricas(vendas, matriz, full, max_date, janela, juncao=juncao)
+    if analise == 'skus':
+        return analisar_skus(vendas, matriz, full, max_date, janela, juncao=juncao, **parametros)
+    if analise == 'motivos':
+        return analisar_motivos(vendas, matriz, full, max_date, janela)
+    if analise == 'frete':
+        return analisar_frete(vendas, matriz, full, max_date, janela, juncao=juncao, **parametros)
+    raise ValueError(f"Análise desconhecida: {analise}")
+
+
+def resultados_export(data, resultados=None, calcular=None):
+    """
+    Pacote de resultados do export: 'metricas', 'skus', 'motivos', 'frete' e 'qualidade'.
+    resultados: resultados já calculados pelo dashboard (reaproveitados como estão)
+    calcular: função (data, analise, **parametros) usada para o que faltar; no app,
+    cache_streamlit.calcular, que devolve o resultado em cache quando a aba já o calculou
+    """
+    calcular = calcular or _calcular_direto
+    pacote = dict(resultados or {})
+    for chave, (analise, parametros) in analises_export(data).items():
+        if pacote.get(chave) is None:
+            pacote[chave] = calcular(data, analise, **parametros)
+    
+    # Ranking exportado: os primeiros itens do ranking da aba, sem as colunas de rank
+    df_skus, total_devolucoes = pacote['skus']
+    df_skus = df_skus.head(TOP_SKUS_EXPORT)
+    pacote['skus'] = (df_skus.drop(columns=[col for col in df_skus.columns if col.startswith('rank_')]), total_devolucoes)
+    if pacote.get('qualidade') is None:
+        # Perfil calculado uma única vez na leitura dos arquivos
+        pacote['qualidade'] = obter_qualidade(data)
+    return pacote
+
+
+def exportar_xlsx(data, resultados=None, calcular=None, progresso=None):
+    """
+    Exporta os resultados para um arquivo XLSX com análises profundas e visual amigável.
+    resultados / calcular: ver resultados_export (só o que faltar no pacote é calculado)
+    progresso: função (fração de 0 a 1, etapa) chamada ao longo da escrita
+    """
     
-    for col in range(1, columns_count + 1):
-        cell = sheet.cell(row=1, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = alignment
-
-def ajustar_largura_colunas(sheet):
-    """Ajusta a largura das colunas com base no conteúdo"""
-    for col in sheet.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        sheet.column_dimensions[column].width = min(adjusted_width, 60)
-
-def formatar_valores_excel(sheet, columns_monetarias, columns_percentuais):
-    """Aplica formatos numéricos do Excel para valores monetários e percentuais"""
-    for row in range(2, sheet.max_row + 1):
-        for col in columns_monetarias:
-            cell = sheet.cell(row=row, column=col)
-            cell.number_format = 'R$ #,##0.00'
-        for col in columns_percentuais:
-            cell = sheet.cell(row=row, column=col)
-            cell.number_format = '0.00%'
-
-def exportar_xlsx(data):
-    """Exporta os resultados para um arquivo XLSX com análises profundas e visual amigável"""
+    def avisar(fracao, etapa):
+        if progresso is not None:
+            progresso(fracao, etapa)
     
     vendas = data['vendas']
     matriz = data['matriz'] if data['matriz'] is not None else pd.DataFrame()
     full = data['full'] if data['full'] is not None else pd.DataFrame()
-    max_date = data['max_date']
+    avisar(0.0, 'Análises')
+    resultados = resultados_export(data, resultados, calcular)
+    
+    # As bases dominam o tempo de escrita: 10% para as análises, o restante por linha das bases
+    linhas_bases = max(1, len(vendas) + len(matriz) + len(full))
+    def avisar_linhas(inicio, etapa):
+        return lambda escritas: avisar(0.1 + 0.9 * (inicio + escritas) / linhas_bases, etapa)
     
     output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
+    # constant_memory: cada linha vai para um arquivo temporário assim que a próxima começa
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'strings_to_urls': False,
+        'nan_inf_to_errors': True,
+        'remove_timezone': True,
+        'default_date_format': 'dd/mm/yyyy hh:mm',
+    })
+    formatos = criar_formatos(workbook)
     
     # 1. ABA RESUMO EXECUTIVO
-    metricas_total = calcular_metricas(vendas, matriz, full, max_date, 180)
+    avisar(0.05, 'Resumo e análises')
+    metricas_total = resultados['metricas']
     
     resumo_data = [
         ['MÉTRICA DE DESEMPENHO', 'VALOR ATUAL'],
@@ -76,77 +242,172 @@ def exportar_xlsx(data):
         ['Devoluções Neutras', metricas_total['neutras']],
     ]
     
+    ws_resumo = workbook.add_worksheet('Resumo Executivo')
     df_resumo = pd.DataFrame(resumo_data[1:], columns=resumo_data[0])
-    df_resumo.to_excel(writer, sheet_name='Resumo Executivo', index=False)
-    
-    ws_resumo = writer.sheets['Resumo Executivo']
-    aplicar_estilo_cabecalho(ws_resumo, 2)
-    # Formatação manual para estrutura vertical
-    for row in [3, 4, 8, 10, 11, 12]:
-        ws_resumo.cell(row=row, column=2).number_format = 'R$ #,##0.00'
-    ws_resumo.cell(row=7, column=2).number_format = '0.00%'
-    ajustar_largura_colunas(ws_resumo)
+    estilizar_colunas(ws_resumo, larguras_colunas([df_resumo], df_resumo.columns), {}, formatos)
+    ws_resumo.write_row(0, 0, resumo_data[0], formatos['cabecalho'])
+    # Formatação manual para estrutura vertical (linhas do Excel, a partir de 1)
+    formato_linha = {row: formatos['moeda'] for row in [3, 4, 8, 10, 11, 12]}
+    formato_linha[7] = formatos['percentual']
+    for i, (metrica, valor) in enumerate(resumo_data[1:], start=1):
+        ws_resumo.write(i, 0, metrica)
+        ws_resumo.write(i, 1, valor, formato_linha.get(i + 1))
 
     # 2. ABA RANKING DE SKUS (TOP 50)
-    df_skus, _ = analisar_skus(vendas, matriz, full, max_date, 180, top_n=50)
+    df_skus, _ = resultados['skus']
     if not df_skus.empty:
-        df_skus.to_excel(writer, sheet_name='Ranking de SKUs', index=False)
-        ws_skus = writer.sheets['Ranking de SKUs']
-        aplicar_estilo_cabecalho(ws_skus, len(df_skus.columns))
-        formatar_valores_excel(ws_skus, [5, 6, 7], [4])
-        ajustar_largura_colunas(ws_skus)
+        escrever_tabela(workbook, 'Ranking de SKUs', df_skus, formatos, monetarias=[5, 6, 7], percentuais=[4])
 
     # 3. ABA MOTIVOS DE DEVOLUÇÃO
-    df_motivos = analisar_motivos(vendas, matriz, full, max_date, 180)
+    df_motivos = resultados['motivos']
     if not df_motivos.empty:
-        df_motivos.to_excel(writer, sheet_name='Motivos de Devolução', index=False)
-        ws_motivos = writer.sheets['Motivos de Devolução']
-        aplicar_estilo_cabecalho(ws_motivos, len(df_motivos.columns))
-        formatar_valores_excel(ws_motivos, [], [3])
-        ajustar_largura_colunas(ws_motivos)
+        escrever_tabela(workbook, 'Motivos de Devolução', df_motivos, formatos, percentuais=[3])
 
     # 4. ABA ANÁLISE DE LOGÍSTICA
-    df_frete = analisar_frete(vendas, matriz, full, max_date, 180)
+    df_frete = resultados['frete']
     if not df_frete.empty:
-        df_frete.to_excel(writer, sheet_name='Análise de Logística', index=False)
-        ws_frete = writer.sheets['Análise de Logística']
-        aplicar_estilo_cabecalho(ws_frete, len(df_frete.columns))
-        formatar_valores_excel(ws_frete, [5], [4])
-        ajustar_largura_colunas(ws_frete)
+        escrever_tabela(workbook, 'Análise de Logística', df_frete, formatos, monetarias=[5], percentuais=[4])
 
     # 5. ABA QUALIDADE DOS DADOS
-    qualidade = calcular_qualidade_arquivo(data)
-    qualidade_rows = [
-        ['INDICADOR DE QUALIDADE', 'PERCENTUAL DE FALHA'],
-        ['Vendas: SKUs não identificados', qualidade['vendas']['sem_sku_pct'] / 100],
-        ['Vendas: Datas ausentes', qualidade['vendas']['sem_data_pct'] / 100],
-        ['Vendas: N.º de venda ausente', qualidade['vendas']['sem_numero_venda_pct'] / 100],
-        ['Devoluções Matriz: Sem motivo informado', qualidade['matriz']['sem_motivo_pct'] / 100],
-        ['Devoluções Matriz: Sem estado do produto', qualidade['matriz']['sem_estado_pct'] / 100],
-        ['Devoluções Full: Sem motivo informado', qualidade['full']['sem_motivo_pct'] / 100],
-        ['Devoluções Full: Sem estado do produto', qualidade['full']['sem_estado_pct'] / 100],
-    ]
-    pd.DataFrame(qualidade_rows[1:], columns=qualidade_rows[0]).to_excel(writer, sheet_name='Qualidade dos Dados', index=False)
-    ws_qual = writer.sheets['Qualidade dos Dados']
-    aplicar_estilo_cabecalho(ws_qual, 2)
-    formatar_valores_excel(ws_qual, [], [2])
-    ajustar_largura_colunas(ws_qual)
-
-    # 6. ABA DADOS BRUTOS (VENDAS)
-    vendas_export = vendas.head(2000)
-    vendas_export.to_excel(writer, sheet_name='Base de Vendas', index=False)
-    ws_vendas = writer.sheets['Base de Vendas']
-    aplicar_estilo_cabecalho(ws_vendas, len(vendas_export.columns))
-    ajustar_largura_colunas(ws_vendas)
-
-    # 7. ABA DEVOLUÇÕES (CONSOLIDADO)
-    devolucoes_raw = pd.concat([matriz, full], ignore_index=True)
-    if not devolucoes_raw.empty:
-        devolucoes_raw.to_excel(writer, sheet_name='Base de Devoluções', index=False)
-        ws_dev = writer.sheets['Base de Devoluções']
-        aplicar_estilo_cabecalho(ws_dev, len(devolucoes_raw.columns))
-        ajustar_largura_colunas(ws_dev)
-
-    writer.close()
+    df_qualidade = pd.DataFrame(linhas_qualidade(resultados['qualidade']), columns=COLUNAS_QUALIDADE)
+    escrever_tabela(workbook, 'Qualidade dos Dados', df_qualidade, formatos, percentuais=[3])
+
+    # 6. ABA DADOS BRUTOS (VENDAS): base completa, dividida em abas acima do limite do Excel
+    avisar(0.1, 'Base de Vendas')
+    escrever_tabela(workbook, 'Base de Vendas', vendas, formatos, progresso=avisar_linhas(0, 'Base de Vendas'))
+
+    # 7. ABA DEVOLUÇÕES (CONSOLIDADO): Matriz e Full em sequência, sem concatenar em memória
+    devolucoes = [df for df in (matriz, full) if len(df) > 0]
+    if devolucoes:
+        avisar(0.1 + 0.9 * len(vendas) / linhas_bases, 'Base de Devoluções')
+        escrever_tabela(workbook, 'Base de Devoluções', devolucoes, formatos,
+                        progresso=avisar_linhas(len(vendas), 'Base de Devoluções'))
+
+    avisar(1.0, 'Compactando arquivo')
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def tabelas_export(data, resultados):
+    """
+    Tabelas do pacote de dados, as mesmas das abas do XLSX: nome -> lista de DataFrames
+    (escritos em sequência, como Matriz e Full na base de devoluções). Tabelas vazias ficam de fora.
+    """
+    tabelas = {
+        'ranking_skus': [resultados['skus'][0]],
+        'motivos_devolucao': [resultados['motivos']],
+        'analise_logistica': [resultados['frete']],
+        'qualidade_dados': [pd.DataFrame(linhas_qualidade(resultados['qualidade']), columns=COLUNAS_QUALIDADE)],
+        'base_vendas': [data['vendas']],
+        'base_devolucoes': [data['matriz'], data['full']],
+    }
+    tabelas = {nome: [df for df in frames if df is not None and len(df) > 0] for nome, frames in tabelas.items()}
+    return {nome: frames for nome, frames in tabelas.items() if frames}
+
+
+def _valor_json(valor):
+    """Converte tipos do NumPy/pandas para o manifesto JSON"""
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, (pd.Timestamp, datetime)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _tipos(frames):
+    """Tipo gravado de cada coluna (o da primeira tabela que a contém, após restaurar_valores)"""
+    tipos = {}
+    for df in frames:
+        for col, tipo in restaurar_valores(df.head(0)).dtypes.items():
+            tipos.setdefault(str(col), str(tipo))
+    return tipos
+
+
+def _escrever_parquet(arquivo, frames):
+    """Uma tabela em Parquet, com os tipos das colunas (category, texto, int, float, data)"""
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    preparar_para_parquet(restaurar_valores(df)).to_parquet(arquivo, index=False)
+
+
+def _escrever_csv(arquivo, frames, progresso=None):
+    """Uma tabela em CSV compactado com gzip, escrita em blocos"""
+    colunas = _colunas(frames)
+    escritas = 0
+    with gzip.GzipFile(fileobj=arquivo, mode='wb', compresslevel=NIVEL_GZIP) as gz:
+        with io.TextIOWrapper(gz, encoding='utf-8', newline='') as texto:
+            texto.write(pd.DataFrame(columns=colunas).to_csv(index=False))
+            for bloco in _blocos(frames, colunas):
+                bloco.to_csv(texto, index=False, header=False)
+                escritas += len(bloco)
+                if progresso is not None:
+                    progresso(escritas)
+
+
+def exportar_pacote(data, resultados=None, calcular=None, formato='parquet', progresso=None):
+    """
+    Exporta as tabelas do relatório em um ZIP para reimportação (ex.: BI):
+    - formato 'parquet': um arquivo .parquet por tabela, com as colunas tipadas
+    - formato 'csv': um arquivo .csv.gz por tabela (UTF-8, separador vírgula, datas ISO)
+    Inclui manifesto.json com as métricas de calcular_metricas, os filtros e o esquema de cada tabela.
+    resultados / calcular / progresso: como em exportar_xlsx
+    """
+    if formato not in ('parquet', 'csv'):
+        raise ValueError(f"Formato de pacote desconhecido: {formato}")
+    if formato == 'parquet' and not PARQUET_DISPONIVEL:
+        raise ValueError("Export em Parquet requer o pacote pyarrow (pip install pyarrow); use o formato 'csv'")
+    
+    def avisar(fracao, etapa):
+        if progresso is not None:
+            progresso(fracao, etapa)
+    
+    avisar(0.0, 'Análises')
+    resultados = resultados_export(data, resultados, calcular)
+    tabelas = tabelas_export(data, resultados)
+    extensao = '.parquet' if formato == 'parquet' else '.csv.gz'
+    
+    total_linhas = max(1, sum(len(df) for frames in tabelas.values() for df in frames))
+    escritas = 0
+    manifesto_tabelas = {}
+    
+    output = BytesIO()
+    # Parquet e gzip já vêm compactados: o ZIP apenas armazena os arquivos
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as pacote:
+        for nome, frames in tabelas.items():
+            avisar(0.05 + 0.9 * escritas / total_linhas, nome)
+            arquivo = nome + extensao
+            with pacote.open(arquivo, 'w', force_zip64=True) as destino:
+                if formato == 'parquet':
+                    # O Parquet precisa de um arquivo com seek: gerar em memória e copiar
+                    conteudo = BytesIO()
+                    _escrever_parquet(conteudo, frames)
+                    destino.write(conteudo.getbuffer())
+                else:
+                    inicio = escritas
+                    _escrever_csv(destino, frames, lambda n: avisar(0.05 + 0.9 * (inicio + n) / total_linhas, nome))
+            
+            linhas = sum(len(df) for df in frames)
+            escritas += linhas
+            manifesto_tabelas[nome] = {
+                'arquivo': arquivo,
+                'linhas': linhas,
+                'colunas': _tipos(frames),
+            }
+        
+        filtros = data.get('filtros')
+        manifesto = {
+            'gerado_em': datetime.now().isoformat(timespec='seconds'),
+            'formato': formato,
+            'dataset': data.get('fingerprint'),
+            'filtros': dict(zip(CAMPOS_FILTROS, filtros[1:])) if filtros else None,
+            'data_mais_recente': data['max_date'],
+            'metricas': resultados['metricas'],
+            'qualidade': resultados['qualidade'],
+            'tabelas': manifesto_tabelas,
+        }
+        avisar(0.95, 'Manifesto')
+        pacote.writestr('manifesto.json', json.dumps(manifesto, ensure_ascii=False, indent=2, default=_valor_json))
+    
+    avisar(1.0, 'Concluído')
     output.seek(0)
     return output
@@ -0,0 +1,126 @@
+"""
+Geração dos relatórios em segundo plano.
+
+O export (XLSX ou pacote Parquet/CSV, ver FORMATOS_EXPORT) roda em uma thread
+(ThreadPoolExecutor), fora do rerun do Streamlit, e publica o progresso na
+própria tarefa. As análises que ainda não estão em cache também são calculadas
+nessa thread, então iniciar um export nunca bloqueia o rerun. O arquivo pronto fica em um cache
+de artefatos chaveado por (fingerprint do dataset, tupla de filtros, formato):
+baixar de novo, ou voltar aos mesmos filtros, serve os bytes já gerados.
+
+O cache é LRU e limitado em quantidade (EXPORT_MAX_ARTEFATOS) e em bytes
+(EXPORT_MAX_BYTES); tarefas ainda em execução nunca são descartadas.
+
+Cada tarefa é um dicionário:
+- estado: 'executando', 'pronto' ou 'erro'
+- progresso: fração de 0 a 1; etapa: texto da etapa atual
+- conteudo: bytes do arquivo (quando pronto); erro: mensagem (quando falhou)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.cache import PARQUET_DISPONIVEL
+from utils.export import exportar_xlsx, exportar_pacote
+
+EXPORT_MAX_TAREFAS = int(os.environ.get('DASHBOARD_EXPORT_TAREFAS', '2'))
+EXPORT_MAX_ARTEFATOS = int(os.environ.get('DASHBOARD_EXPORT_MAX_ARTEFATOS', '8'))
+EXPORT_MAX_BYTES = int(os.environ.get('DASHBOARD_EXPORT_MAX_MB', '512')) * 1024 * 1024
+
+# Formato -> rótulo, arquivo e função (data, resultados, calcular, progresso) que gera o conteúdo
+FORMATOS_EXPORT = {
+    'xlsx': {
+        'rotulo': 'Excel (XLSX)',
+        'extensao': 'xlsx',
+        'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'gerar': lambda data, resultados, calcular, progresso: exportar_xlsx(data, resultados, calcular, progresso=progresso),
+    },
+    'parquet': {
+        'rotulo': 'Parquet (ZIP + manifesto)',
+        'extensao': 'zip',
+        'mime': 'application/zip',
+        'gerar': lambda data, resultados, calcular, progresso: exportar_pacote(data, resultados, calcular, formato='parquet', progresso=progresso),
+    },
+    'csv': {
+        'rotulo': 'CSV gzip (ZIP + manifesto)',
+        'extensao': 'zip',
+        'mime': 'application/zip',
+        'gerar': lambda data, resultados, calcular, progresso: exportar_pacote(data, resultados, calcular, formato='csv', progresso=progresso),
+    },
+}
+if not PARQUET_DISPONIVEL:
+    del FORMATOS_EXPORT['parquet']
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_MAX_TAREFAS, thread_name_prefix='export')
+_lock = threading.Lock()
+# chave -> tarefa, da menos para a mais recentemente usada
+_tarefas = OrderedDict()
+
+
+def chave_export(data, formato='xlsx'):
+    """Chave do artefato: (fingerprint, filtros, formato) dos dados já filtrados"""
+    return (data.get('fingerprint'), data.get('filtros'), formato)
+
+
+def obter_export(data, formato='xlsx'):
+    """Tarefa de export (em execução ou concluída) para os dados e filtros atuais, ou None"""
+    chave = chave_export(data, formato)
+    with _lock:
+        tarefa = _tarefas.get(chave)
+        if tarefa is not None:
+            _tarefas.move_to_end(chave)
+        return tarefa
+
+
+def iniciar_export(data, formato='xlsx', resultados=None, calcular=None):
+    """
+    Inicia o export em segundo plano e retorna a tarefa.
+    Se já existe uma tarefa em execução ou pronta para a mesma chave, ela é reaproveitada.
+    resultados / calcular: como em utils.export.resultados_export; o que faltar no pacote
+    é calculado na thread do export (no app, calcular = cache_streamlit.calcular)
+    """
+    chave = chave_export(data, formato)
+    with _lock:
+        tarefa = _tarefas.get(chave)
+        if tarefa is not None and tarefa['estado'] != 'erro':
+            _tarefas.move_to_end(chave)
+            return tarefa
+
+        tarefa = {'estado': 'executando', 'progresso': 0.0, 'etapa': 'Na fila', 'conteudo': None, 'erro': None}
+        _tarefas[chave] = tarefa
+
+    _executor.submit(_executar, tarefa, FORMATOS_EXPORT[formato]['gerar'], data, resultados, calcular)
+    return tarefa
+
+
+def _executar(tarefa, exportador, data, resultados, calcular):
+    def progresso(fracao, etapa):
+        tarefa['progresso'] = min(max(fracao, 0.0), 1.0)
+        tarefa['etapa'] = etapa
+
+    try:
+        conteudo = exportador(data, resultados, calcular, progresso).getvalue()
+    except Exception as e:
+        tarefa['erro'] = str(e)
+        tarefa['estado'] = 'erro'
+        return
+
+    tarefa['conteudo'] = conteudo
+    tarefa['progresso'] = 1.0
+    tarefa['estado'] = 'pronto'
+    _respeitar_limites()
+
+
+def _respeitar_limites():
+    """Descarta os artefatos concluídos menos recentemente usados até caber nos limites"""
+    with _lock:
+        concluidas = [chave for chave, tarefa in _tarefas.items() if tarefa['estado'] != 'executando']
+        total = sum(len(_tarefas[chave]['conteudo'] or b'') for chave in concluidas)
+        # A mais recente fica sempre, mesmo que sozinha passe do orçamento
+        for chave in concluidas[:-1]:
+            if len(concluidas) <= EXPORT_MAX_ARTEFATOS and total <= EXPORT_MAX_BYTES:
+                break
+            total -= len(_tarefas.pop(chave)['conteudo'] or b'')
+            concluidas.remove(chave)
@@ -0,0 +1,214 @@
+"""
+Filtros globais do cabeçalho (janela, canal, Ads e Top 10).
+
+Os arrays usados na filtragem (datas e N.º de venda como códigos inteiros)
+são preparados uma única vez no carregamento. Cada filtro vira uma máscara
+booleana; os DataFrames só são recortados uma vez, no final, sem .copy()
+prévio. O resultado é memorizado por (fingerprint do dataset, filtros) em
+um LRU pequeno, então alternar entre filtros já vistos é instantâneo. Este é
+o único cache de dados filtrados: cada entrada guarda também os bytes que
+ocupa, usados pelo orçamento de memória de utils.cache_streamlit, e expira
+após FILTROS_TTL_SEGUNDOS (o mesmo TTL dos datasets e resultados).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.esquema import memoria
+from utils.juncao import chave_venda
+
+MAX_FILTROS_EM_CACHE = int(os.environ.get('DASHBOARD_CACHE_MAX_FILTROS', '8'))
+FILTROS_TTL_SEGUNDOS = int(os.environ.get('DASHBOARD_CACHE_TTL_MIN', '60')) * 60
+
+# (fingerprint, filtros) -> (resultado, bytes, criado), do menos para o mais recentemente usado
+_filtros_em_cache = OrderedDict()
+_lock = threading.Lock()
+
+TABELAS_FILTRADAS = ('vendas', 'matriz', 'full', 'juncao', 'juncao_matriz', 'juncao_full')
+
+
+def _datas(df):
+    if df is not None and 'Data da venda' in df.columns:
+        return df['Data da venda'].to_numpy(dtype='datetime64[ns]')
+    return None
+
+
+def preparar_indices(vendas, matriz, full):
+    """
+    Pré-calcula os arrays usados pelos filtros: datas em datetime64 e o N.º de venda
+    (texto) convertido para códigos inteiros comuns a vendas, matriz e full.
+    """
+    tabelas = {'vendas': vendas, 'matriz': matriz, 'full': full}
+    chaves = {
+        nome: chave_venda(df['N.º de venda']).to_numpy()
+        for nome, df in tabelas.items()
+        if df is not None and 'N.º de venda' in df.columns
+    }
+
+    # Fatorar todas as chaves juntas para que o mesmo N.º de venda tenha o mesmo código
+    if chaves:
+        codigos, _ = pd.factorize(np.concatenate(list(chaves.values())))
+    else:
+        codigos = np.array([], dtype='int64')
+
+    indices = {}
+    inicio = 0
+    for nome, df in tabelas.items():
+        ids = None
+        if nome in chaves:
+            fim = inicio + len(chaves[nome])
+            ids = codigos[inicio:fim]
+            inicio = fim
+        indices[nome] = {'ids': ids, 'datas': _datas(df)}
+
+    if 'Venda por publicidade' in vendas.columns:
+        indices['vendas']['ads'] = (vendas['Venda por publicidade'] == 'Sim').to_numpy()
+    else:
+        indices['vendas']['ads'] = None
+
+    return indices
+
+
+def _mascara_janela(datas, limite, tamanho):
+    if datas is None:
+        return np.ones(tamanho, dtype=bool)
+    # NaT nunca é >= limite, como na comparação do pandas
+    return datas >= limite
+
+
+def aplicar_filtros(data, janela, canal, somente_ads, top10_skus, agrupar_por='SKU'):
+    """
+    Aplica os filtros globais do cabeçalho sobre os dados brutos.
+    Retorna um dicionário com os mesmos campos de 'data', mas filtrados.
+    Os DataFrames retornados podem ser compartilhados entre chamadas: não devem ser alterados.
+    """
+    fingerprint = data.get('fingerprint')
+    chave_cache = (fingerprint, janela, canal, somente_ads, top10_skus, agrupar_por)
+    if fingerprint is not None:
+        with _lock:
+            entrada = _filtros_em_cache.get(chave_cache)
+            if entrada is not None and time.monotonic() - entrada[2] <= FILTROS_TTL_SEGUNDOS:
+                _filtros_em_cache.move_to_end(chave_cache)
+                return entrada[0]
+            _filtros_em_cache.pop(chave_cache, None)
+
+    vendas = data['vendas']
+    matriz = data['matriz'] if data['matriz'] is not None else pd.DataFrame()
+    full = data['full'] if data['full'] is not None else pd.DataFrame()
+    max_date = data['max_date']
+
+    indices = data.get('indices')
+    if indices is None:
+        indices = preparar_indices(vendas, data['matriz'], data['full'])
+
+    idx_v, idx_m, idx_f = indices['vendas'], indices['matriz'], indices['full']
+
+    # 1) Filtro de JANELA (período)
+    limite = np.datetime64(pd.Timestamp(max_date - timedelta(days=janela)), 'ns')
+    mask_v = _mascara_janela(idx_v['datas'], limite, len(vendas))
+    mask_m = _mascara_janela(idx_m['datas'], limite, len(matriz))
+    mask_f = _mascara_janela(idx_f['datas'], limite, len(full))
+
+    # 2) Filtro de CANAL
+    if canal == 'Matriz':
+        mask_f = np.zeros(len(full), dtype=bool)
+    elif canal == 'Full':
+        mask_m = np.zeros(len(matriz), dtype=bool)
+    # 'Todos' mantém ambos
+
+    # 3) Filtro SOMENTE ADS
+    if somente_ads and idx_v['ads'] is not None:
+        mask_v = mask_v & idx_v['ads']
+
+    # 4) Filtro TOP 10 (filtra vendas apenas dos 10 itens com mais devoluções)
+    if top10_skus:
+        col_id = agrupar_por if agrupar_por in vendas.columns else 'SKU'
+        ids_dev = [ids[mask] for ids, mask in ((idx_m['ids'], mask_m), (idx_f['ids'], mask_f)) if ids is not None]
+        ids_dev = np.concatenate(ids_dev) if ids_dev else np.array([], dtype='int64')
+
+        if len(ids_dev) > 0 and col_id in vendas.columns and idx_v['ids'] is not None:
+            # Mapear devoluções para itens via vendas
+            com_dev = mask_v & np.isin(idx_v['ids'], ids_dev)
+            itens_dev = vendas[col_id][com_dev]
+            if isinstance(itens_dev.dtype, pd.CategoricalDtype):
+                # Contar como texto: mesma ordem de empates e sem categorias com contagem zero
+                itens_dev = itens_dev.astype(itens_dev.cat.categories.dtype)
+            top_items = itens_dev.value_counts().head(10).index.tolist()
+            mask_v = mask_v & vendas[col_id].isin(top_items).to_numpy()
+
+            # Filtrar devoluções para manter apenas as relacionadas às vendas filtradas
+            ids_vendas = idx_v['ids'][mask_v]
+            if idx_m['ids'] is not None:
+                mask_m = mask_m & np.isin(idx_m['ids'], ids_vendas)
+            if idx_f['ids'] is not None:
+                mask_f = mask_f & np.isin(idx_f['ids'], ids_vendas)
+
+    # 5) Recortar os DataFrames uma única vez
+    vendas = vendas[mask_v]
+    matriz = matriz[mask_m] if len(matriz) > 0 else matriz
+    full = full[mask_f] if len(full) > 0 else full
+
+    # Junção venda ↔ devolução (montada no upload) restrita às vendas filtradas
+    juncoes = data['juncoes']
+
+    resultado = {
+        'vendas': vendas,
+        'matriz': matriz if len(matriz) > 0 else None,
+        'full': full if len(full) > 0 else None,
+        'juncao': juncoes[canal][mask_v],
+        'juncao_matriz': juncoes['Matriz'][mask_v] if canal != 'Full' else None,
+        'juncao_full': juncoes['Full'][mask_v] if canal != 'Matriz' else None,
+        'max_date': max_date,
+        # Identificação do dataset e dos filtros, usada como chave pelos caches de resultados
+        'fingerprint': fingerprint,
+        'filtros': chave_cache,
+        # Perfil de qualidade dos arquivos (não depende dos filtros)
+        'qualidade': data.get('qualidade'),
+        'total_vendas': len(vendas),
+        'total_matriz': len(matriz) if len(matriz) > 0 else 0,
+        'total_full': len(full) if len(full) > 0 else 0,
+    }
+
+    if fingerprint is not None:
+        tamanho = sum(memoria(resultado[tabela]) for tabela in TABELAS_FILTRADAS)
+        with _lock:
+            _filtros_em_cache[chave_cache] = (resultado, tamanho, time.monotonic())
+            while len(_filtros_em_cache) > MAX_FILTROS_EM_CACHE:
+                _filtros_em_cache.popitem(last=False)
+
+    return resultado
+
+
+def descartar_filtros(fingerprint):
+    """Remove do cache os resultados filtrados de um dataset"""
+    with _lock:
+        for chave in [chave for chave in _filtros_em_cache if chave[0] == fingerprint]:
+            del _filtros_em_cache[chave]
+
+
+def descartar_filtros_expirados(agora=None):
+    """Remove do cache os resultados filtrados que passaram do TTL"""
+    agora = time.monotonic() if agora is None else agora
+    with _lock:
+        for chave in [chave for chave, (_, _, criado) in _filtros_em_cache.items() if agora - criado > FILTROS_TTL_SEGUNDOS]:
+            del _filtros_em_cache[chave]
+
+
+def memoria_filtros():
+    """Bytes ocupados pelos resultados filtrados em cache"""
+    with _lock:
+        return sum(tamanho for _, tamanho, _ in _filtros_em_cache.values())
+
+
+def descartar_filtro_mais_antigo():
+    """Remove o resultado filtrado menos recentemente usado; retorna os bytes liberados (0 se vazio)"""
+    with _lock:
+        if not _filtros_em_cache:
+            return 0
+        return _filtros_em_cache.popitem(last=False)[1][1]
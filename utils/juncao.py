@@ -0,0 +1,232 @@
+"""
+Tabela de junção venda ↔ devolução.
+
+Monta, uma única vez, um DataFrame alinhado com as vendas (uma linha por venda,
+mesmo índice) com os valores das devoluções daquela venda já somados. Todas as
+análises leem desta tabela em vez de reconstruir um mapa de devoluções com
+iterrows a cada chamada.
+
+As devoluções ficam em um índice CSR (indexar_devolucoes): chaves, offsets e um
+array por coluna, ordenados por venda. As devoluções de uma venda são uma fatia
+contígua, lida em O(1) por devolucoes_da_venda; posicoes_devolucoes junta as de
+várias vendas de uma vez, e as somas por venda são feitas sobre os arrays.
+
+Colunas da junção:
+- chave: N.º de venda normalizado como texto
+- id_venda: código inteiro da chave (mesmo código para vendas repetidas)
+- receita_prod / receita_env: receitas da venda (vazios viram 0)
+- devolucoes: quantidade de linhas de devolução da venda
+- reembolso: soma de 'Cancelamentos e reembolsos (BRL)' (ou receita do produto quando 0)
+- impacto: soma de |reembolso| de cada devolução
+- perda_parcial: soma de |Tarifas de envio + Tarifa de venda e impostos|
+- perda_total: perda parcial + |reembolso| para devoluções Críticas
+- custo_dev: soma de 'Custos de envio (BRL)'
+- saudaveis / criticas / neutras: quantidade de devoluções em cada classe
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.regras import classificar_estados
+
+CANAIS = ('Todos', 'Matriz', 'Full')
+
+COLUNAS_SOMA = ['reembolso', 'impacto', 'perda_parcial', 'perda_total', 'custo_dev']
+COLUNAS_CONTAGEM = ['devolucoes', 'saudaveis', 'criticas', 'neutras']
+
+
+def chave_venda(serie):
+    """Normaliza o N.º de venda para texto (mesma chave usada no cruzamento vendas x devoluções)"""
+    return serie.astype(str)
+
+
+def coluna_numerica(df, coluna):
+    """Retorna a coluna como float com vazios em 0 (ou zeros, se a coluna não existir)"""
+    if coluna in df.columns:
+        return pd.to_numeric(df[coluna], errors='coerce').fillna(0.0).astype('float64')
+    return pd.Series(0.0, index=df.index)
+
+
+def reembolso_devolucoes(df):
+    """'Cancelamentos e reembolsos (BRL)' de cada devolução, com a receita do produto como fallback quando 0"""
+    reembolso = coluna_numerica(df, 'Cancelamentos e reembolsos (BRL)')
+    return reembolso.where(reembolso != 0, coluna_numerica(df, 'Receita por produtos (BRL)'))
+
+
+def preparar_devolucoes(matriz, full):
+    """
+    Consolida Matriz e Full em uma linha por devolução com os valores já calculados.
+    A ordem das linhas é a mesma de pd.concat([matriz, full]).
+    """
+    partes = []
+    for canal, df in (('Matriz', matriz), ('Full', full)):
+        if df is not None and len(df) > 0 and 'N.º de venda' in df.columns:
+            partes.append((canal, df))
+
+    if not partes:
+        return pd.DataFrame({
+            'chave': pd.Series([], dtype=str),
+            'canal': pd.Series([], dtype=str),
+            'classe': pd.Series([], dtype=str),
+            **{col: pd.Series([], dtype='float64') for col in COLUNAS_SOMA},
+        })
+
+    blocos = []
+    for canal, df in partes:
+        # Impacto real: 'Cancelamentos e reembolsos', com receita do produto como fallback quando 0
+        reembolso = reembolso_devolucoes(df)
+
+        # Perda Parcial = Tarifas de envio + Tarifa de venda e impostos (já vêm negativos)
+        perda_parcial = (coluna_numerica(df, 'Tarifas de envio (BRL)') + coluna_numerica(df, 'Tarifa de venda e impostos (BRL)')).abs()
+
+        estados = df['Estado'] if 'Estado' in df.columns else pd.Series(np.nan, index=df.index)
+        classe = classificar_estados(estados)
+
+        # Saudável/Neutra: perda apenas dos custos operacionais; Crítica: produto + custos
+        perda_total = perda_parcial + reembolso.abs().where(classe == 'Crítica', 0.0)
+
+        blocos.append(pd.DataFrame({
+            'chave': chave_venda(df['N.º de venda']).to_numpy(),
+            'canal': canal,
+            'classe': classe.to_numpy(),
+            'reembolso': reembolso.to_numpy(),
+            'impacto': reembolso.abs().to_numpy(),
+            'perda_parcial': perda_parcial.to_numpy(),
+            'perda_total': perda_total.to_numpy(),
+            'custo_dev': coluna_numerica(df, 'Custos de envio (BRL)').to_numpy(),
+        }))
+
+    return pd.concat(blocos, ignore_index=True)
+
+
+def indexar_devolucoes(vendas, devolucoes):
+    """
+    Índice CSR das devoluções por N.º de venda, no lugar de um mapa chave -> lista de linhas.
+    devolucoes: saída de preparar_devolucoes
+    Retorna um dicionário com:
+    - chaves: pd.Index das chaves (as das vendas primeiro, na ordem de aparição)
+    - ids_vendas: código em 'chaves' de cada venda (-1 para N.º de venda vazio)
+    - offsets: as devoluções da chave k ocupam as posições offsets[k]:offsets[k + 1]
+    - colunas: arrays das devoluções ordenados por chave (COLUNAS_SOMA, 'canal' e 'classe'),
+      mantendo a ordem original entre devoluções da mesma venda
+    """
+    if 'N.º de venda' in vendas.columns:
+        chaves_vendas = chave_venda(vendas['N.º de venda']).to_numpy(dtype=object)
+    else:
+        chaves_vendas = np.full(len(vendas), '', dtype=object)
+    
+    codigos, chaves = pd.factorize(np.concatenate([chaves_vendas, devolucoes['chave'].to_numpy(dtype=object)]))
+    ids_vendas = codigos[:len(vendas)].astype('int64')
+    ids_dev = codigos[len(vendas):]
+    
+    # Devoluções sem N.º de venda não pertencem a nenhuma venda (como no groupby por chave)
+    validas = np.flatnonzero(ids_dev >= 0)
+    ordem = validas[np.argsort(ids_dev[validas], kind='stable')]
+    contagem = np.bincount(ids_dev[ordem], minlength=len(chaves))
+    
+    colunas = {col: devolucoes[col].to_numpy(dtype='float64')[ordem] for col in COLUNAS_SOMA}
+    colunas['canal'] = pd.Categorical(devolucoes['canal'].to_numpy(dtype=object)[ordem])
+    colunas['classe'] = pd.Categorical(devolucoes['classe'].to_numpy(dtype=object)[ordem])
+    
+    return {
+        'chaves': pd.Index(chaves),
+        'ids_vendas': ids_vendas,
+        'offsets': np.concatenate([[0], np.cumsum(contagem)]).astype('int64'),
+        'colunas': colunas,
+    }
+
+
+def posicoes_devolucoes(indice, ids):
+    """Posições (em indice['colunas']) de todas as devoluções das chaves 'ids', na ordem dos ids"""
+    ids = np.asarray(ids, dtype='int64')
+    ids = ids[ids >= 0]
+    inicio = indice['offsets'][ids]
+    tamanho = indice['offsets'][ids + 1] - inicio
+    # Cada id contribui com o intervalo inicio:inicio + tamanho, tudo em um único arange
+    deslocamento = np.repeat(inicio - np.cumsum(tamanho) + tamanho, tamanho)
+    return deslocamento + np.arange(tamanho.sum())
+
+
+def devolucoes_da_venda(indice, chave):
+    """Devoluções de um N.º de venda em O(1): dicionário coluna -> valores (fatias, sem cópia)"""
+    k = indice['chaves'].get_indexer([chave])[0]
+    fatia = slice(indice['offsets'][k], indice['offsets'][k + 1]) if k >= 0 else slice(0, 0)
+    return {col: valores[fatia] for col, valores in indice['colunas'].items()}
+
+
+def _somar_segmentos(valores, offsets):
+    """
+    Soma de cada segmento do CSR com compensação de Kahan, vetorizada pela posição
+    dentro do segmento (mesmo resultado, bit a bit, do groupby.sum do pandas).
+    """
+    inicio, tamanho = offsets[:-1], np.diff(offsets)
+    soma = np.zeros(len(tamanho))
+    compensacao = np.zeros(len(tamanho))
+    for posicao in range(tamanho.max(initial=0)):
+        ativos = np.flatnonzero(tamanho > posicao)
+        y = valores[inicio[ativos] + posicao] - compensacao[ativos]
+        t = soma[ativos] + y
+        compensacao[ativos] = t - soma[ativos] - y
+        soma[ativos] = t
+    return soma
+
+
+def montar_juncao(vendas, indice, canal=None):
+    """
+    Monta a tabela de junção (uma linha por venda) a partir do índice de devoluções.
+    canal: None (todas as devoluções), 'Matriz' ou 'Full'
+    """
+    if 'N.º de venda' in vendas.columns:
+        chaves = chave_venda(vendas['N.º de venda'])
+    else:
+        chaves = pd.Series('', index=vendas.index)
+    
+    ids = indice['ids_vendas']
+    juncao = pd.DataFrame({
+        'chave': chaves,
+        'id_venda': ids,
+        'receita_prod': coluna_numerica(vendas, 'Receita por produtos (BRL)'),
+        'receita_env': coluna_numerica(vendas, 'Receita por envio (BRL)'),
+    }, index=vendas.index)
+    
+    colunas = indice['colunas']
+    n_chaves = len(indice['chaves'])
+    ids_dev = np.repeat(np.arange(n_chaves), np.diff(indice['offsets']))
+    
+    manter = np.ones(len(ids_dev), dtype=bool) if canal is None else np.asarray(colunas['canal'] == canal)
+    ids_dev = ids_dev[manter]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(ids_dev, minlength=n_chaves))])
+    
+    def por_venda(valores_por_chave, dtype):
+        # Posição extra (zero) para vendas sem chave (id -1)
+        return np.append(valores_por_chave, 0).astype(dtype)[ids]
+    
+    classes = colunas['classe'][manter]
+    juncao['devolucoes'] = por_venda(np.diff(offsets), 'int64')
+    for col, classe in (('saudaveis', 'Saudável'), ('criticas', 'Crítica'), ('neutras', 'Neutra')):
+        juncao[col] = por_venda(np.bincount(ids_dev, weights=classes == classe, minlength=n_chaves), 'int64')
+    for col in COLUNAS_SOMA:
+        juncao[col] = por_venda(_somar_segmentos(colunas[col][manter], offsets), 'float64')
+    
+    return juncao
+
+
+def montar_juncoes(vendas, matriz=None, full=None, indice=None):
+    """
+    Monta a junção para cada filtro de canal ('Todos', 'Matriz' e 'Full') a partir de um
+    único índice de devoluções (montado aqui se não for informado).
+    """
+    if indice is None:
+        indice = indexar_devolucoes(vendas, preparar_devolucoes(matriz, full))
+    return {
+        'Todos': montar_juncao(vendas, indice),
+        'Matriz': montar_juncao(vendas, indice, 'Matriz'),
+        'Full': montar_juncao(vendas, indice, 'Full'),
+    }
+
+
+def obter_juncao(vendas, matriz, full, juncao=None):
+    """Retorna a junção pré-calculada ou, se não informada, monta a partir dos DataFrames"""
+    if juncao is not None:
+        return juncao
+    return montar_juncao(vendas, indexar_devolucoes(vendas, preparar_devolucoes(matriz, full)))
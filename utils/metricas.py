@@ -1,30 +1,18 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
+from utils.juncao import obter_juncao
 
-def classificar_estado(estado):
-    """Classifica devolução baseado no estado"""
-    if pd.isna(estado):
-        return 'Neutra'
-    
-    estado_lower = str(estado).lower()
-    
-    # Saudável: produto foi devolvido e aceito
-    if ('colocamos o produto à venda novamente' in estado_lower or 
-        'devolvemos o produto ao comprador' in estado_lower or
-        'reembolsamos o dinheiro' in estado_lower):
-        return 'Saudável'
-    
-    # Crítica: devolução problemática ou cancelada
-    if ('cancelada' in estado_lower or 
-        'mediação' in estado_lower or
-        'reclamação' in estado_lower or
-        'revisão' in estado_lower):
-        return 'Crítica'
-    
-    # Neutra: em processo
-    return 'Neutra'
+def soma_sequencial(valores):
+    """
+    Soma na ordem dos elementos, como um laço acumulando com +=.
+    np.sum usa soma em pares e pode diferir na última casa; o cumsum é sequencial.
+    """
+    if len(valores) == 0:
+        return 0.0
+    return float(np.cumsum(valores)[-1])
 
-def calcular_metricas(vendas, matriz, full, max_date, dias_atras):
+def calcular_metricas(vendas, matriz, full, max_date, dias_atras, juncao=None):
     """
     Calcula métricas para um período específico.
     
@@ -32,118 +20,44 @@ def calcular_metricas(vendas, matriz, full, max_date, dias_atras):
     Os dados já devem chegar filtrados pela função aplicar_filtros() do app.py.
     O parâmetro dias_atras é mantido apenas para compatibilidade, mas a filtragem
     real é feita no cabeçalho global.
-    """
     
-    if matriz is None:
-        matriz = pd.DataFrame()
-    if full is None:
-        full = pd.DataFrame()
+    juncao: tabela venda ↔ devolução já montada (utils.juncao). Se não for
+    informada, é montada a partir de vendas/matriz/full.
     
-    # Trabalhar com os dados como recebidos (já filtrados pelo cabeçalho global)
-    vendas_periodo = vendas.copy()
-    
-    # Criar mapa de devoluções indexado por N.º de venda
-    todas_dev = pd.concat([matriz, full], ignore_index=True)
-    dev_map = {}
+    Todo o cálculo é feito sobre arrays NumPy da junção, sem laço por linha.
+    """
     
-    if len(todas_dev) > 0 and 'N.º de venda' in todas_dev.columns:
-        for _, row in todas_dev.iterrows():
-            num_venda = str(row['N.º de venda'])
-            if num_venda not in dev_map:
-                dev_map[num_venda] = []
-            dev_map[num_venda].append(row)
+    juncao = obter_juncao(vendas, matriz, full, juncao)
     
     # Calcular métricas
-    vendas_totais = len(vendas_periodo)
-    unidades_totais = 0
-    if 'Unidades' in vendas_periodo.columns:
-        unidades_totais = int(vendas_periodo['Unidades'].fillna(0).sum())
+    vendas_totais = len(juncao)
+    if 'Unidades' in vendas.columns:
+        unidades_totais = int(vendas['Unidades'].fillna(0).sum())
     else:
         unidades_totais = vendas_totais
     
-    faturamento_produtos = 0.0
-    faturamento_total = 0.0
-    faturamento_devolucoes = 0.0
-    impacto_devolucao = 0.0
-    perda_total = 0.0
-    perda_parcial = 0.0
-    saudaveis = 0
-    criticas = 0
-    neutras = 0
-    
-    venda_com_devolucao = set()
-    
-    for _, venda in vendas_periodo.iterrows():
-        # Faturamento: somar receita de produtos + receita de envio
-        receita_prod = venda.get('Receita por produtos (BRL)', 0)
-        receita_env = venda.get('Receita por envio (BRL)', 0)
-        if pd.isna(receita_prod): receita_prod = 0.0
-        if pd.isna(receita_env): receita_env = 0.0
-        receita_prod = float(receita_prod)
-        receita_env = float(receita_env)
-        
-        faturamento_produtos += receita_prod
-        faturamento_total += receita_prod + receita_env
-        
-        # Verificar se esta venda tem devolução
-        num_venda = str(venda.get('N.º de venda', ''))
-        
-        if num_venda in dev_map:
-            venda_com_devolucao.add(num_venda)
-            
-            # Faturamento de Devoluções = receita dos produtos que foram devolvidos
-            faturamento_devolucoes += receita_prod
-            
-            for dev in dev_map[num_venda]:
-                # Impacto real: usar 'Cancelamentos e reembolsos (BRL)'
-                reembolso = dev.get('Cancelamentos e reembolsos (BRL)', None)
-                if reembolso is None or pd.isna(reembolso):
-                    reembolso = 0.0
-                reembolso = float(reembolso)
-                
-                # Se reembolso é 0, usar receita do produto como fallback
-                if reembolso == 0:
-                    reembolso_fallback = dev.get('Receita por produtos (BRL)', 0)
-                    if pd.isna(reembolso_fallback):
-                        reembolso_fallback = 0.0
-                    reembolso = float(reembolso_fallback)
-                
-                # Perda Parcial = Tarifas de envio + Tarifa de venda e impostos
-                # (você recupera o produto mas perde os custos)
-                tarifas_envio = dev.get('Tarifas de envio (BRL)', 0)
-                if pd.isna(tarifas_envio):
-                    tarifas_envio = 0.0
-                tarifas_envio = float(tarifas_envio)
-                
-                tarifa_venda = dev.get('Tarifa de venda e impostos (BRL)', 0)
-                if pd.isna(tarifa_venda):
-                    tarifa_venda = 0.0
-                tarifa_venda = float(tarifa_venda)
-                
-                # Perda parcial é a soma dos custos (já vêm negativos)
-                perda_parcial_item = tarifas_envio + tarifa_venda
-                
-                # A perda total é o impacto real financeiro.
-                # Se a devolução for 'Saudável', o produto volta ao estoque, então a perda é apenas os custos operacionais.
-                # Se for 'Crítica', a perda é o valor total do produto mais os custos operacionais.
-                # Se for 'Neutra', assumimos conservadoramente uma perda parcial até a conclusão.
-                classe = classificar_estado(dev.get('Estado'))
-                if classe == 'Saudável':
-                    saudaveis += 1
-                    perda_total_item = abs(perda_parcial_item)
-                elif classe == 'Crítica':
-                    criticas += 1
-                    perda_total_item = abs(reembolso) + abs(perda_parcial_item)
-                else:
-                    neutras += 1
-                    perda_total_item = abs(perda_parcial_item)
-                
-                impacto_devolucao += abs(reembolso)
-                perda_total += perda_total_item
-                perda_parcial += abs(perda_parcial_item)
-    
-    # Contagem de devoluções = número de vendas que tiveram devolução
-    devolucoes_count = len(venda_com_devolucao)
+    receita_prod = juncao['receita_prod'].to_numpy()
+    receita_env = juncao['receita_env'].to_numpy()
+    
+    # Faturamento: somar receita de produtos + receita de envio
+    faturamento_produtos = soma_sequencial(receita_prod)
+    faturamento_total = soma_sequencial(receita_prod + receita_env)
+    
+    # Vendas com devolução (uma venda pode ter mais de uma linha de devolução)
+    com_devolucao = juncao['devolucoes'].to_numpy() > 0
+    
+    # Faturamento de Devoluções = receita dos produtos que foram devolvidos
+    faturamento_devolucoes = soma_sequencial(receita_prod[com_devolucao])
+    
+    # Impacto real: 'Cancelamentos e reembolsos (BRL)'; a perda total depende da classe
+    # (Saudável/Neutra: apenas custos operacionais; Crítica: produto + custos)
+    impacto_devolucao = soma_sequencial(juncao['impacto'].to_numpy()[com_devolucao])
+    perda_total = soma_sequencial(juncao['perda_total'].to_numpy()[com_devolucao])
+    perda_parcial = soma_sequencial(juncao['perda_parcial'].to_numpy()[com_devolucao])
+    
+    # Contagem de devoluções = número de vendas distintas que tiveram devolução
+    ids_devolvidos = juncao['id_venda'].to_numpy()[com_devolucao]
+    devolucoes_count = int(np.count_nonzero(np.bincount(ids_devolvidos))) if len(ids_devolvidos) > 0 else 0
     taxa_devolucao = devolucoes_count / vendas_totais if vendas_totais > 0 else 0
     
     return {
@@ -157,47 +71,78 @@ def calcular_metricas(vendas, matriz, full, max_date, dias_atras):
         'impacto_devolucao': -abs(impacto_devolucao),  # Negativo (perda)
         'perda_total': -abs(perda_total),               # Negativo (perda)
         'perda_parcial': -abs(perda_parcial),           # Negativo (perda)
-        'saudaveis': saudaveis,
-        'criticas': criticas,
-        'neutras': neutras,
+        'saudaveis': int(juncao['saudaveis'].to_numpy()[com_devolucao].sum()),
+        'criticas': int(juncao['criticas'].to_numpy()[com_devolucao].sum()),
+        'neutras': int(juncao['neutras'].to_numpy()[com_devolucao].sum()),
     }
 
-def calcular_qualidade_arquivo(data):
-    """Calcula qualidade dos arquivos com chaves corrigidas para o export"""
-    vendas = data['vendas']
-    matriz = data['matriz']
-    full = data['full']
+def calcular_metricas_janelas(vendas, juncao, max_date, janelas):
+    """
+    Calcula as métricas de várias janelas (últimos N dias até max_date) em uma única passada.
     
-    if matriz is None: matriz = pd.DataFrame()
-    if full is None: full = pd.DataFrame()
+    Cada venda é distribuída em um balde pelo número de dias antes de max_date; as somas
+    por balde são acumuladas, então qualquer lista de janelas sai das mesmas somas
+    (inclusive uma curva diária, com janelas=range(1, N + 1)).
+    Uma venda entra na janela J se 'Data da venda' >= max_date - J dias, como em aplicar_filtros.
     
-    # Qualidade Vendas
-    sem_numero = vendas['N.º de venda'].isna().sum() if 'N.º de venda' in vendas.columns else 0
-    sem_data = vendas['Data da venda'].isna().sum() if 'Data da venda' in vendas.columns else 0
-    sem_receita = vendas['Receita por produtos (BRL)'].isna().sum() if 'Receita por produtos (BRL)' in vendas.columns else 0
-    sem_sku = vendas['SKU'].isna().sum() if 'SKU' in vendas.columns else 0
+    Retorna DataFrame com uma linha por janela (coluna 'janela') e as mesmas chaves de calcular_metricas.
+    """
+    janelas = sorted({int(j) for j in janelas})
+    n_baldes = janelas[-1] + 1 if janelas else 1
     
-    # Qualidade Devoluções
-    sem_estado_matriz = matriz['Estado'].isna().sum() if len(matriz) > 0 and 'Estado' in matriz.columns else 0
-    sem_motivo_matriz = matriz['Motivo do resultado'].isna().sum() if len(matriz) > 0 and 'Motivo do resultado' in matriz.columns else 0
+    if 'Data da venda' in vendas.columns:
+        datas = vendas['Data da venda'].to_numpy(dtype='datetime64[ns]')
+    else:
+        datas = np.full(len(vendas), np.datetime64('NaT'), dtype='datetime64[ns]')
+    limite = np.datetime64(pd.Timestamp(max_date), 'ns')
     
-    sem_estado_full = full['Estado'].isna().sum() if len(full) > 0 and 'Estado' in full.columns else 0
-    sem_motivo_full = full['Motivo do resultado'].isna().sum() if len(full) > 0 and 'Motivo do resultado' in full.columns else 0
+    # Dias antes de max_date, arredondados para cima (exatamente J dias ainda está na janela J)
+    dia_ns = 86_400 * 10**9
+    atraso_ns = (limite - datas).astype('int64')
+    dias = -(-atraso_ns // dia_ns)
+    dentro = ~np.isnat(datas) & (dias < n_baldes)
+    balde = np.clip(dias[dentro], 0, None)
     
-    return {
-        'vendas': {
-            'sem_numero_venda_pct': (sem_numero / len(vendas) * 100) if len(vendas) > 0 else 0,
-            'sem_data_pct': (sem_data / len(vendas) * 100) if len(vendas) > 0 else 0,
-            'sem_receita_pct': (sem_receita / len(vendas) * 100) if len(vendas) > 0 else 0,
-            'sem_sku_pct': (sem_sku / len(vendas) * 100) if len(vendas) > 0 else 0,
-        },
-        'matriz': {
-            'sem_estado_pct': (sem_estado_matriz / len(matriz) * 100) if len(matriz) > 0 else 0,
-            'sem_motivo_pct': (sem_motivo_matriz / len(matriz) * 100) if len(matriz) > 0 else 0,
-        },
-        'full': {
-            'sem_estado_pct': (sem_estado_full / len(full) * 100) if len(full) > 0 else 0,
-            'sem_motivo_pct': (sem_motivo_full / len(full) * 100) if len(full) > 0 else 0,
-        },
-        'custo_logistico_ausente': False
-    }
+    def acumular(pesos=None):
+        return np.cumsum(np.bincount(balde, weights=pesos, minlength=n_baldes))
+    
+    receita_prod = juncao['receita_prod'].to_numpy()[dentro]
+    receita_env = juncao['receita_env'].to_numpy()[dentro]
+    com_devolucao = juncao['devolucoes'].to_numpy()[dentro] > 0
+    
+    def acumular_devolvidas(coluna):
+        return acumular(np.where(com_devolucao, juncao[coluna].to_numpy()[dentro], 0))
+    
+    vendas_acum = acumular()
+    if 'Unidades' in vendas.columns:
+        unidades_acum = acumular(vendas['Unidades'].fillna(0).to_numpy(dtype='float64')[dentro])
+    else:
+        unidades_acum = vendas_acum
+    
+    # Vendas distintas com devolução: cada venda entra a partir do seu balde mais recente
+    ids = juncao['id_venda'].to_numpy()[dentro][com_devolucao]
+    primeiro_balde = np.full(ids.max() + 1 if len(ids) > 0 else 0, n_baldes, dtype='int64')
+    np.minimum.at(primeiro_balde, ids, balde[com_devolucao])
+    primeiro_balde = primeiro_balde[primeiro_balde < n_baldes]
+    devolucoes_acum = np.cumsum(np.bincount(primeiro_balde, minlength=n_baldes))
+    
+    idx = np.array(janelas, dtype='int64')
+    vendas_j = vendas_acum[idx].astype('int64')
+    devolucoes_j = devolucoes_acum[idx].astype('int64')
+    
+    return pd.DataFrame({
+        'janela': idx,
+        'vendas': vendas_j,
+        'unidades': unidades_acum[idx].astype('int64'),
+        'faturamento_produtos': acumular(receita_prod)[idx],
+        'faturamento_total': acumular(receita_prod + receita_env)[idx],
+        'devolucoes_vendas': devolucoes_j,
+        'taxa_devolucao': np.divide(devolucoes_j, vendas_j, out=np.zeros(len(idx)), where=vendas_j > 0),
+        'faturamento_devolucoes': acumular(np.where(com_devolucao, receita_prod, 0))[idx],
+        'impacto_devolucao': -np.abs(acumular_devolvidas('impacto')[idx]),
+        'perda_total': -np.abs(acumular_devolvidas('perda_total')[idx]),
+        'perda_parcial': -np.abs(acumular_devolvidas('perda_parcial')[idx]),
+        'saudaveis': acumular_devolvidas('saudaveis')[idx].astype('int64'),
+        'criticas': acumular_devolvidas('criticas')[idx].astype('int64'),
+        'neutras': acumular_devolvidas('neutras')[idx].astype('int64'),
+    })
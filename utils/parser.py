@@ -1,20 +1,39 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
 import re
+from utils.juncao import montar_juncoes, indexar_devolucoes, preparar_devolucoes, chave_venda
+from utils.filtros import preparar_indices
+from utils.esquema import normalizar_tabelas
+from utils.qualidade import perfilar_dataset
+
+# Incrementar sempre que a saída de processar_arquivos mudar (invalida o cache em disco)
+VERSAO_PARSER = 6
+
+# Processos usados para ler vários arquivos em paralelo (1 = leitura sequencial)
+MAX_PROCESSOS_LEITURA = int(os.environ.get('DASHBOARD_PROCESSOS_LEITURA', str(os.cpu_count() or 1)))
+# Cada processo novo reimporta pandas e openpyxl (alguns segundos): com um arquivo de cada
+# tipo, a leitura só vai para processos acima deste total de bytes enviados
+MIN_BYTES_LEITURA_PARALELA = int(os.environ.get('DASHBOARD_MIN_MB_LEITURA_PARALELA', '20')) * 1024 * 1024
 
 MESES_PT = {
     'janeiro': 1, 'fevereiro': 2, 'março': 3, 'abril': 4, 'maio': 5, 'junho': 6,
     'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
 }
 
+# Formato: "24 de fevereiro de 2026 22:51 hs."
+PADRAO_DATA_PT_BR = r'(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})\s+(\d{2}):(\d{2})'
+
 def parse_date_pt_br(date_str):
     """Converte data no formato PT-BR para datetime"""
     if pd.isna(date_str) or not isinstance(date_str, str):
         return None
     
-    # Formato: "24 de fevereiro de 2026 22:51 hs."
-    pattern = r'(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})\s+(\d{2}):(\d{2})'
-    match = re.search(pattern, date_str, re.IGNORECASE)
+    match = re.search(PADRAO_DATA_PT_BR, date_str, re.IGNORECASE)
     
     if not match:
         return None
@@ -30,72 +49,251 @@ def parse_date_pt_br(date_str):
     except:
         return None
 
-def ler_vendas(file):
-    """Lê arquivo de Vendas do Mercado Livre"""
+def converter_datas_pt_br(serie):
+    """
+    Converte uma coluna inteira de datas PT-BR para datetime64[ns].
+    Equivalente a serie.apply(parse_date_pt_br), mas vetorizado: valores
+    não reconhecidos (ou datas inválidas, como 31 de fevereiro) viram NaT.
+    """
+    texto = serie.astype('string')
+    partes = texto.str.extract(PADRAO_DATA_PT_BR, flags=re.IGNORECASE)
+    
+    # Mês por lookup no índice dos nomes: posição -> número do mês (-1 = desconhecido ou vazio)
+    codigos = pd.Index(list(MESES_PT.keys())).get_indexer(partes[1].str.lower())
+    numeros_mes = np.array(list(MESES_PT.values()), dtype='float64')
+    mes = np.where(codigos >= 0, numeros_mes[codigos], np.nan)
+    
+    componentes = pd.DataFrame({
+        'year': partes[2].astype('float64'),
+        'month': mes,
+        'day': partes[0].astype('float64'),
+        'hour': partes[3].astype('float64'),
+        'minute': partes[4].astype('float64'),
+    }, index=serie.index)
+    
+    # to_datetime soma horas/minutos excedentes em vez de rejeitar (25:00 vira o dia seguinte)
+    hora_invalida = (componentes['hour'] > 23) | (componentes['minute'] > 59)
+    componentes.loc[hora_invalida, 'year'] = np.nan
+    
+    return pd.to_datetime(componentes, errors='coerce').astype('datetime64[ns]')
+
+def normalizar_planilha(df, falhas=None):
+    """
+    Limpa linhas vazias e nomes de colunas e converte datas e valores numéricos.
+    falhas: dicionário opcional preenchido, por coluna convertida, com as máscaras (uma posição
+    por linha) das células vazias e das que não puderam ser convertidas
+    ({'vazios': array, 'invalidos': array}), antes de virarem NaT/0.
+    """
+    # Remover linhas vazias
+    df = df.dropna(how='all')
+    
+    # Limpar nomes de colunas
+    df.columns = [col.strip() if isinstance(col, str) else col for col in df.columns]
+    
+    # Converter datas
+    if 'Data da venda' in df.columns:
+        original = df['Data da venda']
+        df['Data da venda'] = converter_datas_pt_br(original)
+        if falhas is not None:
+            falhas['Data da venda'] = _marcar_falhas(original, df['Data da venda'])
+    
+    # Converter números
+    for col in df.columns:
+        if isinstance(col, str) and ('BRL' in col or 'Receita' in col or 'Custo' in col or 'Taxa' in col):
+            numeros = pd.to_numeric(df[col], errors='coerce')
+            if falhas is not None:
+                falhas[col] = _marcar_falhas(df[col], numeros)
+            df[col] = numeros.fillna(0)
+    
+    return df
+
+def _marcar_falhas(original, convertida):
+    """Células vazias na origem e células preenchidas que a conversão transformou em vazio"""
+    vazios = original.isna().to_numpy()
+    return {'vazios': vazios, 'invalidos': convertida.isna().to_numpy() & ~vazios}
+
+def ler_vendas(file, falhas=None):
+    """Lê arquivo de Vendas do Mercado Livre (falhas: ver normalizar_planilha)"""
     try:
         # Ler com cabeçalho na linha 6 (índice 5)
         df = pd.read_excel(file, sheet_name='Vendas BR', header=5)
-        
-        # Remover linhas vazias
-        df = df.dropna(how='all')
-        
-        # Limpar nomes de colunas
-        df.columns = [col.strip() if isinstance(col, str) else col for col in df.columns]
-        
-        # Converter datas
-        if 'Data da venda' in df.columns:
-            df['Data da venda'] = df['Data da venda'].apply(parse_date_pt_br)
-        
-        # Converter números
-        for col in df.columns:
-            if isinstance(col, str) and ('BRL' in col or 'Receita' in col or 'Custo' in col or 'Taxa' in col):
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-        return df
+        return normalizar_planilha(df, falhas)
     
     except Exception as e:
         raise Exception(f"Erro ao ler vendas: {str(e)}")
 
-def ler_devolucoes(file):
-    """Lê arquivo de Devoluções do Mercado Livre"""
+def ler_devolucoes(file, falhas=None):
+    """
+    Lê arquivo de Devoluções do Mercado Livre.
+    A planilha é aberta uma única vez e apenas as abas Matriz/Full são lidas;
+    as demais abas são descartadas pelo nome, sem ler suas células.
+    falhas: dicionário opcional preenchido em falhas['matriz'] e falhas['full'] (ver normalizar_planilha)
+    """
+    if falhas is None:
+        falhas = {}
     try:
-        xls = pd.ExcelFile(file)
-        
-        matriz = None
-        full = None
-        
-        # Procurar pelas abas
-        for sheet in xls.sheet_names:
-            sheet_lower = sheet.lower()
-            
-            # Ler com cabeçalho na linha 6 (índice 5)
-            df = pd.read_excel(file, sheet_name=sheet, header=5)
-            df = df.dropna(how='all')
-            df.columns = [col.strip() if isinstance(col, str) else col for col in df.columns]
-            
-            # Converter datas
-            if 'Data da venda' in df.columns:
-                df['Data da venda'] = df['Data da venda'].apply(parse_date_pt_br)
+        with pd.ExcelFile(file) as xls:
+            # Procurar pelas abas (a última aba com o nome correspondente prevalece)
+            aba_matriz = None
+            aba_full = None
+            for sheet in xls.sheet_names:
+                sheet_lower = sheet.lower()
+                if 'matriz' in sheet_lower:
+                    aba_matriz = sheet
+                elif 'full' in sheet_lower:
+                    aba_full = sheet
             
-            # Converter números
-            for col in df.columns:
-                if isinstance(col, str) and ('BRL' in col or 'Receita' in col or 'Custo' in col or 'Taxa' in col):
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            
-            if 'matriz' in sheet_lower:
-                matriz = df
-            elif 'full' in sheet_lower:
-                full = df
+            # Ler com cabeçalho na linha 6 (índice 5), reaproveitando o mesmo handle
+            matriz = normalizar_planilha(xls.parse(aba_matriz, header=5), falhas.setdefault('matriz', {})) if aba_matriz is not None else None
+            full = normalizar_planilha(xls.parse(aba_full, header=5), falhas.setdefault('full', {})) if aba_full is not None else None
         
         return matriz, full
     
     except Exception as e:
         raise Exception(f"Erro ao ler devoluções: {str(e)}")
 
-def processar_arquivos(file_vendas, file_devolucoes):
-    """Processa ambos os arquivos"""
-    vendas = ler_vendas(file_vendas)
-    matriz, full = ler_devolucoes(file_devolucoes)
+def ler_bytes(file):
+    """Lê o conteúdo de um upload (UploadedFile, arquivo aberto ou caminho) sem consumir o arquivo"""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return f.read()
+    if hasattr(file, 'getvalue'):
+        return file.getvalue()
+    posicao = file.tell()
+    file.seek(0)
+    conteudo = file.read()
+    file.seek(posicao)
+    return conteudo
+
+def como_lista(files):
+    """Um arquivo ou uma lista de arquivos -> lista"""
+    return list(files) if isinstance(files, (list, tuple)) else [files]
+
+def _ler_arquivo(tipo, file):
+    """Lê um arquivo de vendas ou de devoluções: retorna ({tabela: DataFrame}, falhas por tabela)"""
+    if tipo == 'vendas':
+        falhas = {'vendas': {}}
+        return {'vendas': ler_vendas(file, falhas['vendas'])}, falhas
+    falhas = {}
+    matriz, full = ler_devolucoes(file, falhas)
+    return {'matriz': matriz, 'full': full}, falhas
+
+def _tamanho_arquivo(file):
+    """Bytes de um upload (UploadedFile, arquivo aberto ou caminho) sem ler o conteúdo"""
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.getsize(file)
+    if hasattr(file, 'getbuffer'):
+        return file.getbuffer().nbytes
+    return len(ler_bytes(file))
+
+def _ler_bytes_arquivo(tipo, conteudo):
+    # Executado nos processos de leitura: recebe os bytes (picklable), não o upload
+    return _ler_arquivo(tipo, BytesIO(conteudo))
+
+def ler_arquivos(tarefas, max_processos=None):
+    """
+    Lê os arquivos [(tipo, file), ...] na ordem recebida. A leitura do openpyxl usa só CPU
+    (e o GIL): com vários arquivos do mesmo tipo (ex.: um por mês), ou acima de
+    MIN_BYTES_LEITURA_PARALELA, cada arquivo é lido em um processo separado.
+    """
+    if max_processos is None:
+        max_processos = MAX_PROCESSOS_LEITURA
+    processos = min(max_processos, len(tarefas))
+    tipos = [tipo for tipo, _ in tarefas]
+    varios_por_tipo = len(set(tipos)) < len(tipos)
+    if processos > 1 and not varios_por_tipo:
+        # Upload comum (um arquivo de vendas e um de devoluções): iniciar os processos custa
+        # mais que ler em sequência, exceto para arquivos grandes
+        if sum(_tamanho_arquivo(file) for _, file in tarefas) < MIN_BYTES_LEITURA_PARALELA:
+            processos = 1
+    if processos <= 1:
+        return [_ler_arquivo(tipo, file) for tipo, file in tarefas]
+    
+    # 'spawn': o Streamlit roda com várias threads, e fork() com threads pode travar
+    with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futuros = [executor.submit(_ler_bytes_arquivo, tipo, ler_bytes(file)) for tipo, file in tarefas]
+        return [futuro.result() for futuro in futuros]
+
+def _data_mais_recente(df):
+    if 'Data da venda' not in df.columns or df['Data da venda'].isna().all():
+        return pd.Timestamp.min
+    return df['Data da venda'].max()
+
+def combinar_arquivos(tabelas, falhas=None):
+    """
+    Concatena a mesma tabela vinda de vários arquivos (ex.: exportações mensais sobrepostas).
+    Cada N.º de venda fica só com as linhas do arquivo mais recente que o contém (o de
+    'Data da venda' mais recente; em empate, o último enviado), então repetições dentro
+    de um mesmo arquivo (ex.: várias devoluções da mesma venda) são mantidas.
+    falhas: máscaras de falhas de conversão de cada tabela (ver normalizar_planilha), na mesma ordem.
+    Retorna (tabela, linhas descartadas, falhas por coluna contadas só nas linhas mantidas).
+    """
+    if falhas is None:
+        falhas = [None] * len(tabelas)
+    pares = [(df, marcas or {}) for df, marcas in zip(tabelas, falhas) if df is not None]
+    if not pares:
+        return None, 0, {}
+    if len(pares) == 1:
+        df, marcas = pares[0]
+        return df, 0, _contar_falhas([marcas], [len(df)])
+    
+    pares = [pares[i] for _, i in sorted((_data_mais_recente(df), i) for i, (df, _) in enumerate(pares))]
+    tabelas = [df for df, _ in pares]
+    tamanhos = [len(df) for df in tabelas]
+    df = pd.concat(tabelas, ignore_index=True)
+    if 'N.º de venda' not in df.columns:
+        return df, 0, _contar_falhas([marcas for _, marcas in pares], tamanhos)
+    
+    arquivo = np.repeat(np.arange(len(tabelas)), tamanhos)
+    codigos, chaves = pd.factorize(chave_venda(df['N.º de venda']))
+    validos = codigos >= 0
+    ultimo_arquivo = np.full(len(chaves), -1)
+    np.maximum.at(ultimo_arquivo, codigos[validos], arquivo[validos])
+    # N.º de venda vazio não identifica a venda: a linha é mantida
+    manter = ~validos | (arquivo == ultimo_arquivo[codigos])
+    falhas = _contar_falhas([marcas for _, marcas in pares], tamanhos, manter)
+    return df[manter].reset_index(drop=True), int((~manter).sum()), falhas
+
+def _contar_falhas(marcas, tamanhos, manter=None):
+    """
+    Soma as máscaras de falhas de conversão de várias tabelas concatenadas, por coluna.
+    manter: linhas que ficam após a deduplicação (None = todas)
+    """
+    total = {}
+    for col in dict.fromkeys(col for falhas in marcas for col in falhas):
+        contagem = {}
+        for tipo in ('vazios', 'invalidos'):
+            mascara = np.concatenate([
+                falhas[col][tipo] if col in falhas else np.zeros(tamanho, dtype=bool)
+                for falhas, tamanho in zip(marcas, tamanhos)
+            ])
+            contagem[tipo] = int(mascara[manter].sum() if manter is not None else mascara.sum())
+        total[col] = contagem
+    return total
+
+def processar_arquivos(file_vendas, file_devolucoes, max_processos=None):
+    """
+    Processa os arquivos de vendas e de devoluções.
+    file_vendas / file_devolucoes: um arquivo ou uma lista de arquivos (ex.: um por mês)
+    """
+    arquivos_vendas = como_lista(file_vendas)
+    arquivos_devolucoes = como_lista(file_devolucoes)
+    lidos = ler_arquivos([('vendas', f) for f in arquivos_vendas] + [('devolucoes', f) for f in arquivos_devolucoes],
+                         max_processos)
+    
+    # Vários arquivos: concatenar e manter cada venda apenas do arquivo mais recente.
+    # As células não convertidas (datas/valores), usadas no perfil de qualidade, são
+    # contadas só nas linhas mantidas
+    falhas = {}
+    vendas, descartadas_vendas, falhas['vendas'] = combinar_arquivos(
+        [tabelas.get('vendas') for tabelas, _ in lidos], [marcas.get('vendas') for _, marcas in lidos])
+    matriz, descartadas_matriz, falhas['matriz'] = combinar_arquivos(
+        [tabelas.get('matriz') for tabelas, _ in lidos], [marcas.get('matriz') for _, marcas in lidos])
+    full, descartadas_full, falhas['full'] = combinar_arquivos(
+        [tabelas.get('full') for tabelas, _ in lidos], [marcas.get('full') for _, marcas in lidos])
+    
+    # Tipos compactos (category, texto Arrow, float32), sem descartar colunas
+    vendas, matriz, full, esquema = normalizar_tabelas(vendas, matriz, full)
     
     # Data máxima
     if 'Data da venda' in vendas.columns:
@@ -105,11 +303,29 @@ def processar_arquivos(file_vendas, file_devolucoes):
     else:
         max_date = datetime.now()
     
+    # Devoluções indexadas por N.º de venda (CSR), base das junções por canal
+    indice_devolucoes = indexar_devolucoes(vendas, preparar_devolucoes(matriz, full))
+    
     return {
         'vendas': vendas,
         'matriz': matriz,
         'full': full,
+        'indice_devolucoes': indice_devolucoes,
+        # Perfil de qualidade calculado uma única vez na leitura (Resumo e export)
+        'qualidade': perfilar_dataset(vendas, matriz, full, indice_devolucoes, falhas),
+        # Junção venda ↔ devolução por canal, montada uma única vez no upload
+        'juncoes': montar_juncoes(vendas, indice=indice_devolucoes),
+        # Arrays de datas e N.º de venda usados pelos filtros globais
+        'indices': preparar_indices(vendas, matriz, full),
         'max_date': max_date,
+        # Memória das tabelas antes/depois da normalização do esquema
+        'esquema': esquema,
+        # Arquivos lidos e linhas substituídas por versões mais recentes da mesma venda
+        'ingestao': {
+            'arquivos_vendas': len(arquivos_vendas),
+            'arquivos_devolucoes': len(arquivos_devolucoes),
+            'linhas_descartadas': {'vendas': descartadas_vendas, 'matriz': descartadas_matriz, 'full': descartadas_full},
+        },
         'total_vendas': len(vendas),
         'total_matriz': len(matriz) if matriz is not None else 0,
         'total_full': len(full) if full is not None else 0,
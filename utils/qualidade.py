@@ -0,0 +1,113 @@
+"""
+Perfil de qualidade dos arquivos, calculado uma única vez na leitura.
+
+O perfil fica guardado com o dataset (data['qualidade'], também no cache em
+disco), e a aba Resumo e o export apenas o leem. Por tabela (vendas, matriz, full):
+- linhas: quantidade de linhas
+- nulos: células vazias por coluna (para datas e valores, contadas antes da conversão)
+- datas_invalidas: 'Data da venda' preenchida, mas fora do formato PT-BR
+- valores_invalidos: células de valores em R$ não numéricas, zeradas por pd.to_numeric(errors='coerce')
+- numeros_duplicados (vendas): linhas cujo N.º de venda já apareceu antes
+- sem_venda (matriz/full): devoluções sem venda correspondente no relatório de vendas
+"""
+
+import numpy as np
+
+from utils.juncao import indexar_devolucoes, preparar_devolucoes
+
+
+def perfilar_tabela(df, falhas=None):
+    """Perfil de uma tabela; falhas: contagens da conversão registradas por normalizar_planilha"""
+    falhas = falhas or {}
+
+    # Uma única varredura de vazios para todas as colunas
+    nulos = {str(col): int(n) for col, n in df.isna().sum().items()}
+    for col, contagem in falhas.items():
+        if col in nulos:
+            nulos[col] = contagem['vazios']
+
+    return {
+        'linhas': len(df),
+        'nulos': nulos,
+        'datas_invalidas': falhas.get('Data da venda', {}).get('invalidos', 0),
+        'valores_invalidos': {
+            col: contagem['invalidos'] for col, contagem in falhas.items()
+            if col != 'Data da venda' and contagem['invalidos'] > 0
+        },
+    }
+
+
+def perfilar_dataset(vendas, matriz, full, indice_devolucoes, falhas=None):
+    """
+    Perfil de qualidade de vendas, matriz e full.
+    indice_devolucoes: índice CSR de indexar_devolucoes (usado para duplicados e devoluções sem venda)
+    """
+    falhas = falhas or {}
+    ids_vendas = indice_devolucoes['ids_vendas']
+    # As chaves das vendas recebem os primeiros códigos do índice: 0 .. n_chaves_vendas - 1
+    n_chaves_vendas = int(ids_vendas.max()) + 1 if len(ids_vendas) > 0 and ids_vendas.max() >= 0 else 0
+
+    qualidade = {'vendas': perfilar_tabela(vendas, falhas.get('vendas'))}
+    qualidade['vendas']['numeros_duplicados'] = int((ids_vendas >= 0).sum()) - n_chaves_vendas
+
+    offsets = indice_devolucoes['offsets']
+    ids_devolucoes = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    com_venda = ids_devolucoes < n_chaves_vendas
+    canais = indice_devolucoes['colunas']['canal']
+
+    for nome, canal, df in (('matriz', 'Matriz', matriz), ('full', 'Full', full)):
+        if df is None:
+            continue
+        qualidade[nome] = perfilar_tabela(df, falhas.get(nome))
+        qualidade[nome]['sem_venda'] = len(df) - int((com_venda & np.asarray(canais == canal)).sum())
+
+    return qualidade
+
+
+def obter_qualidade(data):
+    """Perfil guardado com o dataset ou, se ausente, calculado na hora (sem as falhas de conversão)"""
+    if data.get('qualidade') is not None:
+        return data['qualidade']
+    vendas, matriz, full = data['vendas'], data['matriz'], data['full']
+    indice = data.get('indice_devolucoes') or indexar_devolucoes(vendas, preparar_devolucoes(matriz, full))
+    return perfilar_dataset(vendas, matriz, full, indice)
+
+
+def _percentual(quantidade, total):
+    return quantidade / total if total > 0 else 0
+
+
+def linhas_qualidade(qualidade):
+    """
+    Indicadores exibidos no Resumo e no export: lista de [indicador, ocorrências, fração (0 a 1)].
+    """
+    linhas = []
+    vendas = qualidade.get('vendas')
+    if vendas:
+        n = vendas['linhas']
+        nulos = vendas['nulos']
+        sem_data = nulos.get('Data da venda', 0) + vendas['datas_invalidas']
+        linhas += [
+            ['Vendas: SKUs não identificados', nulos.get('SKU', 0)],
+            ['Vendas: Datas ausentes', sem_data],
+            ['Vendas: N.º de venda ausente', nulos.get('N.º de venda', 0)],
+            ['Vendas: N.º de venda duplicado', vendas['numeros_duplicados']],
+            ['Vendas: Datas em formato inválido', vendas['datas_invalidas']],
+            ['Vendas: Valores em R$ não numéricos', sum(vendas['valores_invalidos'].values())],
+        ]
+        linhas = [[indicador, quantidade, _percentual(quantidade, n)] for indicador, quantidade in linhas]
+
+    for nome, rotulo in (('matriz', 'Devoluções Matriz'), ('full', 'Devoluções Full')):
+        tabela = qualidade.get(nome)
+        if not tabela:
+            continue
+        n = tabela['linhas']
+        for indicador, quantidade in (
+            ('Sem motivo informado', tabela['nulos'].get('Motivo do resultado', 0)),
+            ('Sem estado do produto', tabela['nulos'].get('Estado', 0)),
+            ('Sem venda correspondente', tabela['sem_venda']),
+            ('Valores em R$ não numéricos', sum(tabela['valores_invalidos'].values())),
+        ):
+            linhas.append([f'{rotulo}: {indicador}', quantidade, _percentual(quantidade, n)])
+
+    return linhas
@@ -0,0 +1,185 @@
+"""
+Motor de regras para classificação de devoluções.
+
+As regras são dados: cada regra tem um rótulo, os termos procurados em cada
+campo (teste "termo in texto.lower()") e, opcionalmente, um requisito extra
+informado pelo chamador. A primeira regra satisfeita, na ordem da lista, vence.
+
+Na compilação, todos os termos de um campo viram uma única regex de alternação.
+A classificação avalia cada valor distinto do campo uma única vez e replica o
+resultado para as linhas pelos códigos categóricos (pd.factorize), então o custo
+cresce com a quantidade de textos diferentes, não com a quantidade de linhas.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Classificação do estado da devolução (Saudável / Crítica / Neutra)
+REGRAS_ESTADO = [
+    # Saudável: produto foi devolvido e aceito
+    {'rotulo': 'Saudável', 'termos': {'estado': [
+        'colocamos o produto à venda novamente',
+        'devolvemos o produto ao comprador',
+        'reembolsamos o dinheiro',
+    ]}},
+    # Crítica: devolução problemática ou cancelada
+    {'rotulo': 'Crítica', 'termos': {'estado': [
+        'cancelada', 'mediação', 'reclamação', 'revisão',
+    ]}},
+]
+# Neutra: em processo
+PADRAO_ESTADO = 'Neutra'
+
+# Inferência de motivo para devoluções sem 'Motivo do resultado'.
+# Campos: estado_dev / status_dev (devolução) e estado_venda / status_venda (venda correspondente)
+REGRAS_MOTIVO = [
+    # Prioridade 1: Motivos de cancelamento explícitos no relatório de vendas
+    {'rotulo': 'Cancelado: Falta de Estoque', 'termos': {
+        'status_venda': ['estoque'], 'estado_venda': ['estoque']}},
+    {'rotulo': 'Cancelado: Arrependimento do Comprador', 'termos': {
+        'status_venda': ['arrependeu', 'arrependimento'], 'status_dev': ['se arrependeu']}},
+    {'rotulo': 'Cancelado pelo Vendedor', 'termos': {'estado_venda': ['você cancelou']}},
+    {'rotulo': 'Cancelado pelo Comprador', 'termos': {'estado_venda': ['cancelada pelo comprador']}},
+
+    # Prioridade 2: Detalhamento de problemas técnicos/logísticos
+    {'rotulo': 'Produto com Defeito / Não funciona', 'termos': {'status_dev': ['não funciona', 'defeito']}},
+    {'rotulo': 'Produto Incompleto / Faltando Peças', 'termos': {'status_dev': ['incompleto', 'faltando']}},
+    {'rotulo': 'Produto com Defeito (Embalagem OK)', 'termos': {
+        'status_dev': ['embalagem estava em ordem mas o produto não funciona']}},
+    {'rotulo': 'Atraso na Entrega / Logística', 'termos': {'status_venda': ['atraso'], 'status_dev': ['atraso']}},
+
+    # Prioridade 3: Lógica baseada no estado da devolução/venda
+    {'rotulo': 'Reembolso ao Vendedor (Proteção)', 'termos': {
+        'estado_dev': ['te demos o dinheiro'], 'status_dev': ['te demos o dinheiro'], 'status_venda': ['te demos o dinheiro']}},
+
+    # Se houve tarifa de envio negativa, é uma devolução física
+    {'rotulo': 'Devolução Física com Reembolso', 'requer': 'tarifa_envio_negativa', 'termos': {
+        'estado_dev': ['reembolso'], 'status_dev': ['reembolsamos']}},
+    {'rotulo': 'Devolução Física em Processo', 'requer': 'tarifa_envio_negativa', 'termos': {}},
+
+    {'rotulo': 'Reembolso Direto ao Comprador', 'termos': {
+        'estado_dev': ['reembolso'], 'status_dev': ['reembolsamos'], 'estado_venda': ['reembolso']}},
+    {'rotulo': 'Finalizado via Mediação', 'termos': {
+        'estado_dev': ['mediação'], 'status_dev': ['mediação'], 'status_venda': ['mediação']}},
+    {'rotulo': 'Devolução não realizada', 'termos': {'estado_dev': ['não entregue', 'não foi feita']}},
+    {'rotulo': 'Produto devolvido ao comprador', 'termos': {
+        'estado_dev': ['enviamos de volta', 'devolvemos o produto ao comprador']}},
+    {'rotulo': 'Devolução Concluída', 'termos': {'estado_dev': ['devolvido', 'devolução finalizada']}},
+]
+PADRAO_MOTIVO = 'Outros Motivos de Devolução'
+
+
+def compilar_regras(regras, padrao):
+    """
+    Compila a tabela de regras: por campo, uma regex de alternação com todos os termos
+    e o conjunto de regras (bits) que cada termo satisfaz.
+    """
+    if len(regras) > 63:
+        raise ValueError("Máximo de 63 regras por tabela")
+
+    bits_por_campo = {}
+    for i, regra in enumerate(regras):
+        for campo, termos in regra.get('termos', {}).items():
+            bits_termo = bits_por_campo.setdefault(campo, {})
+            for termo in termos:
+                termo = termo.lower()
+                bits_termo[termo] = bits_termo.get(termo, 0) | (1 << i)
+
+    campos = {}
+    for campo, bits_termo in bits_por_campo.items():
+        # Termos mais longos primeiro: em cada posição a regex devolve o maior termo encontrado.
+        # Os demais termos que casam na mesma posição são prefixos dele, então seus bits
+        # são somados ao bit do termo maior.
+        termos = sorted(bits_termo, key=len, reverse=True)
+        regex = re.compile('(?=(' + '|'.join(re.escape(t) for t in termos) + '))')
+        bits = {}
+        for termo in termos:
+            bits[termo] = 0
+            for outro in termos:
+                if termo.startswith(outro):
+                    bits[termo] |= bits_termo[outro]
+        campos[campo] = (regex, bits)
+
+    return {
+        'campos': campos,
+        'rotulos': [regra['rotulo'] for regra in regras],
+        'requisitos': [regra.get('requer') for regra in regras],
+        # Regras sem termos são satisfeitas apenas pelo requisito
+        'sem_termos': [not regra.get('termos') for regra in regras],
+        'padrao': padrao,
+    }
+
+
+def _bits_texto(texto, regex, bits):
+    """Bits das regras satisfeitas por um único texto (já em minúsculas)"""
+    resultado = 0
+    for match in regex.finditer(texto):
+        resultado |= bits[match.group(1)]
+    return resultado
+
+
+def _bits_campo(valores, regex, bits):
+    """Avalia cada valor distinto do campo uma vez e replica para as linhas pelos códigos"""
+    codigos, unicos = pd.factorize(valores)
+    bits_unicos = np.array([_bits_texto(str(valor).lower(), regex, bits) for valor in unicos] + [0], dtype=np.int64)
+    # Código -1 (vazio) aponta para o último elemento, que é 0
+    return bits_unicos[codigos]
+
+
+def aplicar_regras(compiladas, campos, requisitos=None, tamanho=None):
+    """
+    Classifica linhas pela primeira regra satisfeita.
+    campos: dict nome_do_campo -> Series/array de textos (todas com o mesmo tamanho)
+    requisitos: dict nome -> array booleano, para regras com 'requer'
+    Retorna um array de rótulos.
+    """
+    requisitos = requisitos or {}
+    if tamanho is None:
+        tamanho = len(next(iter(campos.values()))) if campos else 0
+
+    satisfeitas = np.zeros(tamanho, dtype=np.int64)
+    for campo, (regex, bits) in compiladas['campos'].items():
+        if campo in campos:
+            satisfeitas |= _bits_campo(campos[campo], regex, bits)
+
+    condicoes = []
+    for i, requisito in enumerate(compiladas['requisitos']):
+        if compiladas['sem_termos'][i]:
+            condicao = np.ones(tamanho, dtype=bool)
+        else:
+            condicao = (satisfeitas >> i) & 1 == 1
+        if requisito is not None:
+            condicao = condicao & np.asarray(requisitos.get(requisito, np.zeros(tamanho, dtype=bool)), dtype=bool)
+        condicoes.append(condicao)
+
+    if not condicoes:
+        return np.full(tamanho, compiladas['padrao'], dtype=object)
+    return np.select(condicoes, compiladas['rotulos'], default=compiladas['padrao']).astype(object)
+
+
+REGRAS_ESTADO_COMPILADAS = compilar_regras(REGRAS_ESTADO, PADRAO_ESTADO)
+REGRAS_MOTIVO_COMPILADAS = compilar_regras(REGRAS_MOTIVO, PADRAO_MOTIVO)
+
+
+def classificar_estados(estados):
+    """Classifica uma coluna inteira de estados de devolução (Saudável / Crítica / Neutra)"""
+    estados = pd.Series(estados)
+    rotulos = aplicar_regras(REGRAS_ESTADO_COMPILADAS, {'estado': estados})
+    return pd.Series(rotulos, index=estados.index)
+
+
+def inferir_motivos(estado_dev, status_dev, estado_venda, status_venda, tarifa_envio_negativa):
+    """Infere o motivo de devoluções sem 'Motivo do resultado' a partir dos estados/status"""
+    return aplicar_regras(
+        REGRAS_MOTIVO_COMPILADAS,
+        {
+            'estado_dev': estado_dev,
+            'status_dev': status_dev,
+            'estado_venda': estado_venda,
+            'status_venda': status_venda,
+        },
+        requisitos={'tarifa_envio_negativa': tarifa_envio_negativa},
+        tamanho=len(estado_dev),
+    )
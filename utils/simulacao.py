@@ -0,0 +1,213 @@
+"""
+Simulador Monte Carlo de redução de devoluções.
+
+Os segmentos (itens ou motivos) contam vendas distintas devolvidas, na mesma
+unidade dos cards de métricas: cada venda devolvida pertence a um único
+segmento, então os totais por item e por motivo batem com os atuais.
+Uma redução de X pontos percentuais na taxa global vira um fator (devoluções
+a evitar / devoluções dos segmentos-alvo), e cada devolução observada de um
+segmento-alvo é evitada com essa probabilidade (afinamento binomial): com
+redução 0 nada é evitado. Todas as reduções pedidas (ex.: cada valor do
+slider) são sorteadas juntas, em lote, com NumPy. O resultado traz a
+distribuição (P10/P50/P90) das devoluções evitadas e da economia para cada
+redução; a interface só indexa a tabela.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.juncao import obter_juncao
+from utils.analises import coluna_itens, motivos_devolucoes
+
+N_SIMULACOES = 500
+
+# Acima deste número de segmentos, os de menor perda são agrupados (mesma média)
+MAX_SEGMENTOS = 500
+
+# Limite de sorteios mantidos em memória por bloco (reduções x simulações x segmentos)
+SORTEIOS_POR_BLOCO = 4_000_000
+
+ALVOS = ('todos', 'top_itens', 'motivo')
+
+
+def _segmentos(juncao, segmento, vendas_por_segmento):
+    """
+    Devoluções e perda por segmento, contando cada venda devolvida uma única vez: no
+    segmento da sua primeira linha, com a soma do impacto de todas as linhas dela
+    (mesma contagem e mesma perda de calcular_metricas).
+    segmento: valor de cada linha da junção; vendas_por_segmento: Series segmento -> vendas
+    """
+    devolvida = juncao['devolucoes'].to_numpy() > 0
+    ids = juncao['id_venda'].to_numpy()[devolvida]
+    perda_venda = np.bincount(ids, weights=juncao['impacto'].to_numpy()[devolvida]) if len(ids) > 0 else np.zeros(0)
+    primeira = ~pd.Series(ids).duplicated().to_numpy()
+
+    devolvidas = pd.DataFrame({
+        'segmento': np.asarray(segmento, dtype=object)[devolvida][primeira],
+        'perda': perda_venda[ids[primeira]],
+    })
+    grupos = devolvidas.groupby('segmento', sort=False).agg(
+        devolucoes=('perda', 'size'),
+        perda=('perda', 'sum'),
+    )
+    grupos = grupos.reindex(grupos.index.union(vendas_por_segmento.index, sort=False)).fillna(0)
+    return pd.DataFrame({
+        'segmento': grupos.index,
+        'vendas': vendas_por_segmento.reindex(grupos.index, fill_value=0).to_numpy(dtype='int64'),
+        'devolucoes': grupos['devolucoes'].to_numpy(dtype='int64'),
+        'perda': grupos['perda'].to_numpy(dtype='float64'),
+    })
+
+
+def segmentos_por_item(vendas, juncao, agrupar_por='SKU'):
+    """Segmentos por item (SKU ou título): vendas, vendas devolvidas e perda (soma de |reembolso|)"""
+    _, itens = coluna_itens(vendas, agrupar_por)
+    itens = itens.reindex(juncao.index)
+    return _segmentos(juncao, itens.to_numpy(), itens.value_counts(sort=False))
+
+
+def segmentos_por_motivo(vendas, matriz, full, juncao):
+    """
+    Segmentos por motivo: cada venda devolvida entra no motivo da sua primeira devolução
+    (Matriz antes de Full); vendas devolvidas sem motivo encontrado ficam em 'Não identificado'.
+    """
+    devolucoes = motivos_devolucoes(vendas, matriz, full)
+    if devolucoes is None or len(devolucoes) == 0:
+        return pd.DataFrame({'segmento': [], 'vendas': [], 'devolucoes': [], 'perda': []})
+
+    motivo_da_venda = devolucoes.drop_duplicates('chave').set_index('chave')['motivo']
+    motivos = juncao['chave'].map(motivo_da_venda).fillna('Não identificado')
+    segmentos = _segmentos(juncao, motivos.to_numpy(), pd.Series(dtype='int64'))
+    return segmentos.assign(vendas=len(vendas))
+
+
+def _agrupar_segmentos(devolucoes, perda, alvo, max_segmentos):
+    """
+    Mantém os max_segmentos de maior perda e agrupa o restante em um segmento por valor
+    de 'alvo' (o fator é o mesmo no grupo, então a soma das binomiais é a binomial da soma).
+    """
+    if len(devolucoes) <= max_segmentos:
+        return devolucoes, perda, alvo
+
+    manter = np.zeros(len(devolucoes), dtype=bool)
+    manter[np.argpartition(-perda, max_segmentos - 2)[:max_segmentos - 2]] = True
+
+    partes = [(devolucoes[manter], perda[manter], alvo[manter])]
+    for valor in (False, True):
+        resto = ~manter & (alvo == valor)
+        if resto.any():
+            partes.append((
+                np.array([devolucoes[resto].sum()]),
+                np.array([perda[resto].sum()]),
+                np.array([valor]),
+            ))
+    return tuple(np.concatenate(coluna) for coluna in zip(*partes))
+
+
+def simular_cenarios(segmentos, reducoes, vendas_totais, alvo=None, n_simulacoes=N_SIMULACOES,
+                     semente=0, max_segmentos=MAX_SEGMENTOS):
+    """
+    Simula, em lote, cada redução da taxa global de devolução.
+    segmentos: DataFrame com 'devolucoes' e 'perda' por segmento
+    reducoes: reduções em pontos percentuais da taxa global (ex.: valores do slider)
+    vendas_totais: vendas do período, base da taxa global
+    alvo: máscara booleana dos segmentos que recebem a redução (None = todos)
+    Retorna DataFrame indexado por 'reducao' com o fator aplicado aos segmentos-alvo e os
+    percentis P10/P50/P90 (e a média) das devoluções evitadas e da economia em R$.
+    """
+    reducoes = np.asarray(list(reducoes), dtype='float64')
+
+    alvo = np.ones(len(segmentos), dtype=bool) if alvo is None else np.asarray(alvo, dtype=bool)
+    if len(alvo) != len(segmentos):
+        raise ValueError("A máscara 'alvo' deve ter um valor por segmento")
+
+    # Segmentos sem devolução não contribuem
+    com_devolucao = (segmentos['devolucoes'] > 0).to_numpy()
+    devolucoes = segmentos['devolucoes'].to_numpy(dtype='int64')[com_devolucao]
+    perda = segmentos['perda'].to_numpy(dtype='float64')[com_devolucao]
+    alvo = alvo[com_devolucao]
+
+    devolucoes, perda, alvo = _agrupar_segmentos(devolucoes, perda, alvo, max_segmentos)
+
+    # Redução pedida (em devoluções) distribuída proporcionalmente entre os segmentos-alvo
+    devolucoes_alvo = devolucoes[alvo].sum()
+    evitadas_pedidas = reducoes / 100 * vendas_totais
+    if devolucoes_alvo > 0:
+        fator = np.minimum(evitadas_pedidas / devolucoes_alvo, 1.0)
+    else:
+        fator = np.zeros(len(reducoes))
+
+    perda_media = perda / np.maximum(devolucoes, 1)
+    # Probabilidade de evitar cada devolução observada: (reduções, segmentos)
+    prob_evitar = fator[:, None] * alvo[None, :]
+
+    rng = np.random.default_rng(semente)
+    evitadas = np.zeros((len(reducoes), n_simulacoes))
+    economia = np.zeros((len(reducoes), n_simulacoes))
+
+    bloco = max(1, SORTEIOS_POR_BLOCO // max(1, len(reducoes) * n_simulacoes))
+    for inicio in range(0, len(devolucoes), bloco):
+        fatia = slice(inicio, inicio + bloco)
+        # Devoluções evitadas de cada segmento em cada simulação: (reduções, simulações, segmentos)
+        sorteio = rng.binomial(
+            devolucoes[fatia][None, None, :],
+            prob_evitar[:, None, fatia],
+            size=(len(reducoes), n_simulacoes, len(devolucoes[fatia])),
+        )
+        evitadas += sorteio.sum(axis=2)
+        economia += sorteio @ perda_media[fatia]
+
+    p_evitadas = np.percentile(evitadas, [10, 50, 90], axis=1)
+    p_economia = np.percentile(economia, [10, 50, 90], axis=1)
+
+    return pd.DataFrame({
+        'fator': fator,
+        'evitadas_p10': p_evitadas[0],
+        'evitadas_p50': p_evitadas[1],
+        'evitadas_p90': p_evitadas[2],
+        'economia_p10': p_economia[0],
+        'economia_p50': p_economia[1],
+        'economia_p90': p_economia[2],
+        'economia_media': economia.mean(axis=1),
+    }, index=pd.Index(reducoes, name='reducao'))
+
+
+def simular_reducao_monte_carlo(vendas, matriz, full, max_date, dias_atras, reducoes, alvo='todos',
+                                agrupar_por='SKU', top_n=10, motivo=None, juncao=None,
+                                n_simulacoes=N_SIMULACOES, semente=0):
+    """
+    Simulador Monte Carlo sobre os dados já filtrados pelo cabeçalho global.
+    alvo: 'todos' (todos os itens), 'top_itens' (top_n itens de maior perda) ou 'motivo'
+    motivo: rótulo do motivo-alvo, como exibido por analisar_motivos
+    reducoes: reduções em pontos percentuais da taxa global a simular (todas em um único lote)
+    """
+    if alvo not in ALVOS:
+        raise ValueError(f"Alvo desconhecido: {alvo}")
+
+    juncao = obter_juncao(vendas, matriz, full, juncao)
+
+    if alvo == 'motivo':
+        segmentos = segmentos_por_motivo(vendas, matriz, full, juncao)
+        # Comparar pelo rótulo exibido na aba Motivos (limitado a 50 caracteres)
+        mascara = (segmentos['segmento'].astype(str).str[:50] == motivo).to_numpy()
+    else:
+        segmentos = segmentos_por_item(vendas, juncao, agrupar_por)
+        if alvo == 'top_itens':
+            mascara = np.zeros(len(segmentos), dtype=bool)
+            mascara[segmentos['perda'].nlargest(top_n).index] = True
+        else:
+            mascara = None
+
+    return simular_cenarios(segmentos, reducoes, len(vendas), alvo=mascara,
+                            n_simulacoes=n_simulacoes, semente=semente)
+
+
+def grade_cenarios(cenarios, devolucoes_atuais, impacto_atual):
+    """
+    Completa a tabela de simular_cenarios com os valores exibidos por posição do slider
+    (cenário P50): devoluções e perda simuladas, a partir dos totais atuais.
+    """
+    return cenarios.assign(
+        devolucoes_simuladas=(devolucoes_atuais - cenarios['evitadas_p50']).clip(lower=0),
+        perda_simulada=(impacto_atual - cenarios['economia_p50']).clip(lower=0),
+    )